@@ -0,0 +1,86 @@
+import asyncio
+from collections import deque
+
+from astra_monitor_client.utils.transfer_frames import pack_frame
+
+# Классы приоритета исходящих сообщений (меньше - важнее)
+PRIORITY_CONTROL = 0      # подтверждения команд, ответы, служебные сообщения передач
+PRIORITY_INTERACTIVE = 1  # вывод терминала и выполняемых команд
+PRIORITY_METRICS = 2      # периодическая информация о системе
+PRIORITY_BULK = 3         # чанки файлов, архивы, скриншоты
+
+# Максимальный размер бинарного кадра передачи: между слайсами успевают уйти сообщения важнее
+BULK_SLICE_SIZE = 256 * 1024
+
+
+class SendScheduler:
+    """
+    Планировщик отправки вместо общего send_lock. Все сообщения пишет одна корутина,
+    каждый раз выбирая сообщение с наивысшим приоритетом; внутри класса порядок FIFO.
+    send() ждет фактической отправки сообщения, поэтому отправитель, как и раньше,
+    получает исключение при разрыве соединения и не обгоняет собственные сообщения.
+    """
+
+    def __init__(self, bulk_slice_size=BULK_SLICE_SIZE):
+        self.bulk_slice_size = bulk_slice_size
+        self.queues = [deque() for _ in range(PRIORITY_BULK + 1)]
+        self.wakeup = None
+        self.writer_task = None
+
+    async def send(self, websocket, message, priority=PRIORITY_CONTROL):
+        """Ставит сообщение в очередь своего класса и ждет его отправки."""
+        loop = asyncio.get_running_loop()
+        if self.writer_task is None or self.writer_task.done():
+            self.wakeup = asyncio.Event()
+            self.writer_task = loop.create_task(self._write_loop())
+        future = loop.create_future()
+        self.queues[priority].append((websocket, message, future))
+        self.wakeup.set()
+        await future
+
+    async def send_frame(self, websocket, transfer_id, offset, data):
+        """
+        Отправляет данные передачи бинарными кадрами не больше bulk_slice_size.
+        Кадры несут собственное смещение, поэтому получатель собирает их как обычные чанки.
+        """
+        data = memoryview(data)
+        for start in range(0, len(data), self.bulk_slice_size):
+            piece = data[start:start + self.bulk_slice_size]
+            await self.send(websocket, pack_frame(transfer_id, offset + start, piece), PRIORITY_BULK)
+
+    def queue_depth(self):
+        """Число ожидающих отправки сообщений по классам приоритета."""
+        return [len(queue) for queue in self.queues]
+
+    def _next_item(self):
+        for queue in self.queues:
+            while queue:
+                item = queue.popleft()
+                # Отправитель мог быть отменен, пока сообщение ждало очереди
+                if not item[2].done():
+                    return item
+        return None
+
+    async def _write_loop(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            websocket, message, future = item
+            try:
+                await websocket.send(message)
+            except asyncio.CancelledError:
+                # Планировщик останавливается вместе с клиентом - отпускаем всех ожидающих
+                future.cancel()
+                for queue in self.queues:
+                    while queue:
+                        queue.popleft()[2].cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(None)
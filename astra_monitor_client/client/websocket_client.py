@@ -10,15 +10,33 @@ import logging
 from datetime import datetime
 import uuid
 import random
+import hashlib
 
 from astra_monitor_client.utils.config import deobfuscate_config, OBFUSCATION_KEY
 from astra_monitor_client.utils.system_utils import SystemMonitor, get_local_ip
 from astra_monitor_client.handlers.command_handler import CommandHandler
+from astra_monitor_client.client.send_scheduler import (
+    SendScheduler, PRIORITY_CONTROL, PRIORITY_METRICS, PRIORITY_BULK
+)
+from astra_monitor_client.utils.transfer_frames import BINARY_FRAMES_CAPABILITY
+from astra_monitor_client.utils.tar_stream import DIR_STREAM_CAPABILITY, ZSTD_CAPABILITY, zstandard
+from astra_monitor_client.utils.delta_sync import DELTA_SYNC_CAPABILITY
+from astra_monitor_client.utils.ws_compression import SelectiveDeflateFactory
+from astra_monitor_client.utils.protocol import (
+    PROTOCOL_VERSION, SESSION_RESUME_CAPABILITY, INVENTORY_PUSH_CAPABILITY, encode_message, parse_retry_after
+)
+from astra_monitor_client.utils.inventory_diff import InventoryTracker
+
+# Команды, которые ждут внешних программ (X, dmidecode, apt): выполняются отдельной задачей,
+# чтобы не задерживать метрики, прием и подтверждение следующих команд
+BACKGROUND_COMMANDS = frozenset({
+    "screenshot", "screenshot_quality", "get_full_system_info", "show_message", "apt:list_upgradable"
+})
 
 class SystemMonitorClient:
     def __init__(self, version="0.0.0-dev"):
         self.CLIENT_VERSION = version
-        self.PROTOCOL_VERSION = 1
+        self.PROTOCOL_VERSION = PROTOCOL_VERSION
         self.CONFIG_DIR = "/etc/astra-monitor-client"
         self.CONFIG_FILE = os.path.join(self.CONFIG_DIR, "config.json")
         
@@ -77,17 +95,21 @@ class SystemMonitorClient:
         self.reconnect_base_delay = self.settings.get("reconnect_delay", 5)
         self.reconnect_max_delay = self.settings.get("reconnect_max_delay", 60)
         self.reconnect_jitter = self.settings.get("reconnect_jitter", 0.2)
+        # Как часто проверять инвентаризацию на изменения (отправляется только разность)
+        self.inventory_interval = self.settings.get("inventory_interval", 60)
 
         self.hostname = platform.node()
         self.local_ip = get_local_ip()
         self.cwd = os.path.expanduser("~")
         if not os.path.isdir(self.cwd):
             self.cwd = "/"
-        self.upload_context = {}
+        self.upload_context = {} # Загрузка по прежнему base64-протоколу (бинарные передачи ведет FileTransferHandler)
         self.last_net_rx, self.last_net_tx = SystemMonitor.get_network_io()
         self.last_net_ts = time.time()
-        self.send_lock = asyncio.Lock()
+        self.sender = SendScheduler() # Единая очередь отправки с приоритетами
         self.command_handler = CommandHandler(self)
+        self.session_token = None # токен продолжения сессии, выданный сервером при последней аутентификации
+        self.inventory = InventoryTracker() # последняя инвентаризация, известная серверу
         self.is_running = False
 
     def stop(self):
@@ -164,6 +186,7 @@ class SystemMonitorClient:
             self.last_net_ts = current_ts
             
             return {
+                "type": "system_info",
                 "version": self.CLIENT_VERSION,
                 "hostname": self.hostname,
                 "cpu_percent": round(cpu_percent, 1),
@@ -185,16 +208,25 @@ class SystemMonitorClient:
     async def send_screenshot(self, websocket):
         """Отправка скриншота на сервер"""
         try:
-            screenshot_data = await self.command_handler.take_screenshot()
+            screenshot_data = await self.command_handler.screenshot_handler.take_screenshot()
             if "screenshot" in screenshot_data:
-                async with self.send_lock:
-                    await websocket.send(json.dumps({
-                        "screenshot_update": screenshot_data,
-                        "timestamp": datetime.now().isoformat()
-                    }))
+                await self.sender.send(websocket, encode_message({
+                    "screenshot_update": screenshot_data,
+                    "timestamp": datetime.now().isoformat()
+                }), PRIORITY_BULK)
         except Exception as e:
             logging.error("❌ Ошибка отправки скриншота: %s", e)
 
+    async def push_inventory(self, websocket):
+        """Отправляет серверу изменения инвентаризации с прошлой отправки, если они есть."""
+        try:
+            delta = await self.inventory.delta()
+            if delta is not None:
+                logging.info("📦 Инвентаризация изменилась: %s", ", ".join(delta["patch"]) or "-")
+                await self.sender.send(websocket, encode_message({"inventory_delta": delta}), PRIORITY_METRICS)
+        except Exception as e:
+            logging.error("❌ Ошибка отправки изменений инвентаризации: %s", e)
+
     async def connect_to_server(self):
         server_uri = f"ws://{self.SERVER_HOST}:{self.SERVER_PORT}"
         
@@ -206,41 +238,58 @@ class SystemMonitorClient:
             last_screenshot_time = 0
             screenshot_task = None
             last_info_sent_time = 0
+            last_inventory_time = 0
+            inventory_task = None
+            retry_after = None
             try:
                 async with websockets.connect(
                     server_uri,
                     max_size=100 * 1024 * 1024,
+                    # Сжимаются только крупные текстовые сообщения; скриншоты и бинарные кадры идут как есть
+                    extensions=[SelectiveDeflateFactory()],
                     ping_interval=30,
                     ping_timeout=60
                 ) as websocket:
+                    capabilities = [
+                        "command_ack",
+                        "file_chunked",
+                        "screenshots",
+                        BINARY_FRAMES_CAPABILITY,
+                        DIR_STREAM_CAPABILITY,
+                        DELTA_SYNC_CAPABILITY,
+                        SESSION_RESUME_CAPABILITY,
+                        INVENTORY_PUSH_CAPABILITY
+                    ]
+                    if zstandard is not None:
+                        capabilities.append(ZSTD_CAPABILITY)
+                    client_info = {
+                        "hostname": self.hostname,
+                        "os_type": platform.system(),
+                        "platform_full": platform.platform(),
+                    }
+                    # С токеном сессии настройки не пересылаются: сервер сверит хэш и запросит их, если он другой
+                    if not self.session_token:
+                        client_info["settings"] = self.shareable_settings()
                     auth_data = json.dumps({
+                        "type": "auth",
                         "auth_token": self.AUTH_TOKEN,
                         "client_id": self.client_id,
                         "protocol_version": self.PROTOCOL_VERSION,
-                        "capabilities": [
-                            "command_ack",
-                            "file_chunked",
-                            "screenshots"
-                        ],
-                        "client_info": {
-                            "hostname": self.hostname,
-                            "os_type": platform.system(),
-                            "platform_full": platform.platform(),
-                            "settings": {k: v for k, v in self.settings.items() if k != "client_id"}
-
-                        }
+                        "capabilities": capabilities,
+                        "resume_token": self.session_token,
+                        "settings_hash": self.settings_hash(),
+                        "inventory_version": self.inventory.version,
+                        "client_info": client_info
                     })
-                    async with self.send_lock:
-                        await websocket.send(auth_data)
+                    await self.sender.send(websocket, auth_data, PRIORITY_CONTROL)
                     logging.info("✅ Аутентификация успешна")
-                    reconnect_delay = self.reconnect_base_delay
+                    admitted = False
                     
                     while self.is_running:
                         current_time = time.time()
                         if current_time - last_info_sent_time >= self.REFRESH_INTERVAL:
                             system_info = self.get_system_info()
-                            async with self.send_lock:
-                                await websocket.send(json.dumps(system_info))
+                            await self.sender.send(websocket, encode_message(system_info), PRIORITY_METRICS)
                             last_info_sent_time = current_time
                         
                         if (self.settings["screenshot"]["enabled"] and 
@@ -249,49 +298,124 @@ class SystemMonitorClient:
                             if screenshot_task is None or screenshot_task.done():
                                 screenshot_task = asyncio.create_task(self.send_screenshot(websocket))
                                 last_screenshot_time = current_time
+
+                        if current_time - last_inventory_time >= self.inventory_interval:
+                            if inventory_task is None or inventory_task.done():
+                                inventory_task = asyncio.create_task(self.push_inventory(websocket))
+                                last_inventory_time = current_time
                         
                         try:
                             command = await asyncio.wait_for(websocket.recv(), timeout=1.0)
+                            if not admitted:
+                                # Сервер прислал первое сообщение - подключение принято, сбрасываем backoff
+                                admitted = True
+                                reconnect_delay = self.reconnect_base_delay
+                            if isinstance(command, bytes):
+                                # Бинарный кадр - чанк загружаемого файла
+                                response = await self.command_handler.handle_binary_frame(websocket, command)
+                                if response is not None:
+                                    await self.sender.send(websocket, encode_message(response), PRIORITY_CONTROL)
+                                continue
                             command_data = json.loads(command)
+
+                            if command_data.get("type") == "session":
+                                await self._handle_session(websocket, command_data)
+                                continue
                             
                             if "command" in command_data:
                                 command_id = command_data.get("command_id")
                                 if command_id:
-                                    async with self.send_lock:
-                                        await websocket.send(json.dumps({
-                                            "command_ack": command_id,
-                                            "timestamp": datetime.now().isoformat()
-                                        }))
-                                response = await self.command_handler.handle_command(websocket, command_data["command"])
-                                if response is not None:
-                                    if command_id:
-                                        response["command_id"] = command_id
-                                    async with self.send_lock:
-                                        await websocket.send(json.dumps(response))
+                                    await self.sender.send(websocket, encode_message({
+                                        "command_ack": command_id,
+                                        "timestamp": datetime.now().isoformat()
+                                    }), PRIORITY_CONTROL)
+                                command = command_data["command"]
+                                if command in BACKGROUND_COMMANDS or command.split(":", 1)[0] in BACKGROUND_COMMANDS:
+                                    asyncio.create_task(self._run_command(websocket, command, command_id))
+                                else:
+                                    await self._run_command(websocket, command, command_id)
                                     
                         except asyncio.TimeoutError:
                             continue
-                        except websockets.exceptions.ConnectionClosed:
+                        except websockets.exceptions.ConnectionClosed as e:
+                            retry_after = self._close_retry_after(e)
                             break # Exit inner loop on connection close
-                            
-            except websockets.exceptions.ConnectionClosed:
-                delay = max(1, int(reconnect_delay))
-                logging.warning("🔌 Соединение разорвано, повторная попытка через %d секунд...", delay)
+
+                if not self.is_running:
+                    break
+                # Сервер закрыл соединение штатно (в том числе отказом с retry_after)
+                delay, reconnect_delay = self._reconnect_pause(reconnect_delay, retry_after)
+                if retry_after is not None:
+                    logging.warning("⏳ Сервер перегружен, повторное подключение через %.1f секунд...", delay)
+                else:
+                    logging.warning("🔌 Соединение закрыто сервером, повторная попытка через %.1f секунд...", delay)
+                await self.command_handler.cleanup_interactive_session()
+                await asyncio.sleep(delay)
+            except websockets.exceptions.ConnectionClosed as e:
+                delay, reconnect_delay = self._reconnect_pause(reconnect_delay, self._close_retry_after(e))
+                logging.warning("🔌 Соединение разорвано, повторная попытка через %.1f секунд...", delay)
                 logging.info("-> 🧹 Соединение разорвано, запускается очистка интерактивной сессии...")
                 await self.command_handler.cleanup_interactive_session()
                 await asyncio.sleep(delay)
             except ConnectionRefusedError:
-                delay = max(1, int(reconnect_delay))
-                logging.error("❌ Сервер недоступен, повторная попытка через %d секунд...", delay)
+                delay, reconnect_delay = self._reconnect_pause(reconnect_delay)
+                logging.error("❌ Сервер недоступен, повторная попытка через %.1f секунд...", delay)
                 logging.info("-> 🧹 Соединение недоступно, запускается очистка интерактивной сессии...")
                 await self.command_handler.cleanup_interactive_session()
                 await asyncio.sleep(delay)
             except Exception:
-                delay = max(1, int(reconnect_delay))
-                logging.exception("🔌 Непредвиденная ошибка подключения, повтор через %d секунд...", delay)
+                delay, reconnect_delay = self._reconnect_pause(reconnect_delay)
+                logging.exception("🔌 Непредвиденная ошибка подключения, повтор через %.1f секунд...", delay)
                 logging.info("-> 🧹 Непредвиденная ошибка, запускается очистка интерактивной сессии...")
                 await self.command_handler.cleanup_interactive_session()
                 await asyncio.sleep(delay)
+
+    def shareable_settings(self):
+        """Настройки, которые видит сервер (client_id передается отдельно)."""
+        return {k: v for k, v in self.settings.items() if k != "client_id"}
+
+    def settings_hash(self):
+        payload = json.dumps(self.shareable_settings(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def _run_command(self, websocket, command, command_id):
+        response = await self.command_handler.handle_command(websocket, command, command_id)
+        if response is None:
+            return
+        if command_id:
+            response["command_id"] = command_id
+        try:
+            await self.sender.send(websocket, encode_message(response), PRIORITY_CONTROL)
+        except websockets.exceptions.ConnectionClosed:
+            logging.warning("🔌 Ответ на команду не отправлен: соединение закрыто")
+
+    async def _handle_session(self, websocket, data):
+        """Сервер выдал токен продолжения сессии; при расхождении хэша - отправляем настройки."""
+        self.session_token = data.get("session_token")
+        if data.get("resumed"):
+            logging.info("🔁 Сессия продолжена без повторной передачи данных клиента")
+        if data.get("settings_required"):
+            await self.sender.send(websocket, encode_message({"client_settings": self.shareable_settings()}), PRIORITY_CONTROL)
+
+    @staticmethod
+    def _close_retry_after(error):
+        """retry_after из кадра закрытия сервера или None."""
+        rcvd = getattr(error, "rcvd", None)
+        if rcvd is None:
+            return None
+        return parse_retry_after(rcvd.code, rcvd.reason)
+
+    def _reconnect_pause(self, reconnect_delay, retry_after=None):
+        """
+        Пауза перед переподключением и следующая задержка backoff.
+        Если сервер указал retry_after, клиент ждет не меньше него плюс случайную добавку
+        reconnect_jitter, backoff при этом не растет. Иначе задержка удваивается до
+        reconnect_max_delay, а пауза случайно отклоняется на ±reconnect_jitter.
+        """
+        if retry_after is not None:
+            return max(1.0, retry_after * (1 + random.uniform(0, self.reconnect_jitter))), reconnect_delay
+        pause = max(1.0, reconnect_delay * (1 + random.uniform(-self.reconnect_jitter, self.reconnect_jitter)))
+        return pause, min(reconnect_delay * 2, self.reconnect_max_delay)
     
     def run(self):
         """Запуск клиента"""
@@ -10,17 +10,24 @@ import sys
 import hashlib
 from datetime import datetime
 
-from astra_monitor_client.utils.system_utils import get_full_system_info, get_active_graphical_session, get_active_graphical_sessions, build_dbus_env
+from astra_monitor_client.utils.protocol import encode_message
+from astra_monitor_client.client.send_scheduler import PRIORITY_CONTROL, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from astra_monitor_client.utils.process_runner import run_process
+from astra_monitor_client.utils.system_utils import get_active_graphical_session, get_active_graphical_sessions, build_dbus_env
 from astra_monitor_client.handlers.interactive_shell import InteractiveShell
 from astra_monitor_client.handlers.screenshot import ScreenshotHandler
+from astra_monitor_client.handlers.file_transfer import FileTransferHandler
+from astra_monitor_client.handlers.job_manager import JobManager
 
 class CommandHandler:
     def __init__(self, client):
         self.client = client
         self.interactive_shell = InteractiveShell(client)
         self.screenshot_handler = ScreenshotHandler(client)
+        self.file_transfer = FileTransferHandler(client)
+        self.jobs = JobManager(client)
 
-    async def handle_command(self, websocket, command):
+    async def handle_command(self, websocket, command, command_id=None):
         """Обработка команд от сервера"""
         try:
             if command == "refresh":
@@ -67,8 +74,9 @@ class CommandHandler:
                 return {"screenshot_settings_updated": self.client.screenshot_settings}
 
             elif command == "get_full_system_info":
-                full_info = get_full_system_info()
-                return {"full_system_info": full_info}
+                # Полный снимок становится новой базой для последующих inventory_delta
+                full_info, version = await self.client.inventory.snapshot()
+                return {"full_system_info": full_info, "inventory_version": version}
 
             elif command == "get_screenshot_settings":
                 return {"screenshot_settings": self.client.screenshot_settings}
@@ -232,12 +240,14 @@ class CommandHandler:
                     return None
 
                 elif apt_cmd == "list_upgradable":
-                    proc = await asyncio.create_subprocess_shell("apt list --upgradable", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-                    stdout, stderr = await proc.communicate()
+                    try:
+                        proc = await run_process(["apt", "list", "--upgradable"], text=True, timeout=120)
+                    except subprocess.TimeoutExpired:
+                        return {"apt_command_result": "❌ Ошибка: apt list не ответил за 120 секунд"}
                     if proc.returncode != 0:
-                        return {"apt_command_result": f"❌ Ошибка: {stderr.decode()}"}
+                        return {"apt_command_result": f"❌ Ошибка: {proc.stderr}"}
                     
-                    output = stdout.decode()
+                    output = proc.stdout
                     packages = []
                     lines = output.strip().split('\n')
                     
@@ -268,6 +278,12 @@ class CommandHandler:
                     asyncio.create_task(self.stream_command_output(websocket, "sudo apt update && sudo apt-get dist-upgrade"))
                     return None
 
+            elif command.startswith("transfer:"):
+                parts = command.split(":", 2)
+                action = parts[1]
+                payload = parts[2] if len(parts) > 2 else ""
+                return await self.file_transfer.handle(websocket, action, payload)
+
             elif command.startswith("interactive:"):
                 parts = command.split(":", 2)
                 action = parts[1]
@@ -310,8 +326,7 @@ rm -- \"$0\"
                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
                                     stdin=subprocess.DEVNULL, start_new_session=True)
 
-                    async with self.client.send_lock:
-                        await websocket.send(json.dumps({"install_result": "🚀 Процесс обновления запущен. Клиент перезапускается..."}))
+                    await self.client.sender.send(websocket, encode_message({"install_result": "🚀 Процесс обновления запущен. Клиент перезапускается..."}), PRIORITY_CONTROL)
                     await asyncio.sleep(1)
                     sys.exit(0)
                 except Exception as e:
@@ -329,8 +344,7 @@ rm -- \"$0\"
 
             elif command == "get_settings":
                 logging.info("-> ⚙️ Выполнение: отправка текущих настроек.")
-                settings = {k: v for k, v in self.client.settings.items() if k != "client_id"}
-                return {"client_settings": settings}
+                return {"client_settings": self.client.shareable_settings()}
 
             elif command == "shutdown":
                 logging.warning("-> 🔌 Выполнение: ВЫКЛЮЧЕНИЕ СИСТЕМЫ.")
@@ -366,25 +380,16 @@ rm -- \"$0\"
                     else:
                         return {"command_error": f"❌ cd: no such file or directory: {path}"}
                 
-                try:
-                    # Capture output as bytes
-                    proc = subprocess.run(cmd, shell=True, capture_output=True, cwd=self.client.cwd, timeout=30)
-                    
-                    def decode_output(output_bytes):
-                        return output_bytes.decode('utf-8', errors='replace')
+                # Вывод придет job_output, итог - job_result с тем же command_id
+                await self.client.sender.send(websocket, encode_message(
+                    self.jobs.start(websocket, cmd, self.client.cwd, command_id)), PRIORITY_INTERACTIVE)
+                return None
 
-                    stdout = decode_output(proc.stdout)
-                    stderr = decode_output(proc.stderr)
-                    
-                    if proc.returncode != 0:
-                        return {"command_error": stdout + stderr}
-                    else:
-                        return {"command_result": stdout}
+            elif command.startswith("cancel_job:"):
+                return await self.jobs.cancel(command.split(":", 1)[1].strip())
 
-                except subprocess.TimeoutExpired:
-                    return {"command_error": "⌛ Timeout expired"}
-                except Exception as e:
-                    return {"command_error": str(e)}
+            elif command == "list_jobs":
+                return self.jobs.list_jobs()
 
             elif command.startswith("show_message:"):
                 message = command.split(":", 1)[1]
@@ -398,8 +403,18 @@ rm -- \"$0\"
             logging.exception("❌ Ошибка при выполнении команды '%s'", command.split(':', 1)[0])
             return {"error": f"❌ Command execution failed: {str(e)}"}
 
+    async def handle_binary_frame(self, websocket, frame):
+        """Обработка бинарного кадра передачи файла от сервера."""
+        try:
+            return self.file_transfer.handle_frame(frame)
+        except Exception as e:
+            logging.exception("❌ Ошибка обработки бинарного кадра")
+            return {"file_upload_result": "error", "error": f"❌ Invalid binary frame: {str(e)}"}
+
     async def cleanup_interactive_session(self, websocket=None):
         await self.interactive_shell.cleanup(websocket)
+        # Вывод заданий некуда отправлять - соединение, для которого они запущены, закрыто
+        await self.jobs.cancel_all()
 
     async def list_files(self, path):
         """Список файлов в директории"""
@@ -459,16 +474,14 @@ rm -- \"$0\"
         """Отправка файла на сервер по частям."""
         try:
             if not os.path.exists(file_path) or os.path.isdir(file_path):
-                async with self.client.send_lock:
-                    await websocket.send(json.dumps({"error": f"❌ Файл не найден или является директорией: {file_path}"}))
+                await self.client.sender.send(websocket, encode_message({"error": f"❌ Файл не найден или является директорией: {file_path}"}), PRIORITY_CONTROL)
                 return
 
             file_size = os.path.getsize(file_path)
             filename = os.path.basename(file_path)
 
             start_payload = {"download_file_start": {"filename": filename, "filesize": file_size, "path": file_path}}
-            async with self.client.send_lock:
-                await websocket.send(json.dumps(start_payload))
+            await self.client.sender.send(websocket, encode_message(start_payload), PRIORITY_CONTROL)
 
             CHUNK_SIZE = chunk_size
             loop = asyncio.get_running_loop()
@@ -485,19 +498,16 @@ rm -- \"$0\"
                     chunk_payload = {
                         "download_file_chunk": {"data": chunk_b64_bytes.decode('ascii'), "path": file_path}
                     }
-                    json_payload = await loop.run_in_executor(None, json.dumps, chunk_payload)
+                    json_payload = await loop.run_in_executor(None, encode_message, chunk_payload)
 
-                    async with self.client.send_lock:
-                        await websocket.send(json_payload)
+                    await self.client.sender.send(websocket, json_payload, PRIORITY_BULK)
 
-            async with self.client.send_lock:
-                await websocket.send(json.dumps({"download_file_end": {"path": file_path}}))
+            await self.client.sender.send(websocket, encode_message({"download_file_end": {"path": file_path}}), PRIORITY_CONTROL)
 
         except Exception as e:
             logging.error("❌ Ошибка при отправке файла '%s': %s", file_path, e, exc_info=True)
             try:
-                async with self.client.send_lock:
-                    await websocket.send(json.dumps({"error": f"❌ Ошибка при отправке файла: {e}"}))
+                await self.client.sender.send(websocket, encode_message({"error": f"❌ Ошибка при отправке файла: {e}"}), PRIORITY_CONTROL)
             except:
                 pass
 
@@ -515,8 +525,7 @@ rm -- \"$0\"
                     line = await pipe.readline()
                     if not line:
                         break
-                    async with self.client.send_lock:
-                        await websocket.send(json.dumps({message_key: line.decode('utf-8', errors='replace')}))
+                    await self.client.sender.send(websocket, encode_message({message_key: line.decode('utf-8', errors='replace')}), PRIORITY_INTERACTIVE)
 
             await asyncio.gather(
                 stream_pipe(process.stdout),
@@ -524,11 +533,9 @@ rm -- \"$0\"
             )
 
             await process.wait()
-            async with self.client.send_lock:
-                await websocket.send(json.dumps({result_key: f"✅ Команда завершена с кодом: {process.returncode}", "original_command": command}))
+            await self.client.sender.send(websocket, encode_message({result_key: f"✅ Команда завершена с кодом: {process.returncode}", "original_command": command}), PRIORITY_CONTROL)
         except Exception as e:
-            async with self.client.send_lock:
-                await websocket.send(json.dumps({result_key: f"❌ Критическая ошибка выполнения команды: {e}", "original_command": command}))
+            await self.client.sender.send(websocket, encode_message({result_key: f"❌ Критическая ошибка выполнения команды: {e}", "original_command": command}), PRIORITY_CONTROL)
 
     async def apply_settings(self, settings):
         """Применение настроек"""
@@ -566,16 +573,11 @@ rm -- \"$0\"
             return {"settings_applied": "error", "error": f"❌ {str(e)}"}
 
     async def show_message(self, message):
-        def run_as_user(user, display, uid, cmd, timeout=15, capture_output=True):
+        async def run_as_user(user, display, uid, cmd, timeout=15, capture_output=True):
             full_cmd = ['runuser', '-u', user, '--'] + cmd
             env = build_dbus_env(user, display, uid)
             try:
-                return subprocess.run(
-                    full_cmd,
-                    env=env,
-                    timeout=timeout,
-                    capture_output=capture_output
-                )
+                return await run_process(full_cmd, env=env, timeout=timeout, capture_output=capture_output)
             except Exception as e:
                 logging.error("Ошибка runuser: %s", e)
                 return None
@@ -585,12 +587,12 @@ rm -- \"$0\"
 
         try:
             try:
-                subprocess.run(["xhost", "+SI:localuser:root"], timeout=5, capture_output=False)
-                subprocess.run(["xhost", "+SI:localuser:*"], timeout=5, capture_output=False)
+                await run_process(["xhost", "+SI:localuser:root"], timeout=5, capture_output=False)
+                await run_process(["xhost", "+SI:localuser:*"], timeout=5, capture_output=False)
             except Exception:
                 pass
 
-            sessions = get_active_graphical_sessions()
+            sessions = await get_active_graphical_sessions()
             if not sessions:
                 return {"error": "❌ Не найдено активных графических сессий"}
 
@@ -605,7 +607,7 @@ rm -- \"$0\"
             failed = 0
             delivered = 0
             for user, display, uid in sessions:
-                result = run_as_user(user, display, uid, notify_cmd, timeout=10, capture_output=True)
+                result = await run_as_user(user, display, uid, notify_cmd, timeout=10, capture_output=True)
                 if result and result.returncode == 0:
                     delivered += 1
                     continue
@@ -620,7 +622,7 @@ rm -- \"$0\"
                         '--width=400',
                         '--timeout=10'
                     ]
-                    result = run_as_user(user, display, uid, zenity_cmd, timeout=15, capture_output=True)
+                    result = await run_as_user(user, display, uid, zenity_cmd, timeout=15, capture_output=True)
                     if result and result.returncode == 0:
                         delivered += 1
                         continue
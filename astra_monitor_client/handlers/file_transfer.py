@@ -0,0 +1,419 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import websockets
+
+from astra_monitor_client.utils.protocol import encode_message
+from astra_monitor_client.client.send_scheduler import PRIORITY_CONTROL
+from astra_monitor_client.utils.transfer_frames import unpack_frame
+from astra_monitor_client.utils.delta_sync import file_signature
+from astra_monitor_client.utils.tar_stream import ARCHIVE_EXTENSIONS, ChunkQueueWriter, resolve_compression, write_tar_stream
+
+
+# Незавершенная загрузка, которую сервер не продолжил за это время, удаляется
+UPLOAD_IDLE_TIMEOUT = 3600
+# Сколько последних успешно завершенных загрузок помнить: ответ на upload_end мог потеряться при обрыве
+COMPLETED_UPLOADS_KEPT = 64
+
+
+class FileTransferHandler:
+    """
+    Менеджер передач файлов бинарными кадрами (transfer_id + смещение + сырые байты).
+    Каждая передача имеет собственный контекст, поэтому загрузки и скачивания идут параллельно.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.uploads = {} # transfer_id -> контекст принимаемого файла
+        self.completed_uploads = OrderedDict() # transfer_id -> размер успешно принятого файла
+        self.download_tasks = {} # transfer_id -> задача отправки файла
+
+    async def handle(self, websocket, action, payload):
+        params = json.loads(payload) if payload else {}
+        if action == "upload_start":
+            return self._upload_start(params)
+        if action == "upload_end":
+            return await self._upload_end(params)
+        if action == "upload_cancel":
+            return self._upload_cancel(params)
+        if action == "upload_resume":
+            return self._upload_resume(params)
+        if action == "upload_signature":
+            asyncio.create_task(self._send_signature(websocket, params))
+            return None
+        if action == "upload_delta_start":
+            return self._upload_delta_start(params)
+        if action == "upload_copy":
+            return await self._upload_copy(params)
+        if action == "download_start":
+            return self._download_start(websocket, params)
+        if action == "download_dir_stream":
+            return self._download_dir_stream(websocket, params)
+        if action == "download_cancel":
+            return self._download_cancel(params)
+        return {"error": f"❓ Unknown transfer action: {action}"}
+
+    def _upload_start(self, params):
+        transfer_id = params["transfer_id"]
+        save_path = params["path"]
+        expected_size = int(params["size"])
+        self._expire_stale_uploads()
+        previous = self.uploads.pop(transfer_id, None)
+        if previous and not previous['handle'].closed:
+            # Сервер начал передачу заново (клиент не смог подтвердить смещение)
+            previous['handle'].close()
+        try:
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            file_handle = open(save_path, 'wb')
+            self.uploads[transfer_id] = {
+                'transfer_id': transfer_id,
+                'handle': file_handle,
+                'path': save_path,
+                'original_path': save_path,
+                'expected_size': expected_size,
+                'received_size': 0,
+                'hasher': hashlib.sha256(),
+                'updated_at': time.monotonic()
+            }
+            logging.info("-> 📤 Выполнение: начало приема файла '%s' (размер: %d, бинарный режим).", save_path, expected_size)
+            # Сервер начинает отправку кадров только после этого ответа
+            return {"file_upload_result": "started", "transfer_id": transfer_id}
+        except Exception as e:
+            return {"file_upload_result": "error", "transfer_id": transfer_id, "error": f"❌ Failed to start upload: {str(e)}"}
+
+    def _expire_stale_uploads(self):
+        now = time.monotonic()
+        for context in list(self.uploads.values()):
+            if now - context['updated_at'] > UPLOAD_IDLE_TIMEOUT:
+                logging.warning("-> ⌛ Прием файла '%s' не продолжен сервером, частичный файл удаляется.", context['path'])
+                self._discard_upload(context)
+
+    def handle_frame(self, frame):
+        """Запись бинарного кадра в соответствующую загрузку. Возвращает ответ для сервера при ошибке."""
+        transfer_id, offset, data = unpack_frame(frame)
+        context = self.uploads.get(transfer_id)
+        if not context:
+            return {"file_upload_result": "error", "transfer_id": transfer_id, "error": "❌ Upload not initiated"}
+        if context.get('delta'):
+            # В режиме разности кадры содержат только измененные участки и пишутся по своему смещению
+            try:
+                context['handle'].seek(offset)
+                context['handle'].write(data)
+                context['received_size'] += len(data)
+                context['updated_at'] = time.monotonic()
+                return None
+            except Exception as e:
+                self._discard_upload(context)
+                return {"file_upload_result": "error", "transfer_id": transfer_id, "error": f"❌ Error writing chunk: {str(e)}"}
+        if offset != context['received_size']:
+            self._discard_upload(context)
+            return {"file_upload_result": "error", "transfer_id": transfer_id,
+                    "error": f"❌ Unexpected chunk offset {offset}, expected {context['received_size']}"}
+        try:
+            context['handle'].write(data)
+            context['hasher'].update(data)
+            context['received_size'] += len(data)
+            context['updated_at'] = time.monotonic()
+            return None
+        except Exception as e:
+            self._discard_upload(context)
+            return {"file_upload_result": "error", "transfer_id": transfer_id, "error": f"❌ Error writing chunk: {str(e)}"}
+
+    async def _upload_end(self, params):
+        transfer_id = params.get("transfer_id")
+        context = self.uploads.pop(transfer_id, None)
+        if not context:
+            if transfer_id in self.completed_uploads:
+                # Повтор после переподключения: файл уже принят, прежний ответ не дошел до сервера
+                return {"file_upload_result": "success", "transfer_id": transfer_id}
+            return {"file_upload_result": "error", "transfer_id": transfer_id, "error": "❌ Upload not initiated"}
+        logging.info("-> ✅ Выполнение: завершение приема файла '%s'.", context['original_path'])
+
+        context['handle'].close()
+        expected_size = context['expected_size']
+        expected_hash = params.get("sha256")
+        if context.get('delta'):
+            context['base_handle'].close()
+            # Файл собран из блоков в произвольном порядке - хэш и размер считаются по результату
+            loop = asyncio.get_running_loop()
+            final_size = os.path.getsize(context['path'])
+            actual_hash = await loop.run_in_executor(None, self._file_sha256, context['path'])
+        else:
+            final_size = context['received_size']
+            actual_hash = context['hasher'].hexdigest()
+
+        if final_size != expected_size:
+            self._remove_file(context['path'])
+            return {"file_upload_result": "error", "transfer_id": transfer_id,
+                    "error": f"❌ File size mismatch. Expected {expected_size}, got {final_size}"}
+        if expected_hash and expected_hash != actual_hash:
+            self._remove_file(context['path'])
+            return {"file_upload_result": "error", "transfer_id": transfer_id, "error": "❌ File hash mismatch after upload"}
+        if context['path'] != context['original_path']:
+            os.replace(context['path'], context['original_path'])
+        self.completed_uploads[transfer_id] = final_size
+        while len(self.completed_uploads) > COMPLETED_UPLOADS_KEPT:
+            self.completed_uploads.popitem(last=False)
+        return {"file_upload_result": "success", "transfer_id": transfer_id}
+
+    @staticmethod
+    def _file_sha256(path):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while block := f.read(4 * 1024 * 1024):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    async def _send_signature(self, websocket, params):
+        """Отправляет серверу контрольные суммы блоков существующего файла для загрузки разностью."""
+        transfer_id = params.get("transfer_id")
+        block_size = int(params["block_size"])
+        loop = asyncio.get_running_loop()
+        blocks = await loop.run_in_executor(None, file_signature, params["path"], block_size)
+        reply = {"transfer_signature": {"transfer_id": transfer_id, "block_size": block_size, "blocks": blocks}}
+        try:
+            await self.client.sender.send(websocket, encode_message(reply), PRIORITY_CONTROL)
+        except websockets.exceptions.ConnectionClosed:
+            logging.warning("-> 🔌 Соединение потеряно до отправки сигнатуры '%s'.", params["path"])
+
+    def _upload_delta_start(self, params):
+        """
+        Начало загрузки разностью: результат собирается во временном файле рядом с целевым
+        из блоков старой версии (upload_copy) и новых данных (бинарные кадры), затем
+        после проверки SHA-256 атомарно заменяет целевой файл.
+        """
+        transfer_id = params["transfer_id"]
+        target_path = params["path"]
+        temp_path = f"{target_path}.astra-delta"
+        try:
+            base_handle = open(target_path, 'rb')
+            file_handle = open(temp_path, 'wb')
+            file_handle.truncate(int(params["size"]))
+        except Exception as e:
+            return {"file_upload_result": "error", "transfer_id": transfer_id, "error": f"❌ Failed to start delta upload: {str(e)}"}
+        self.uploads[transfer_id] = {
+            'transfer_id': transfer_id,
+            'delta': True,
+            'handle': file_handle,
+            'base_handle': base_handle,
+            'block_size': int(params["block_size"]),
+            'path': temp_path,
+            'original_path': target_path,
+            'expected_size': int(params["size"]),
+            'received_size': 0,
+            'updated_at': time.monotonic()
+        }
+        logging.info("-> 📤 Выполнение: начало приема файла '%s' разностью.", target_path)
+        return {"file_upload_result": "started", "transfer_id": transfer_id}
+
+    async def _upload_copy(self, params):
+        """Копирует блоки старой версии файла на их новые места: ops = [[смещение, блок, количество], ...]."""
+        transfer_id = params.get("transfer_id")
+        context = self.uploads.get(transfer_id)
+        if not context or not context.get('delta'):
+            return {"file_upload_result": "error", "transfer_id": transfer_id, "error": "❌ Upload not initiated"}
+
+        def copy_blocks():
+            block_size = context['block_size']
+            for target_offset, block_index, count in params["ops"]:
+                context['base_handle'].seek(block_index * block_size)
+                context['handle'].seek(target_offset)
+                remaining = count * block_size
+                while remaining > 0:
+                    data = context['base_handle'].read(min(remaining, 4 * 1024 * 1024))
+                    if not data:
+                        break
+                    context['handle'].write(data)
+                    remaining -= len(data)
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, copy_blocks)
+            context['updated_at'] = time.monotonic()
+            return None
+        except Exception as e:
+            self._discard_upload(context)
+            return {"file_upload_result": "error", "transfer_id": transfer_id, "error": f"❌ Error copying blocks: {str(e)}"}
+
+    def _upload_resume(self, params):
+        """
+        Сообщает серверу, сколько байт загрузки уже принято. Частичный файл и хэш
+        сохраняются между переподключениями, поэтому сервер продолжит с этого смещения.
+        offset None - передачу нужно начать заново, completed - файл уже принят целиком.
+        """
+        transfer_id = params.get("transfer_id")
+        if transfer_id in self.completed_uploads:
+            logging.info("-> ✅ Прием '%s' уже завершен, повтор не нужен.", transfer_id)
+            return {"transfer_offset": {"transfer_id": transfer_id, "offset": self.completed_uploads[transfer_id], "completed": True}}
+        context = self.uploads.get(transfer_id)
+        offset = None
+        if context and context.get('delta'):
+            # Разность пишется не по порядку: принятый объем не является смещением продолжения
+            logging.info("-> 🔁 Прием файла '%s' разностью прерван, сервер начнет передачу заново.", context['original_path'])
+            self._discard_upload(context)
+        elif context:
+            offset = context['received_size']
+            context['updated_at'] = time.monotonic()
+            logging.info("-> 🔁 Продолжение приема файла '%s' со смещения %d.", context['path'], offset)
+        return {"transfer_offset": {"transfer_id": transfer_id, "offset": offset}}
+
+    def _upload_cancel(self, params):
+        context = self.uploads.get(params.get("transfer_id"))
+        if context:
+            logging.info("-> ⏹️ Получен запрос на отмену приема файла '%s'.", context['path'])
+            self._discard_upload(context)
+        else:
+            logging.warning("-> ⚠️ Запрос на отмену приема '%s', но загрузка не активна.", params.get("transfer_id"))
+        return None
+
+    def _discard_upload(self, context):
+        for key in ('handle', 'base_handle'):
+            try:
+                if key in context:
+                    context[key].close()
+            except Exception:
+                pass
+        self._remove_file(context['path'])
+        if self.uploads.get(context['transfer_id']) is context:
+            del self.uploads[context['transfer_id']]
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+            logging.info("-> 🗑️ Частично полученный файл '%s' удален.", path)
+        except OSError as e:
+            logging.error("❌ Не удалось удалить частично полученный файл '%s': %s", path, e)
+
+    def _download_start(self, websocket, params):
+        transfer_id = params["transfer_id"]
+        chunk_size = int(params.get("chunk_size") or 4 * 1024 * 1024)
+        offset = int(params.get("offset") or 0)
+        # При возобновлении после переподключения прежняя задача могла еще не завершиться
+        previous = self.download_tasks.get(transfer_id)
+        if previous and not previous.done():
+            previous.cancel()
+        task = asyncio.create_task(self.stream_file_to_server(websocket, params["path"], chunk_size, transfer_id, offset))
+        self.download_tasks[transfer_id] = task
+        task.add_done_callback(lambda t, tid=transfer_id: self._forget_download_task(tid, t))
+        return None
+
+    def _download_dir_stream(self, websocket, params):
+        transfer_id = params["transfer_id"]
+        chunk_size = int(params.get("chunk_size") or 4 * 1024 * 1024)
+        compression = resolve_compression(params.get("compression", "gzip"))
+        task = asyncio.create_task(self.stream_dir_to_server(websocket, params["path"], chunk_size, transfer_id, compression))
+        self.download_tasks[transfer_id] = task
+        task.add_done_callback(lambda t, tid=transfer_id: self._forget_download_task(tid, t))
+        return None
+
+    def _forget_download_task(self, transfer_id, task):
+        if self.download_tasks.get(transfer_id) is task:
+            del self.download_tasks[transfer_id]
+
+    def _download_cancel(self, params):
+        task = self.download_tasks.get(params.get("transfer_id"))
+        if task and not task.done():
+            logging.info("-> ⏹️ Получен запрос на отмену отправки '%s'.", params.get("path", params.get("transfer_id")))
+            task.cancel()
+        return None
+
+    async def stream_file_to_server(self, websocket, file_path, chunk_size: int = 4 * 1024 * 1024, transfer_id=None, offset: int = 0):
+        """Отправка файла на сервер бинарными кадрами, начиная со смещения offset."""
+        try:
+            if not os.path.exists(file_path) or os.path.isdir(file_path):
+                await self.client.sender.send(websocket, encode_message({"error": f"❌ Файл не найден или является директорией: {file_path}", "transfer_id": transfer_id}), PRIORITY_CONTROL)
+                return
+
+            file_size = os.path.getsize(file_path)
+            if offset > file_size:
+                offset = 0
+            start_payload = {"download_file_start": {
+                "filename": os.path.basename(file_path),
+                "filesize": file_size,
+                "path": file_path,
+                "transfer_id": transfer_id,
+                "offset": offset
+            }}
+            await self.client.sender.send(websocket, encode_message(start_payload), PRIORITY_CONTROL)
+            if offset:
+                logging.info("-> 🔁 Продолжение отправки файла '%s' со смещения %d.", file_path, offset)
+
+            loop = asyncio.get_running_loop()
+            with open(file_path, 'rb') as f:
+                f.seek(offset)
+                while True:
+                    chunk = await loop.run_in_executor(None, f.read, chunk_size)
+                    if not chunk:
+                        break
+                    await self.client.sender.send_frame(websocket, transfer_id, offset, chunk)
+                    offset += len(chunk)
+
+            await self.client.sender.send(websocket, encode_message({"download_file_end": {"path": file_path, "transfer_id": transfer_id}}), PRIORITY_CONTROL)
+
+        except asyncio.CancelledError:
+            logging.info("-> ⏹️ Отправка файла '%s' отменена.", file_path)
+        except websockets.exceptions.ConnectionClosed:
+            logging.warning("-> 🔌 Соединение потеряно при отправке '%s' (смещение %d), сервер запросит продолжение.", file_path, offset)
+        except Exception as e:
+            logging.error("❌ Ошибка при отправке файла '%s': %s", file_path, e, exc_info=True)
+            try:
+                await self.client.sender.send(websocket, encode_message({"error": f"❌ Ошибка при отправке файла: {e}", "transfer_id": transfer_id}), PRIORITY_CONTROL)
+            except Exception:
+                pass
+
+    async def stream_dir_to_server(self, websocket, dir_path, chunk_size, transfer_id, compression):
+        """
+        Отправка директории на сервер tar-архивом (опционально gzip/zstd), который
+        формируется на лету из os.scandir без временного файла. Размер архива заранее
+        неизвестен, поэтому итоговый размер передается в download_file_end.
+        """
+        writer = ChunkQueueWriter(chunk_size)
+        producer = None
+        offset = 0
+        try:
+            if not os.path.isdir(dir_path):
+                await self.client.sender.send(websocket, encode_message({"error": f"❌ Директория не найдена: {dir_path}", "transfer_id": transfer_id}), PRIORITY_CONTROL)
+                return
+
+            archive_name = (os.path.basename(os.path.normpath(dir_path)) or "root") + ARCHIVE_EXTENSIONS[compression]
+            start_payload = {"download_file_start": {
+                "filename": archive_name,
+                "filesize": 0,
+                "path": dir_path,
+                "transfer_id": transfer_id,
+                "offset": 0,
+                "stream": True,
+                "compression": compression
+            }}
+            await self.client.sender.send(websocket, encode_message(start_payload), PRIORITY_CONTROL)
+            logging.info("-> 📦 Отправка директории '%s' архивом (%s).", dir_path, compression)
+
+            loop = asyncio.get_running_loop()
+            producer = loop.run_in_executor(None, write_tar_stream, dir_path, writer, compression)
+            while True:
+                chunk = await loop.run_in_executor(None, writer.chunks.get)
+                if chunk is None:
+                    break
+                await self.client.sender.send_frame(websocket, transfer_id, offset, chunk)
+                offset += len(chunk)
+            await producer
+
+            await self.client.sender.send(websocket, encode_message({"download_file_end": {"path": dir_path, "transfer_id": transfer_id, "size": offset}}), PRIORITY_CONTROL)
+
+        except asyncio.CancelledError:
+            logging.info("-> ⏹️ Отправка директории '%s' отменена.", dir_path)
+        except websockets.exceptions.ConnectionClosed:
+            logging.warning("-> 🔌 Соединение потеряно при отправке директории '%s', архив не может быть продолжен.", dir_path)
+        except Exception as e:
+            logging.error("❌ Ошибка при отправке директории '%s': %s", dir_path, e, exc_info=True)
+            try:
+                await self.client.sender.send(websocket, encode_message({"error": f"❌ Ошибка при отправке директории: {e}", "transfer_id": transfer_id}), PRIORITY_CONTROL)
+            except Exception:
+                pass
+        finally:
+            if producer is not None and not producer.done():
+                writer.cancel()
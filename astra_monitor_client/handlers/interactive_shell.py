@@ -5,9 +5,11 @@ import termios
 import struct
 import fcntl
 import sys
-import json
 import logging
 
+from astra_monitor_client.utils.protocol import encode_message
+from astra_monitor_client.client.send_scheduler import PRIORITY_INTERACTIVE
+
 
 class InteractiveShell:
     def __init__(self, client):
@@ -85,8 +87,7 @@ class InteractiveShell:
                     data = os.read(fd, 1024)
                     if not data:
                         break
-                    async with self.client.send_lock:
-                        await websocket.send(json.dumps({"interactive_output": {"data": data.decode(errors='replace')}}))
+                    await self.client.sender.send(websocket, encode_message({"interactive_output": {"data": data.decode(errors='replace')}}), PRIORITY_INTERACTIVE)
                 except BlockingIOError:
                     continue
                 except OSError:
@@ -120,7 +121,6 @@ class InteractiveShell:
 
         if websocket:
             try:
-                async with self.client.send_lock:
-                    await websocket.send(json.dumps({"interactive_stopped": True}))
+                await self.client.sender.send(websocket, encode_message({"interactive_stopped": True}), PRIORITY_INTERACTIVE)
             except Exception:
                 pass
@@ -0,0 +1,157 @@
+import asyncio
+import codecs
+import logging
+import os
+import signal
+import uuid
+
+from astra_monitor_client.utils.protocol import encode_message
+from astra_monitor_client.client.send_scheduler import PRIORITY_CONTROL, PRIORITY_INTERACTIVE
+
+# Сколько команд выполняется одновременно; остальные ждут своей очереди
+MAX_CONCURRENT_JOBS = 4
+# Предельное время выполнения команды, секунд
+JOB_TIMEOUT = 600
+# Сколько последнего вывода передается в итоговом job_result (весь вывод уже ушел в job_output)
+RESULT_OUTPUT_LIMIT = 64 * 1024
+READ_CHUNK_SIZE = 4096
+# Сколько ждать завершения процесса после SIGTERM, прежде чем послать SIGKILL
+TERMINATE_GRACE = 3
+
+
+class JobManager:
+    """
+    Выполнение shell-команд (execute:) фоновыми заданиями. У каждого задания свой ID:
+    stdout и stderr уходят на сервер по мере появления (job_output), по завершении -
+    job_result с кодом возврата и хвостом вывода. Одновременно выполняется не больше
+    max_jobs заданий; цикл приема команд не ждет их завершения, поэтому задание можно
+    отменить (cancel_job:<ID>), пока оно выполняется.
+    """
+
+    def __init__(self, client, max_jobs=MAX_CONCURRENT_JOBS, timeout=JOB_TIMEOUT):
+        self.client = client
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(max_jobs)
+        self.jobs = {} # job_id -> {'command', 'command_id', 'status', 'process', 'task'}
+
+    def start(self, websocket, cmd, cwd, command_id=None):
+        """
+        Ставит команду в очередь и сразу возвращает сообщение job_started.
+        ID задания - command_id команды сервера, поэтому job_result сопоставляется с ней как ответ.
+        """
+        job_id = command_id or uuid.uuid4().hex
+        job = {'command': cmd, 'command_id': command_id, 'status': 'queued', 'process': None, 'task': None}
+        self.jobs[job_id] = job
+        job['task'] = asyncio.create_task(self._run(websocket, job_id, job, cwd))
+        return {"job_started": {"job_id": job_id, "command": cmd}}
+
+    async def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return {"command_error": f"❌ Задание не найдено: {job_id}"}
+        logging.info("-> ⏹️ Отмена задания %s ('%s').", job_id, job['command'])
+        job['status'] = 'cancelled'
+        job['task'].cancel()
+        return {"job_cancelled": {"job_id": job_id}}
+
+    async def cancel_all(self):
+        tasks = [job['task'] for job in self.jobs.values()]
+        for job in self.jobs.values():
+            job['status'] = 'cancelled'
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def list_jobs(self):
+        return {"jobs_list": [
+            {"job_id": job_id, "command": job['command'], "status": job['status']}
+            for job_id, job in self.jobs.items()
+        ]}
+
+    async def _run(self, websocket, job_id, job, cwd):
+        output = bytearray()
+        exit_code = None
+        error = None
+        try:
+            async with self.slots:
+                job['status'] = 'running'
+                # Своя группа процессов: отмена завершает и дочерние процессы команды
+                process = await asyncio.create_subprocess_shell(
+                    job['command'],
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd,
+                    start_new_session=True
+                )
+                job['process'] = process
+                try:
+                    await asyncio.wait_for(self._communicate(websocket, job_id, process, output), timeout=self.timeout)
+                    job['status'] = 'done'
+                except asyncio.TimeoutError:
+                    job['status'] = 'timeout'
+                    error = "⌛ Timeout expired"
+                finally:
+                    if process.returncode is None:
+                        await self._terminate(process)
+                    exit_code = process.returncode
+        except asyncio.CancelledError:
+            job['status'] = 'cancelled'
+            error = "⏹️ Cancelled"
+        except Exception as e:
+            job['status'] = 'error'
+            error = str(e)
+        finally:
+            self.jobs.pop(job_id, None)
+
+        result = {
+            "job_id": job_id,
+            "command": job['command'],
+            "status": job['status'],
+            "exit_code": exit_code,
+            "output": output[-RESULT_OUTPUT_LIMIT:].decode('utf-8', errors='replace'),
+        }
+        if error:
+            result["error"] = error
+        message = {"job_result": result}
+        if job['command_id']:
+            message["command_id"] = job['command_id']
+        try:
+            await self.client.sender.send(websocket, encode_message(message), PRIORITY_CONTROL)
+        except Exception as e:
+            logging.debug("Результат задания %s не отправлен: %s", job_id, e)
+
+    async def _communicate(self, websocket, job_id, process, output):
+        await asyncio.gather(
+            self._stream(websocket, job_id, "stdout", process.stdout, output),
+            self._stream(websocket, job_id, "stderr", process.stderr, output),
+            process.wait()
+        )
+
+    async def _stream(self, websocket, job_id, stream, pipe, output):
+        # Многобайтовый символ UTF-8 может разрезаться границей чанка
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = await pipe.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            output += chunk
+            if len(output) > RESULT_OUTPUT_LIMIT * 2:
+                del output[:-RESULT_OUTPUT_LIMIT]
+            await self.client.sender.send(websocket, encode_message({"job_output": {
+                "job_id": job_id, "stream": stream, "data": decoder.decode(chunk)
+            }}), PRIORITY_INTERACTIVE)
+
+    @staticmethod
+    async def _terminate(process):
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(process.pid, sig)
+            except ProcessLookupError:
+                return
+            try:
+                await asyncio.wait_for(asyncio.shield(process.wait()), timeout=TERMINATE_GRACE)
+                return
+            except asyncio.TimeoutError:
+                continue
@@ -1,9 +1,9 @@
 import base64
 import logging
 import shutil
-import subprocess
 from datetime import datetime
 
+from astra_monitor_client.utils.process_runner import run_process
 from astra_monitor_client.utils.system_utils import get_active_graphical_session, build_dbus_env
 
 
@@ -14,24 +14,19 @@ class ScreenshotHandler:
     async def take_screenshot(self, force_quality=None):
         logging.info("📸 Попытка создания скриншота...")
 
-        def run_as_user(user, display, uid, cmd, timeout=15, capture_output=True):
+        async def run_as_user(user, display, uid, cmd, timeout=15, capture_output=True, input=None):
             full_cmd = ['runuser', '-u', user, '--'] + cmd
             env = build_dbus_env(user, display, uid)
 
             try:
-                return subprocess.run(
-                    full_cmd,
-                    env=env,
-                    timeout=timeout,
-                    capture_output=capture_output
-                )
+                return await run_process(full_cmd, env=env, timeout=timeout, capture_output=capture_output, input=input)
             except Exception as e:
                 logging.error("Ошибка runuser: %s", e)
                 return None
 
-        def get_primary_geometry():
+        async def get_primary_geometry():
             try:
-                result = subprocess.run(['xrandr', '--query'], capture_output=True, text=True)
+                result = await run_process(['xrandr', '--query'], text=True, timeout=5)
                 for line in result.stdout.splitlines():
                     if " connected primary " in line:
                         parts = line.split()
@@ -55,16 +50,16 @@ class ScreenshotHandler:
         try:
             quality = force_quality if force_quality is not None else self.client.screenshot_settings["quality"]
             monitor_mode = self.client.screenshot_settings.get("monitor_mode", "all")
-            user, display, uid = get_active_graphical_session()
+            user, display, uid = await get_active_graphical_session()
             if not (user and display and uid):
                 return {"error": "❌ Не найдено активной графической сессии"}
 
-            geometry = get_primary_geometry() if monitor_mode == "primary" else None
+            geometry = await get_primary_geometry() if monitor_mode == "primary" else None
 
             try:
-                subprocess.run(["xhost", "+SI:localuser:root"], timeout=5, capture_output=False)
-                subprocess.run(["xhost", "+SI:localuser:" + user], timeout=5, capture_output=False)
-                subprocess.run(["xhost", "+"], timeout=5, capture_output=False)
+                await run_process(["xhost", "+SI:localuser:root"], timeout=5, capture_output=False)
+                await run_process(["xhost", "+SI:localuser:" + user], timeout=5, capture_output=False)
+                await run_process(["xhost", "+"], timeout=5, capture_output=False)
             except Exception:
                 pass
 
@@ -74,12 +69,12 @@ class ScreenshotHandler:
                     w, h, x, y = geometry
                     import_cmd += ['-crop', f'{w}x{h}+{x}+{y}']
                 import_cmd += ['png:-']
-                result = run_as_user(user, display, uid, import_cmd, timeout=15, capture_output=True)
+                result = await run_as_user(user, display, uid, import_cmd, timeout=15, capture_output=True)
                 if result and result.returncode == 0 and result.stdout:
                     img_data = result.stdout
                     if quality < 100:
                         convert_cmd = ['convert', 'png:-', '-quality', str(quality), 'jpg:-']
-                        convert_result = run_as_user(user, display, uid, convert_cmd, timeout=10, capture_output=True)
+                        convert_result = await run_as_user(user, display, uid, convert_cmd, timeout=10, capture_output=True, input=result.stdout)
                         if convert_result and convert_result.returncode == 0 and convert_result.stdout:
                             img_data = convert_result.stdout
                     return {
@@ -92,14 +87,14 @@ class ScreenshotHandler:
 
             try:
                 xwd_cmd = ['xwd', '-root', '-silent']
-                result = run_as_user(user, display, uid, xwd_cmd, timeout=15, capture_output=True)
+                result = await run_as_user(user, display, uid, xwd_cmd, timeout=15, capture_output=True)
                 if result and result.returncode == 0 and result.stdout:
                     convert_cmd = ['convert', 'xwd:-']
                     if geometry:
                         w, h, x, y = geometry
                         convert_cmd += ['-crop', f'{w}x{h}+{x}+{y}']
                     convert_cmd += ['png:-']
-                    convert_result = run_as_user(user, display, uid, convert_cmd, timeout=10, capture_output=True)
+                    convert_result = await run_as_user(user, display, uid, convert_cmd, timeout=10, capture_output=True, input=result.stdout)
                     if convert_result and convert_result.returncode == 0 and convert_result.stdout:
                         img_data = convert_result.stdout
                         return {
@@ -126,7 +121,7 @@ class ScreenshotHandler:
                             '-vframes', '1', '-q:v', str(max(1, 31 - quality // 3)),
                             '-f', 'image2pipe', '-c:v', 'mjpeg', '-'
                         ]
-                    result = run_as_user(user, display, uid, ffmpeg_cmd, timeout=15, capture_output=True)
+                    result = await run_as_user(user, display, uid, ffmpeg_cmd, timeout=15, capture_output=True)
                     if result and result.returncode == 0 and result.stdout:
                         img_data = result.stdout
                         return {
@@ -140,7 +135,7 @@ class ScreenshotHandler:
             if shutil.which("scrot"):
                 try:
                     scrot_cmd = ['scrot', '-o', '-']
-                    result = run_as_user(user, display, uid, scrot_cmd, timeout=10, capture_output=True)
+                    result = await run_as_user(user, display, uid, scrot_cmd, timeout=10, capture_output=True)
                     if result and result.returncode == 0 and result.stdout:
                         img_data = result.stdout
                         if quality < 100:
@@ -149,7 +144,7 @@ class ScreenshotHandler:
                                 w, h, x, y = geometry
                                 convert_cmd += ['-crop', f'{w}x{h}+{x}+{y}']
                             convert_cmd += ['-quality', str(quality), 'jpg:-']
-                            convert_result = run_as_user(user, display, uid, convert_cmd, timeout=5, capture_output=True)
+                            convert_result = await run_as_user(user, display, uid, convert_cmd, timeout=5, capture_output=True, input=result.stdout)
                             if convert_result and convert_result.returncode == 0 and convert_result.stdout:
                                 img_data = convert_result.stdout
                         return {
@@ -162,7 +157,7 @@ class ScreenshotHandler:
 
             try:
                 gnome_cmd = ['gnome-screenshot', '-f', '-', '--include-pointer']
-                result = run_as_user(user, display, uid, gnome_cmd, timeout=10, capture_output=True)
+                result = await run_as_user(user, display, uid, gnome_cmd, timeout=10, capture_output=True)
                 if result and result.returncode == 0 and result.stdout:
                     img_data = result.stdout
                     if quality < 100:
@@ -171,7 +166,7 @@ class ScreenshotHandler:
                             w, h, x, y = geometry
                             convert_cmd += ['-crop', f'{w}x{h}+{x}+{y}']
                         convert_cmd += ['-quality', str(quality), 'jpg:-']
-                        convert_result = run_as_user(user, display, uid, convert_cmd, timeout=5, capture_output=True)
+                        convert_result = await run_as_user(user, display, uid, convert_cmd, timeout=5, capture_output=True, input=result.stdout)
                         if convert_result and convert_result.returncode == 0 and convert_result.stdout:
                             img_data = convert_result.stdout
                     return {
@@ -0,0 +1,40 @@
+import hashlib
+import os
+from itertools import accumulate
+
+# Возможность, объявляемая клиентом: загрузка файлов разностью (rsync-подобные блоки)
+DELTA_SYNC_CAPABILITY = "delta_sync"
+
+WEAK_MODULUS = 1 << 16
+
+
+def weak_checksum(block):
+    """Слабая (rolling) контрольная сумма блока, как в rsync: пара (a, b) по модулю 2^16."""
+    a = sum(block) % WEAK_MODULUS
+    b = sum(accumulate(block)) % WEAK_MODULUS
+    return a, b
+
+
+def strong_checksum(block):
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+def file_signature(path, block_size):
+    """
+    Список контрольных сумм блоков файла: [[weak, strong], ...], где weak = (b << 16) | a.
+    Возвращает None, если файла нет или его нельзя прочитать.
+    """
+    if not os.path.isfile(path):
+        return None
+    blocks = []
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                a, b = weak_checksum(block)
+                blocks.append([(b << 16) | a, strong_checksum(block)])
+    except OSError:
+        return None
+    return blocks
@@ -0,0 +1,63 @@
+import uuid
+
+from astra_monitor_client.utils.system_utils import get_full_system_info
+
+# Поля, которые меняются постоянно: сами по себе они не повод отправлять изменения,
+# но попадают в очередную разность вместе с остальными
+VOLATILE_INVENTORY_KEYS = frozenset({'uptime', 'cpu_freq'})
+
+
+def merge_patch(old, new):
+    """
+    Разность old -> new в формате JSON Merge Patch (RFC 7386): словари сравниваются
+    рекурсивно, удаленный ключ - None, списки и прочие значения заменяются целиком.
+    """
+    if not (isinstance(old, dict) and isinstance(new, dict)):
+        return new
+    patch = {key: None for key in old.keys() - new.keys()}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif old[key] != value:
+            patch[key] = merge_patch(old[key], value)
+    return patch
+
+
+def _stable(inventory):
+    return {key: value for key, value in inventory.items() if key not in VOLATILE_INVENTORY_KEYS}
+
+
+class InventoryTracker:
+    """
+    Последняя инвентаризация, отправленная серверу, и ее версия. Версия - "эпоха:номер",
+    эпоха новая у каждого запуска клиента, поэтому сервер не спутает разность нового
+    процесса с состоянием прежнего. None - сервер еще ничего не получал.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.counter = 0
+        self.version = None
+        self.data = {}
+
+    async def snapshot(self):
+        """Полная инвентаризация для ответа на get_full_system_info: (данные, версия)."""
+        current = await get_full_system_info()
+        if 'error' not in current and current != self.data:
+            self._advance(current)
+        return current, self.version
+
+    async def delta(self):
+        """Разность с последней отправленной инвентаризацией или None, если значимых изменений нет."""
+        current = await get_full_system_info()
+        if 'error' in current or _stable(current) == _stable(self.data):
+            return None
+        patch = merge_patch(self.data, current)
+        base = self.version
+        self._advance(current)
+        return {"base": base, "version": self.version, "patch": patch}
+
+    def _advance(self, current):
+        self.counter += 1
+        self.version = f"{self.epoch}:{self.counter}"
+        self.data = current
@@ -0,0 +1,70 @@
+import asyncio
+import glob
+import hashlib
+import os
+import time
+
+_MISSING = object()
+
+
+def path_mtimes(*patterns):
+    """
+    Подсказка инвалидации: mtime путей по шаблонам glob. Каталог меняет mtime при
+    появлении и удалении записей (узлы /dev, база udev в /run/udev/data и т.п.).
+    """
+    stamp = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            try:
+                stamp.append((path, os.stat(path).st_mtime_ns))
+            except OSError:
+                pass
+    return tuple(stamp)
+
+
+def file_digest(path):
+    """Подсказка инвалидации по содержимому небольшого файла (/proc/self/mounts и т.п.)."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class CachedProbe:
+    """
+    Результат пробы инвентаризации (корутины без аргументов), кэшированный на ttl секунд.
+    stamp() - необязательная дешевая подсказка: если ее значение изменилось, кэш
+    сбрасывается раньше срока. Одновременные запросы ждут одного выполнения пробы.
+    """
+
+    def __init__(self, probe, ttl, stamp=None, clock=time.monotonic):
+        self.probe = probe
+        self.ttl = ttl
+        self.stamp = stamp
+        self.clock = clock
+        self.value = _MISSING
+        self.expires = 0.0
+        self.stamp_value = None
+        self.pending = None
+
+    async def get(self):
+        stamp = self.stamp() if self.stamp else None
+        if self.value is not _MISSING and self.clock() < self.expires and stamp == self.stamp_value:
+            return self.value
+        if self.pending is None:
+            self.pending = asyncio.ensure_future(self._refresh(stamp))
+        return await asyncio.shield(self.pending)
+
+    def invalidate(self):
+        self.value = _MISSING
+
+    async def _refresh(self, stamp):
+        try:
+            value = await self.probe()
+            # Подсказка снята до запуска пробы: изменения во время пробы заметит следующий запрос
+            self.value, self.stamp_value = value, stamp
+            self.expires = self.clock() + self.ttl
+            return value
+        finally:
+            self.pending = None
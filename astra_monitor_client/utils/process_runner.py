@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+
+# Сколько вспомогательных процессов (lspci, dmidecode, xrandr, import...) выполняется одновременно
+MAX_PROCESSES = 8
+# Таймаут по умолчанию, секунд: зависший вызов X или dmidecode не должен держать слот вечно
+DEFAULT_TIMEOUT = 15
+
+
+class ProcessRunner:
+    """
+    Запуск вспомогательных команд без блокировки event loop клиента. Интерфейс повторяет
+    subprocess.run: результат - subprocess.CompletedProcess, по таймауту -
+    subprocess.TimeoutExpired, при check=True и ненулевом коде - CalledProcessError.
+    Одновременно выполняется не больше max_processes команд. Процесс запускается в своей
+    группе: при таймауте или отмене вызывающей корутины группа завершается целиком.
+    """
+
+    def __init__(self, max_processes=MAX_PROCESSES, default_timeout=DEFAULT_TIMEOUT):
+        self.default_timeout = default_timeout
+        self.slots = asyncio.Semaphore(max_processes)
+
+    async def run(self, args, timeout=None, capture_output=True, text=False, check=False,
+                  env=None, input=None, shell=False):
+        timeout = self.default_timeout if timeout is None else timeout
+        stream = asyncio.subprocess.PIPE if capture_output else asyncio.subprocess.DEVNULL
+        async with self.slots:
+            if shell:
+                process = await asyncio.create_subprocess_shell(
+                    args, stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                    stdout=stream, stderr=stream, env=env, start_new_session=True)
+            else:
+                process = await asyncio.create_subprocess_exec(
+                    *args, stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                    stdout=stream, stderr=stream, env=env, start_new_session=True)
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(input), timeout=timeout)
+            except asyncio.TimeoutError:
+                self._kill(process)
+                await process.wait()
+                raise subprocess.TimeoutExpired(args, timeout)
+            except asyncio.CancelledError:
+                self._kill(process)
+                # Дожидаемся завершения даже при отмене: иначе остаются зомби и незакрытые транспорты
+                await asyncio.shield(process.wait())
+                raise
+
+        if text:
+            stdout = stdout.decode('utf-8', errors='replace') if stdout is not None else None
+            stderr = stderr.decode('utf-8', errors='replace') if stderr is not None else None
+        if check and process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+    @staticmethod
+    def _kill(process):
+        if process.returncode is not None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        except OSError as e:
+            logging.debug("Не удалось завершить процесс %s: %s", process.pid, e)
+
+
+# Общий пул процессов клиента
+process_runner = ProcessRunner()
+
+
+async def run_process(args, **kwargs):
+    """Аналог subprocess.run для корутин, через общий ProcessRunner."""
+    return await process_runner.run(args, **kwargs)
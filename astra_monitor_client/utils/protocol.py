@@ -0,0 +1,35 @@
+import json
+
+# Версия протокола: с версии 2 каждое сообщение клиента несет поле "type"
+PROTOCOL_VERSION = 2
+
+# Клиент умеет продолжать сессию по токену сервера, не пересылая неизменившиеся настройки
+SESSION_RESUME_CAPABILITY = "session_resume"
+
+# Клиент сам отправляет изменения инвентаризации (inventory_delta) в формате JSON Merge Patch
+INVENTORY_PUSH_CAPABILITY = "inventory_push"
+
+# Код закрытия "Try Again Later" (RFC 6455): сервер перегружен, причина - "retry_after=<секунды>"
+RETRY_AFTER_CLOSE_CODE = 1013
+
+
+def encode_message(payload):
+    """
+    Сериализует сообщение для сервера. Поле "type" ставится первым ключом; если оно не
+    задано, типом считается первый ключ сообщения ({"files_list": ...} -> "files_list").
+    """
+    if "type" not in payload:
+        payload = {"type": next(iter(payload), "unknown"), **payload}
+    elif next(iter(payload)) != "type":
+        payload = {"type": payload["type"], **payload}
+    return json.dumps(payload)
+
+
+def parse_retry_after(code, reason):
+    """Секунды до повторного подключения из кода и причины закрытия или None, если сервер их не указал."""
+    if code != RETRY_AFTER_CLOSE_CODE or not reason or not reason.startswith("retry_after="):
+        return None
+    try:
+        return max(0.0, float(reason[len("retry_after="):]))
+    except ValueError:
+        return None
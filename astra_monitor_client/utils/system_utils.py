@@ -1,12 +1,16 @@
 import platform
 import os
+import glob
 import subprocess
 import socket
 import shutil
 import re
+import asyncio
 from datetime import datetime
 import json
 
+from astra_monitor_client.utils.process_runner import run_process
+from astra_monitor_client.utils.probe_cache import CachedProbe, path_mtimes, file_digest
 
 
 class SystemMonitor:
@@ -94,10 +98,10 @@ class SystemMonitor:
         except:
             return datetime.now().strftime("%d.%m.%Y %H:%M:%S")
 
-def get_full_system_info():
-    return get_linux_full_system_info()
+async def get_full_system_info():
+    return await get_linux_full_system_info()
 
-def get_linux_full_system_info():
+async def get_linux_full_system_info():
     try:
         result = {
             'os_distro': 'Astra Linux',
@@ -105,21 +109,16 @@ def get_linux_full_system_info():
             'architecture': platform.machine(),
             'kernel': platform.release(),
             'uptime': get_uptime(),
-            'install_date': get_install_date(),
+            'install_date': None,
             'cpu_model': get_cpu_info(),
             'cpu_cores': get_cpu_cores(),
             'cpu_freq': get_cpu_freq(),
             'ram_total': get_ram_total(),
-            'gpu': get_gpu_info(),
-            'motherboard': get_motherboard_info(),
-            'bios': get_bios_info(),
-            'storage': get_storage_info(),
-            'network': get_network_info(),
-            'usb_devices': get_usb_devices(),
-            'audio_devices': get_audio_devices(),
-            'cameras': get_camera_info()
         }
-        
+        # Пробы с внешними программами выполняются параллельно, их результаты кэшируются
+        keys = list(INVENTORY_PROBES)
+        values = await asyncio.gather(*(INVENTORY_PROBES[key].get() for key in keys))
+        result.update(zip(keys, values))
         return result
         
     except Exception as e:
@@ -145,30 +144,27 @@ def get_uptime():
     except:
         return "N/A"
 
-def get_install_date():
+async def get_install_date():
     """
     Получает дату установки ОС.
     Для Linux пробует несколько методов для надежности.
     """
     # Method 1: Filesystem birth time (most reliable for modern systems)
     try:
-        result = subprocess.run(
-            ['stat', '-c', '%W', '/'],
-            capture_output=True, text=True, check=True, stderr=subprocess.DEVNULL
-        )
+        result = await run_process(['stat', '-c', '%W', '/'], text=True, check=True)
         timestamp_str = result.stdout.strip()
         if timestamp_str and timestamp_str != '0':
             timestamp = int(timestamp_str)
             return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
-    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+    except (subprocess.SubprocessError, FileNotFoundError, ValueError):
         pass
 
     # Method 2: tune2fs (very reliable for ext filesystems)
     try:
-        df_output = subprocess.check_output(['df', '/'], text=True)
+        df_output = (await run_process(['df', '/'], text=True, check=True)).stdout
         root_device = df_output.split('\n')[1].split()[0]
         if root_device.startswith('/dev/'):
-            tune2fs_output = subprocess.check_output(['tune2fs', '-l', root_device], text=True, stderr=subprocess.DEVNULL)
+            tune2fs_output = (await run_process(['tune2fs', '-l', root_device], text=True, check=True)).stdout
             for line in tune2fs_output.split('\n'):
                 if 'Filesystem created:' in line:
                     date_str = line.split(':', 1)[1].strip()
@@ -176,7 +172,7 @@ def get_install_date():
                         return datetime.strptime(date_str, '%a %b %d %H:%M:%S %Y').strftime('%Y-%m-%d')
                     except ValueError:
                         pass
-    except (subprocess.CalledProcessError, FileNotFoundError, IndexError, AttributeError):
+    except (subprocess.SubprocessError, FileNotFoundError, IndexError, AttributeError):
         pass
 
     # Method 3: /var/log/installer/syslog
@@ -212,12 +208,10 @@ def get_install_date():
 def get_astra_version():
     """Получение версии системы"""
     try:
-        result = subprocess.run(['cat', '/etc/astra_version'], 
-                               capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            astra_version = result.stdout.strip()
-            return astra_version
+        with open('/etc/astra_version', 'r') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
     except Exception as e:
         print(f"Ошибка при получении версии Astra: {e}")
     
@@ -268,20 +262,18 @@ def get_ram_total():
         pass
     return "N/A"
 
-def get_gpu_info():
+async def get_gpu_info():
     try:
-        result = subprocess.run(['lspci', '|', 'grep', '-i', 'vga'],
-                            capture_output=True, text=True, shell=True)
+        result = await run_process(['lspci'], text=True)
         if result.returncode == 0:
-            return result.stdout.strip()
+            return "\n".join(line for line in result.stdout.splitlines() if 'vga' in line.lower())
     except:
         pass
     return "N/A"
 
-def get_motherboard_info():
+async def get_motherboard_info():
     try:
-        result = subprocess.run(['dmidecode', '-t', 'baseboard'],
-                            capture_output=True, text=True)
+        result = await run_process(['dmidecode', '-t', 'baseboard'], text=True)
         if result.returncode == 0:
             for line in result.stdout.split('\n'):
                 if 'Product Name:' in line:
@@ -290,10 +282,9 @@ def get_motherboard_info():
         pass
     return "N/A"
 
-def get_bios_info():
+async def get_bios_info():
     try:
-        result = subprocess.run(['dmidecode', '-t', 'bios'],
-                            capture_output=True, text=True)
+        result = await run_process(['dmidecode', '-t', 'bios'], text=True)
         if result.returncode == 0:
             for line in result.stdout.split('\n'):
                 if 'Version:' in line:
@@ -311,17 +302,24 @@ def format_bytes(size_bytes):
         i += 1
     return f"{size_bytes:.1f} {size_names[i]}"
 
-def get_fstype(device):
+def get_mount_fstypes():
+    """Точка монтирования -> тип ФС по /proc/self/mounts (вместо вызова lsblk на каждое устройство)."""
+    fstypes = {}
     try:
-        result = subprocess.run(['lsblk', '-no', 'FSTYPE', device], capture_output=True, text=True)
-        return result.stdout.strip() or "N/A"
-    except:
-        return "N/A"
-        
-def get_storage_info():
+        with open('/proc/self/mounts', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3:
+                    fstypes[parts[1].replace('\\040', ' ')] = parts[2]
+    except OSError:
+        pass
+    return fstypes
+
+async def get_storage_info():
     try:
-        result = subprocess.run(['df', '-P'], capture_output=True, text=True, check=True)
+        result = await run_process(['df', '-P'], text=True, check=True)
         lines = result.stdout.strip().split('\n')[1:]
+        fstypes = get_mount_fstypes()
         storage_info = []
         for line in lines:
             parts = line.split()
@@ -334,15 +332,15 @@ def get_storage_info():
                     'mountpoint': mountpoint,
                     'size': total_hr,
                     'used': f"{used_hr} ({use_percent})",
-                    'fstype': get_fstype(device)
+                    'fstype': fstypes.get(mountpoint, "N/A")
                 })
         return storage_info
     except Exception:
         return []
 
-def get_network_info():
+async def get_network_info():
     try:
-        result = subprocess.run(['ip', '-j', 'addr'], capture_output=True, text=True, check=True)
+        result = await run_process(['ip', '-j', 'addr'], text=True, check=True)
         interfaces = json.loads(result.stdout)
         network_info = []
         for iface in interfaces:
@@ -361,9 +359,9 @@ def get_network_info():
     except:
         return []
 
-def get_usb_devices():
+async def get_usb_devices():
     try:
-        result = subprocess.run(['lsusb'], capture_output=True, text=True, check=True)
+        result = await run_process(['lsusb'], text=True, check=True)
         usb_devices = []
         pattern = re.compile(r"Bus\s+(\d+)\s+Device\s+(\d+):\s+ID\s+([0-9a-fA-F]{4}:[0-9a-fA-F]{4})\s+(.*)")
         for line in result.stdout.strip().split('\n'):
@@ -380,9 +378,9 @@ def get_usb_devices():
     except Exception:
         return []
 
-def get_audio_devices():
+async def get_audio_devices():
     try:
-        result = subprocess.run(['aplay', '-l'], capture_output=True, text=True, check=True)
+        result = await run_process(['aplay', '-l'], text=True, check=True)
         audio_devices = []
         pattern = re.compile(r"card\s+\d+:\s+.*? \[((?:.|)*?)\]")
         for line in result.stdout.strip().split('\n'):
@@ -398,9 +396,9 @@ def get_audio_devices():
     except Exception:
         return []
 
-def get_camera_info():
+async def get_camera_info():
     try:
-        result = subprocess.run(['find', '/dev', '-name', 'video*'], capture_output=True, text=True, check=True)
+        result = await run_process(['find', '/dev', '-name', 'video*'], text=True, check=True)
         cameras = []
         video_devices = result.stdout.strip().split('\n')
         
@@ -413,10 +411,7 @@ def get_camera_info():
             device_name = device_path
             if v4l2_ctl_exists:
                 try:
-                    v4l2_result = subprocess.run(
-                        ['v4l2-ctl', '--device', device_path, '--all'],
-                        capture_output=True, text=True, timeout=2
-                    )
+                    v4l2_result = await run_process(['v4l2-ctl', '--device', device_path, '--all'], text=True, timeout=2)
                     if v4l2_result.returncode == 0:
                         card_type_match = re.search(r"Card type\s*:\s*(.*)", v4l2_result.stdout)
                         if card_type_match:
@@ -433,6 +428,35 @@ def get_camera_info():
     except Exception:
         return []
 
+def _network_stamp():
+    """Состав интерфейсов и их состояние из sysfs - изменение сбрасывает кэш сетевой пробы."""
+    stamp = []
+    for path in sorted(glob.glob('/sys/class/net/*/operstate')):
+        try:
+            with open(path, 'r') as f:
+                stamp.append((path, f.read().strip()))
+        except OSError:
+            pass
+    return tuple(stamp)
+
+
+# Пробы полной инвентаризации: ключ результата -> кэш пробы. TTL - сколько секунд результат
+# считается свежим; подсказка (mtime узлов /dev и базы udev, sysfs, /proc/self/mounts)
+# сбрасывает кэш раньше, если оборудование или монтирования изменились.
+INVENTORY_PROBES = {
+    'install_date': CachedProbe(get_install_date, ttl=24 * 3600),
+    'gpu': CachedProbe(get_gpu_info, ttl=3600, stamp=lambda: path_mtimes('/sys/bus/pci/devices')),
+    'motherboard': CachedProbe(get_motherboard_info, ttl=24 * 3600),
+    'bios': CachedProbe(get_bios_info, ttl=24 * 3600),
+    'storage': CachedProbe(get_storage_info, ttl=60,
+                           stamp=lambda: (file_digest('/proc/self/mounts'), path_mtimes('/dev/disk/by-uuid'))),
+    'network': CachedProbe(get_network_info, ttl=30, stamp=_network_stamp),
+    'usb_devices': CachedProbe(get_usb_devices, ttl=600, stamp=lambda: path_mtimes('/dev/bus/usb/*', '/run/udev/data')),
+    'audio_devices': CachedProbe(get_audio_devices, ttl=600, stamp=lambda: path_mtimes('/dev/snd')),
+    'cameras': CachedProbe(get_camera_info, ttl=600, stamp=lambda: path_mtimes('/dev')),
+}
+
+
 def get_local_ip():
     """Получение локального IP-адреса"""
     try:
@@ -445,12 +469,12 @@ def get_local_ip():
         return "127.0.0.1"
 
 
-def get_active_graphical_sessions():
+async def get_active_graphical_sessions():
     """Возвращает список (user, display, uid) активных графических сессий."""
     sessions = set()
 
     try:
-        p = subprocess.run(['loginctl', 'list-sessions'], capture_output=True, text=True)
+        p = await run_process(['loginctl', 'list-sessions'], text=True, timeout=5)
         for line in p.stdout.split('\n'):
             if 'seat0' in line or 'graphical' in line:
                 parts = line.split()
@@ -458,7 +482,7 @@ def get_active_graphical_sessions():
                     session_id = parts[0]
                     user = parts[2]
                     info_cmd = ['loginctl', 'show-session', session_id, '-p', 'Display', '-p', 'User', '-p', 'Active']
-                    info = subprocess.run(info_cmd, capture_output=True, text=True)
+                    info = await run_process(info_cmd, text=True, timeout=5)
                     if 'yes' in info.stdout:
                         display = None
                         uid = None
@@ -473,7 +497,7 @@ def get_active_graphical_sessions():
         pass
 
     try:
-        p = subprocess.run(['who'], capture_output=True, text=True, check=True)
+        p = await run_process(['who'], text=True, check=True, timeout=5)
         for line in p.stdout.strip().split('\n'):
             if ':0' in line or ':1' in line or '(:' in line:
                 parts = line.split()
@@ -483,7 +507,7 @@ def get_active_graphical_sessions():
                     if part.startswith('(:') or (part.startswith(':') and len(part) > 1):
                         display = part.strip('()')
                         break
-                uid_proc = subprocess.run(['id', '-u', user], capture_output=True, text=True)
+                uid_proc = await run_process(['id', '-u', user], text=True, timeout=5)
                 if uid_proc.returncode == 0:
                     uid = uid_proc.stdout.strip()
                     sessions.add((user, display, uid))
@@ -493,9 +517,9 @@ def get_active_graphical_sessions():
     return list(sessions)
 
 
-def get_active_graphical_session():
+async def get_active_graphical_session():
     """Возвращает (user, display, uid) активной графической сессии или (None, None, None)."""
-    sessions = get_active_graphical_sessions()
+    sessions = await get_active_graphical_sessions()
     if sessions:
         return sessions[0]
     return None, None, None
@@ -0,0 +1,103 @@
+import logging
+import os
+import queue
+import tarfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Возможности, объявляемые клиентом: потоковая передача директорий и сжатие zstd
+DIR_STREAM_CAPABILITY = "dir_stream"
+ZSTD_CAPABILITY = "zstd"
+
+ARCHIVE_EXTENSIONS = {"none": ".tar", "gzip": ".tar.gz", "zstd": ".tar.zst"}
+
+
+def resolve_compression(requested):
+    """Возвращает поддерживаемый тип сжатия: zstd без модуля zstandard заменяется на gzip."""
+    if requested == "zstd" and zstandard is None:
+        return "gzip"
+    if requested in ARCHIVE_EXTENSIONS:
+        return requested
+    return "gzip"
+
+
+class ChunkQueueWriter:
+    """
+    Файлоподобный объект для tarfile: нарезает поток на чанки фиксированного размера
+    и кладет их в ограниченную очередь. Заполненная очередь блокирует поток-архиватор,
+    пока отправка не догонит его (backpressure), поэтому архив не держится в памяти целиком.
+    """
+
+    def __init__(self, chunk_size, max_chunks=4):
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(maxsize=max_chunks)
+        self.buffer = bytearray()
+        self.cancelled = False
+
+    def write(self, data):
+        if self.cancelled:
+            raise OSError("Передача архива отменена")
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self.chunks.put(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        """Отдает остаток буфера и признак конца потока (None)."""
+        if self.buffer and not self.cancelled:
+            self.chunks.put(bytes(self.buffer))
+        self.buffer = bytearray()
+        self.chunks.put(None)
+
+    def cancel(self):
+        """Останавливает архиватор: освобождает очередь, чтобы он вышел из put()."""
+        self.cancelled = True
+        while True:
+            try:
+                self.chunks.get_nowait()
+            except queue.Empty:
+                break
+
+
+def _add_tree(tar, path, arcname):
+    """Рекурсивно добавляет директорию через os.scandir, пропуская недоступные записи."""
+    tar.add(path, arcname=arcname, recursive=False)
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                child_arcname = f"{arcname}/{entry.name}"
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        _add_tree(tar, entry.path, child_arcname)
+                    else:
+                        tar.add(entry.path, arcname=child_arcname, recursive=False)
+                except (PermissionError, FileNotFoundError) as e:
+                    # Нет прав или файл удален во время обхода - пропускаем запись
+                    logging.warning("-> ⚠️ Пропущен '%s': %s", entry.path, e)
+    except PermissionError as e:
+        logging.warning("-> ⚠️ Нет доступа к директории '%s': %s", path, e)
+
+
+def write_tar_stream(dir_path, writer, compression):
+    """Пишет tar-архив директории в writer (выполняется в отдельном потоке)."""
+    try:
+        arcname = os.path.basename(os.path.normpath(dir_path)) or "root"
+        if compression == "zstd":
+            output = zstandard.ZstdCompressor().stream_writer(writer, closefd=False)
+            mode = "w|"
+        else:
+            output = writer
+            mode = "w|gz" if compression == "gzip" else "w|"
+        with tarfile.open(fileobj=output, mode=mode) as tar:
+            _add_tree(tar, dir_path, arcname)
+        if output is not writer:
+            output.close()
+    finally:
+        writer.finish()
@@ -0,0 +1,29 @@
+import struct
+import uuid
+
+# Возможность, объявляемая клиентом в списке capabilities при аутентификации.
+BINARY_FRAMES_CAPABILITY = "binary_frames"
+
+# Заголовок бинарного кадра: transfer_id (16 байт), смещение (uint64), длина данных (uint32).
+FRAME_HEADER = struct.Struct("!16sQI")
+
+
+def new_transfer_id() -> str:
+    """Генерирует идентификатор передачи (32 hex-символа)."""
+    return uuid.uuid4().hex
+
+
+def pack_frame(transfer_id: str, offset: int, data) -> bytes:
+    """Собирает бинарный кадр: заголовок и сырые байты чанка."""
+    return FRAME_HEADER.pack(bytes.fromhex(transfer_id), offset, len(data)) + data
+
+
+def unpack_frame(frame):
+    """Разбирает бинарный кадр, возвращает (transfer_id, offset, memoryview с данными)."""
+    if len(frame) < FRAME_HEADER.size:
+        raise ValueError("Бинарный кадр короче заголовка")
+    raw_id, offset, length = FRAME_HEADER.unpack_from(frame)
+    payload = memoryview(frame)[FRAME_HEADER.size:FRAME_HEADER.size + length]
+    if len(payload) != length:
+        raise ValueError(f"Длина данных кадра {len(payload)} не совпадает с заголовком {length}")
+    return raw_id.hex(), offset, payload
@@ -0,0 +1,68 @@
+import re
+
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory, PerMessageDeflate
+from websockets.frames import CTRL_OPCODES, Opcode
+
+# Сообщения меньше порога отправляются без сжатия: выигрыш меньше затрат CPU
+COMPRESSION_MIN_SIZE = 1024
+
+# Типы сообщений, которые не сжимаются: внутри уже сжатые данные (JPEG в base64)
+COMPRESSION_BYPASS_TYPES = ("screenshot_update",)
+
+# Тип сообщения: поле "type" (протокол 2) или первый ключ JSON (протокол 1)
+_MESSAGE_TYPE = re.compile(rb'\s*\{\s*"type"\s*:\s*"([^"\\]+)"|\s*\{\s*"([^"\\]+)"')
+
+
+class CompressionPolicy:
+    """
+    Решает, сжимать ли исходящее сообщение. Бинарные кадры (чанки файлов, архивы)
+    не сжимаются никогда, текстовые - только от min_size байт и если тип сообщения
+    не входит в bypass_types.
+    """
+
+    def __init__(self, min_size=COMPRESSION_MIN_SIZE, bypass_types=COMPRESSION_BYPASS_TYPES):
+        self.min_size = min_size
+        self.bypass_types = {name.encode('utf-8') for name in bypass_types}
+
+    def should_compress(self, frame):
+        if frame.opcode is not Opcode.TEXT or len(frame.data) < self.min_size:
+            return False
+        match = _MESSAGE_TYPE.match(bytes(frame.data[:256]))
+        return not (match and (match.group(1) or match.group(2)) in self.bypass_types)
+
+
+class SelectivePerMessageDeflate(PerMessageDeflate):
+    """permessage-deflate, сжимающий только сообщения, одобренные политикой (RSV1 ставится per-message)."""
+
+    def __init__(self, *args, policy, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.policy = policy
+        self.skip_message = False
+
+    def encode(self, frame):
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+        if frame.opcode is not Opcode.CONT:
+            self.skip_message = not self.policy.should_compress(frame)
+        if self.skip_message:
+            return frame
+        return super().encode(frame)
+
+
+class SelectiveDeflateFactory(ClientPerMessageDeflateFactory):
+    """Клиентская фабрика permessage-deflate с выборочным сжатием исходящих сообщений."""
+
+    def __init__(self, policy=None):
+        super().__init__(compress_settings={"memLevel": 5})
+        self.policy = policy or CompressionPolicy()
+
+    def process_response_params(self, params, accepted_extensions):
+        extension = super().process_response_params(params, accepted_extensions)
+        return SelectivePerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            policy=self.policy,
+        )
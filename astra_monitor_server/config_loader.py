@@ -10,7 +10,23 @@ DEFAULT_CONFIG = {
     "SERVER_HOST": "0.0.0.0",
     "SERVER_PORT": 8765,
     "AUTH_TOKEN": "astra_secret_token_2025",
-    "SETTINGS_FILE": "settings.json"
+    "SETTINGS_FILE": "settings.json",
+    "TRANSFER_RESUME_TIMEOUT": 300, # Сколько секунд ждать переподключения клиента для продолжения передачи
+    "ROLLOUT_CONCURRENCY": 20, # Сколько клиентов одновременно получают пакет при массовом обновлении
+    "WS_COMPRESSION_MIN_SIZE": 1024, # Сообщения меньше этого размера (в байтах) не сжимаются
+    "WS_WRITE_LIMIT": 65536, # High-water mark буфера отправки сокета (в байтах)
+    "OUTBOX_MAX_BYTES": 16777216, # Максимальный объем исходящей очереди одного клиента (в байтах)
+    "ADMISSION_RATE": 20, # Сколько новых подключений в секунду принимает сервер (остальным - retry_after)
+    "ADMISSION_BURST": 50, # Сколько подключений принимается сразу, без ограничения частоты
+    "ADMISSION_MAX_RETRY_AFTER": 120, # Верхняя граница retry_after (в секундах)
+    "SESSION_RESUME_TIMEOUT": 300, # Сколько секунд после отключения клиент может продолжить сессию по токену
+    "HEADLESS_STATS_INTERVAL": 60, # Период сводки по клиентам в логе headless-режима (в секундах, 0 - выключена)
+    "SHARD_WORKERS": 0, # Процессов-шардов в headless-режиме (SO_REUSEPORT, только Linux); 0 или 1 - один процесс
+    "FANOUT_WINDOW": 50, # На скольких клиентах одновременно выполняется команда при массовом выполнении
+    "FANOUT_TIMEOUT": 620, # Сколько секунд ждать результата команды от клиента (клиент сам прерывает задания через 600)
+    "DELTA_MAX_SIZE": 67108864, # Файлы больше этого размера (в байтах) загружаются целиком: поиск разности стоит ~1.3 с процессора на 4 МБ
+    "DELTA_MAX_LITERAL_RATIO": 0.5, # Если новых данных больше этой доли файла, поиск разности прерывается и файл загружается целиком
+    "DELTA_WORKERS": 2 # Процессов для поиска разности файлов (отдельно от event loop сервера)
 }
 
 def get_base_path():
@@ -19,6 +19,7 @@ from .widgets.screenshot_widget import ScreenshotWidget
 from .widgets.metrics_history_widget import MetricsHistoryWidget
 from .terminal_emulator import TerminalEmulator
 from .icon_utils import load_icon_from_assets
+from ..server.protocol import INVENTORY_PUSH_CAPABILITY
 
 
 class TerminalView(QTextEdit):
@@ -353,6 +354,12 @@ class ClientDetailTab(QWidget):
 
     def get_full_system_info(self):
         """Запрос полной информации о системе"""
+        inventory = self.ws_server.inventory.get(self.client_id)
+        if inventory is not None:
+            # Сохраненная инвентаризация; клиент с inventory_push сам присылает ее изменения
+            self.system_info_full_widget.update_info(inventory)
+            if self.ws_server.client_supports(self.client_id, INVENTORY_PUSH_CAPABILITY):
+                return
         future = asyncio.run_coroutine_threadsafe(
             self.ws_server.send_command(self.client_id, "get_full_system_info"), 
             self.ws_server.loop
@@ -0,0 +1,107 @@
+# astra_monitor_server/gui/client_index.py
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ClientIndex:
+    """
+    Вторичные индексы client_data: hostname -> ID, IP -> ID, тег -> ID и триграммный
+    индекс текста для поиска (hostname, IP, версия, примечание, теги).
+    Значения точных индексов - dict как упорядоченное множество: при нескольких совпадениях
+    первым остается клиент, проиндексированный раньше (как при обходе client_data).
+    Теги сравниваются без учета регистра.
+    """
+
+    def __init__(self):
+        self.hostnames = {}
+        self.ips = {}
+        self.tags = {}
+        self.trigrams = {} # триграмма -> множество client_id
+        self.texts = {} # client_id -> текст для поиска в нижнем регистре
+        self.keys = {} # client_id -> (hostname, ip, теги, версия, примечание), под которыми клиент проиндексирован
+
+    def update(self, client_id, data):
+        """
+        Переиндексирует клиента по его записи в client_data.
+        Возвращает True, если индексируемые поля изменились; иначе ничего не делает.
+        """
+        keys = (
+            data.get('hostname'),
+            data.get('ip'),
+            tuple(tag.lower() for tag in data.get('tags') or ()),
+            data.get('version'),
+            (data.get('settings') or {}).get('info_text', ''),
+        )
+        if self.keys.get(client_id) == keys:
+            return False
+        self.remove(client_id)
+        hostname, ip, tags, version, note = keys
+        if hostname:
+            self.hostnames.setdefault(hostname, {})[client_id] = None
+        if ip:
+            self.ips.setdefault(ip, {})[client_id] = None
+        for tag in tags:
+            self.tags.setdefault(tag, {})[client_id] = None
+        text = " ".join(str(value) for value in (hostname, ip, version, note, *tags) if value).lower()
+        self.texts[client_id] = text
+        for trigram in _trigrams(text):
+            self.trigrams.setdefault(trigram, set()).add(client_id)
+        self.keys[client_id] = keys
+        return True
+
+    def remove(self, client_id):
+        keys = self.keys.pop(client_id, None)
+        if keys is None:
+            return
+        hostname, ip, tags, _, _ = keys
+        self._discard(self.hostnames, hostname, client_id)
+        self._discard(self.ips, ip, client_id)
+        for tag in tags:
+            self._discard(self.tags, tag, client_id)
+        for trigram in _trigrams(self.texts.pop(client_id)):
+            client_ids = self.trigrams[trigram]
+            client_ids.discard(client_id)
+            if not client_ids:
+                del self.trigrams[trigram]
+
+    def by_hostname(self, hostname):
+        return list(self.hostnames.get(hostname, ()))
+
+    def by_ip(self, ip):
+        return list(self.ips.get(ip, ()))
+
+    def by_tag(self, tag):
+        return list(self.tags.get(tag.lower(), ()))
+
+    def search(self, terms):
+        """
+        ID клиентов, текст которых содержит все terms (в нижнем регистре).
+        Кандидатов дают пересечения триграмм самых длинных слов, подстрока проверяется только у них.
+        """
+        candidates = None
+        for term in sorted(terms, key=len, reverse=True):
+            if len(term) < 3:
+                break
+            postings = [self.trigrams.get(trigram, ()) for trigram in _trigrams(term)]
+            postings.sort(key=len)
+            found = set(postings[0])
+            for client_ids in postings[1:]:
+                found.intersection_update(client_ids)
+            candidates = found if candidates is None else candidates & found
+            if not candidates:
+                return set()
+        if candidates is None:
+            candidates = self.texts.keys()
+        return {client_id for client_id in candidates
+                if all(term in self.texts[client_id] for term in terms)}
+
+    @staticmethod
+    def _discard(index, value, client_id):
+        client_ids = index.get(value)
+        if client_ids is None:
+            return
+        client_ids.pop(client_id, None)
+        if not client_ids:
+            del index[value]
@@ -0,0 +1,100 @@
+# astra_monitor_server/gui/client_query.py
+
+import operator
+import re
+
+# Поля с подстрокой: "host:lab-0" -> запись client_data
+TEXT_FIELDS = {
+    'host': lambda data: data.get('hostname'),
+    'hostname': lambda data: data.get('hostname'),
+    'ip': lambda data: data.get('ip'),
+    'version': lambda data: data.get('version'),
+    'ver': lambda data: data.get('version'),
+    'note': lambda data: (data.get('settings') or {}).get('info_text'),
+    'status': lambda data: data.get('status'),
+}
+
+# Числовые поля для сравнений: "cpu>80"
+NUMERIC_FIELDS = {
+    'cpu': 'cpu_percent',
+    'ram': 'memory_percent',
+    'mem': 'memory_percent',
+    'disk': 'disk_percent',
+}
+
+VERSION_FIELDS = ('version', 'ver')
+
+_OPERATORS = {'>=': operator.ge, '<=': operator.le, '>': operator.gt, '<': operator.lt, '=': operator.eq}
+_COMPARISON = re.compile(r'^([a-z]+)(>=|<=|>|<|=)(.+)$')
+_FIELD = re.compile(r'^([a-z]+):(.+)$')
+
+
+def version_key(value):
+    """'26.01.3' -> (26, 1, 3): версии сравниваются по числам, а не как строки."""
+    return tuple(int(part) for part in re.findall(r'\d+', str(value or '')))
+
+
+class ClientQuery:
+    """
+    Разобранный запрос фильтра клиентов. Слова без поля ищутся подстрокой по hostname,
+    IP, версии, примечанию и тегам (через ClientIndex), tag:X - точное совпадение тега,
+    поле:значение - подстрока в поле, cpu/ram/disk/version с >, <, >=, <=, = - сравнения.
+    Все условия объединяются через И.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.terms = []
+        self.tags = []
+        self.predicates = [] # функции data -> bool, проверяются на живых данных строки
+        for token in text.lower().split():
+            if not self._parse_token(token):
+                self.terms.append(token)
+
+    def _parse_token(self, token):
+        match = _COMPARISON.match(token)
+        if match:
+            field, op, value = match.groups()
+            compare = _OPERATORS[op]
+            if field in NUMERIC_FIELDS:
+                try:
+                    limit = float(value.rstrip('%'))
+                except ValueError:
+                    return False
+                key = NUMERIC_FIELDS[field]
+                self.predicates.append(lambda data: compare(data.get(key, 0), limit))
+                return True
+            if field in VERSION_FIELDS:
+                limit = version_key(value)
+                if not limit:
+                    return False
+                self.predicates.append(lambda data: compare(version_key(data.get('version')), limit))
+                return True
+            return False
+
+        match = _FIELD.match(token)
+        if match:
+            field, value = match.groups()
+            if field == 'tag':
+                self.tags.append(value)
+                return True
+            getter = TEXT_FIELDS.get(field)
+            if getter is None:
+                return False
+            self.predicates.append(lambda data: value in str(getter(data) or '').lower())
+            return True
+        return False
+
+    def candidates(self, index):
+        """Множество ID, прошедших индексируемые условия (слова и теги), или None, если их нет."""
+        result = None
+        for tag in self.tags:
+            client_ids = set(index.by_tag(tag))
+            result = client_ids if result is None else result & client_ids
+        if self.terms:
+            found = index.search(self.terms)
+            result = found if result is None else result & found
+        return result
+
+    def matches(self, data):
+        return all(predicate(data) for predicate in self.predicates)
@@ -0,0 +1,232 @@
+# astra_monitor_server/gui/client_table_model.py
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QSortFilterProxyModel, QModelIndex, QSize
+from PyQt5.QtGui import QBrush, QColor, QIcon
+
+CLIENT_COLUMNS = ['IP адрес', 'Hostname', 'Примечание', 'Версия', 'CPU', 'RAM', 'Диск', 'Сеть (↓/↑)', 'Статус']
+STATUS_COLUMN = 8
+# Служебный столбец с текстом и скриншотом карточки: его показывает сетка, список скрывает
+CARD_COLUMN = len(CLIENT_COLUMNS)
+
+CLIENT_ID_ROLE = Qt.UserRole
+SORT_ROLE = Qt.UserRole + 1
+
+_GRAY_BRUSH = QBrush(Qt.gray)
+_STATUS_BRUSHES = {'Connected': QBrush(QColor("green")), 'Disconnected': QBrush(QColor("red"))}
+
+
+class ClientTableModel(QAbstractTableModel):
+    """
+    Общая модель списка и сетки клиентов поверх client_data. Строки в порядке подключения,
+    тексты ячеек считаются один раз в refresh_clients(), data() только отдает готовые значения.
+    """
+
+    def __init__(self, client_data, parent=None):
+        super().__init__(parent)
+        self.client_data = client_data
+        self.client_ids = []
+        self.rows = {} # client_id -> номер строки
+        self.cells = {} # client_id -> (тексты столбцов..., текст карточки)
+        self.sort_keys = {} # client_id -> {столбец: числовой ключ сортировки}
+        self.screenshots = {} # client_id -> QIcon последнего скриншота для сетки
+        self.placeholder_icon = QIcon()
+        self.card_size = QSize()
+
+    # --- Интерфейс QAbstractTableModel ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.client_ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else CARD_COLUMN + 1
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section < len(CLIENT_COLUMNS):
+            return CLIENT_COLUMNS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        client_id = self.client_ids[index.row()]
+        # Отключенные клиенты не интерактивны
+        if self.client_data.get(client_id, {}).get('status') == 'Disconnected':
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        client_id = self.client_ids[index.row()]
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            return self.cells[client_id][column]
+        if role == CLIENT_ID_ROLE:
+            return client_id
+        if role == SORT_ROLE:
+            return self.sort_keys[client_id].get(column, self.cells[client_id][column])
+
+        status = self.client_data.get(client_id, {}).get('status')
+        if role == Qt.ForegroundRole:
+            if column == STATUS_COLUMN:
+                return _STATUS_BRUSHES.get(status)
+            return _GRAY_BRUSH if status == 'Disconnected' else None
+        if column != CARD_COLUMN:
+            return None
+        if role == Qt.DecorationRole:
+            if status != 'Connected':
+                return None
+            return self.screenshots.get(client_id, self.placeholder_icon)
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignHCenter | Qt.AlignBottom
+        if role == Qt.SizeHintRole and self.card_size.isValid():
+            return self.card_size
+        return None
+
+    # --- Изменения ---
+
+    def client_id_at(self, row):
+        return self.client_ids[row]
+
+    def add_client(self, client_id):
+        if client_id in self.rows:
+            return
+        row = len(self.client_ids)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.client_ids.append(client_id)
+        self.rows[client_id] = row
+        self._compute(client_id)
+        self.endInsertRows()
+
+    def rename_client(self, old_client_id, client_id):
+        """Клиент переподключился с новым ID: строка остается на месте."""
+        row = self.rows.pop(old_client_id, None)
+        if row is None:
+            self.add_client(client_id)
+            return
+        self.client_ids[row] = client_id
+        self.rows[client_id] = row
+        self.cells[client_id] = self.cells.pop(old_client_id)
+        self.sort_keys[client_id] = self.sort_keys.pop(old_client_id)
+        screenshot = self.screenshots.pop(old_client_id, None)
+        if screenshot is not None:
+            self.screenshots[client_id] = screenshot
+        self.refresh_clients([client_id])
+
+    def refresh_clients(self, client_ids):
+        """Пересчитывает строки клиентов; об изменениях сообщается одним dataChanged на диапазон строк."""
+        changed = sorted(self.rows[cid] for cid in client_ids if cid in self.rows and self._compute(cid))
+        for first, last in self._ranges(changed):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, CARD_COLUMN))
+
+    def set_screenshot(self, client_id, icon):
+        row = self.rows.get(client_id)
+        if row is None:
+            return
+        self.screenshots[client_id] = icon
+        index = self.index(row, CARD_COLUMN)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def set_card_appearance(self, placeholder_icon, card_size):
+        """Заглушка и размер карточки сетки изменились (масштаб, тема)."""
+        self.placeholder_icon = placeholder_icon
+        self.card_size = card_size
+        if self.client_ids:
+            self.dataChanged.emit(self.index(0, CARD_COLUMN), self.index(len(self.client_ids) - 1, CARD_COLUMN),
+                                  [Qt.DecorationRole, Qt.SizeHintRole])
+
+    def _compute(self, client_id):
+        """Считает тексты ячеек клиента. Возвращает True, если строка изменилась."""
+        data = self.client_data.get(client_id, {})
+        hostname = data.get('hostname', 'N/A')
+        tags = data.get('tags', [])
+        info_text = data.get('settings', {}).get('info_text', '')
+        note_text = info_text
+        if tags:
+            tag_str = ", ".join(tags)
+            note_text = f"{info_text} | Теги: {tag_str}" if info_text else f"Теги: {tag_str}"
+        cpu_value = data.get('cpu_percent', 0)
+        mem_value = data.get('memory_percent', 0)
+        disk_value = data.get('disk_percent', 0)
+        recv_speed = data.get('bytes_recv_speed', 0)
+        sent_speed = data.get('bytes_sent_speed', 0)
+        cpu = round(cpu_value)
+        mem = round(mem_value)
+        status = data.get('status', 'Unknown')
+
+        if status == 'Connected':
+            status_text = "Подключен"
+            grid_info = f"{hostname}"
+            if info_text:
+                grid_info += f" {info_text}"
+            if tags:
+                grid_info += f"\nТеги: {', '.join(tags)}"
+            card_text = f"{grid_info}\nCPU: {cpu}% | RAM: {mem}%"
+        elif status == 'Disconnected':
+            status_text = "Отключен"
+            card_text = f"{hostname}\n(Отключен)"
+            # Скриншот отключенного клиента устарел, после переподключения снова будет заглушка
+            self.screenshots.pop(client_id, None)
+        else:
+            status_text = "Неизвестно"
+            card_text = f"{hostname}"
+
+        cells = (
+            data.get('ip', 'N/A'),
+            hostname,
+            note_text,
+            data.get('version', 'N/A'),
+            f"{cpu}%",
+            f"{mem}%",
+            f"{round(disk_value)}%",
+            f"{recv_speed / 1024:.1f} / {sent_speed / 1024:.1f} KB/s",
+            status_text,
+            card_text,
+        )
+        # Числовые столбцы сортируются по значениям, а не по строкам ("9%" > "10%")
+        self.sort_keys[client_id] = {4: cpu_value, 5: mem_value, 6: disk_value, 7: recv_speed}
+        # Статус влияет и на цвета, поэтому строка считается измененной вместе с ним
+        previous = self.cells.get(client_id)
+        self.cells[client_id] = cells
+        return previous != cells
+
+    @staticmethod
+    def _ranges(rows):
+        """Отсортированные номера строк -> непрерывные диапазоны (first, last)."""
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][1] == row - 1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        return ranges
+
+
+class ClientFilterProxyModel(QSortFilterProxyModel):
+    """
+    Фильтр и сортировка для обоих видов. Индексируемая часть запроса (слова, теги) приходит
+    готовым множеством candidates из ClientIndex; условия по метрикам проверяются на живых
+    данных строки, поэтому при dataChanged строка сама появляется или пропадает.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.query = None # ClientQuery или None - фильтр выключен
+        self.candidates = None
+        self.setSortRole(SORT_ROLE)
+        self.setDynamicSortFilter(True)
+
+    def set_filter(self, query, candidates=None):
+        self.query = query
+        self.candidates = candidates
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.query is None:
+            return True
+        model = self.sourceModel()
+        client_id = model.client_id_at(source_row)
+        if self.candidates is not None and client_id not in self.candidates:
+            return False
+        return self.query.matches(model.client_data.get(client_id, {}))
@@ -4,20 +4,18 @@ import json
 import os
 import sys
 import logging
-import time
 import base64
 import asyncio
-import hashlib
 from threading import Thread, Lock
-from collections import defaultdict, deque
+from collections import defaultdict
 
-from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTreeWidget,
+from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTreeView,
                              QPushButton, QLabel, QTextEdit, QHeaderView, QMessageBox, QInputDialog, QFileDialog,
-                             QTabWidget, QGroupBox, QAbstractItemView, QDialog, QStackedWidget, QStatusBar, QFormLayout, QSpinBox, QDialogButtonBox, QProgressDialog,
+                             QTabWidget, QGroupBox, QAbstractItemView, QDialog, QStackedWidget, QStatusBar, QFormLayout, QSpinBox, QDialogButtonBox,
                              QListWidget, QListView, QListWidgetItem, QMenu, QSystemTrayIcon, QApplication, QComboBox,
                              QLineEdit, QCheckBox, QSlider)
-from PyQt5.QtCore import pyqtSignal, Qt, QSize, QTimer, QVariant
-from PyQt5.QtGui import QPixmap, QIcon, QBrush, QColor, QPainter, QLinearGradient, QPen, QFont, QImage
+from PyQt5.QtCore import pyqtSignal, Qt, QSize, QTimer
+from PyQt5.QtGui import QPixmap, QIcon, QColor, QPainter, QLinearGradient, QPen, QFont, QImage
 try:
     from PyQt5.QtSvg import QSvgRenderer
 except ImportError:
@@ -27,10 +25,19 @@ from concurrent.futures import ThreadPoolExecutor
 # Импортируем локальные модули
 from ..config_loader import APP_CONFIG
 from ..server.websocket_server import WebSocketServer
+from .server_bridge import ServerBridge
+from ..server.broadcast_upload import BroadcastUpload
+from ..server.fanout import FanoutCommand
+from ..server.tar_stream import TarStreamExtractor
+from ..server.protocol import METRIC_MESSAGE_TYPES, SESSION_RESUME_CAPABILITY
 from .client_detail_tab import ClientDetailTab
-from .custom_items import SortableTreeWidgetItem
+from .client_index import ClientIndex
+from .client_query import ClientQuery
+from .client_table_model import ClientTableModel, ClientFilterProxyModel, CARD_COLUMN, CLIENT_ID_ROLE
 from .icon_utils import load_icon_from_assets
 from .widgets.toast import Toast
+from .widgets.transfer_queue_widget import TransferQueueWidget
+from .widgets.fanout_widget import FanoutWidget
 
 
 # --- Custom Log Handler ---
@@ -115,22 +122,24 @@ class ServerSettingsDialog(QDialog):
 
 class ServerGUI(QMainWindow):
     log_signal = pyqtSignal(str)
+    rollout_finished = pyqtSignal(dict)
+    refresh_finished = pyqtSignal(dict)
 
     def __init__(self):
         super().__init__()        
         self.client_tabs = {}  # Для хранения вкладок клиентов
-        self.tree_items = {}   # Кэш для быстрого доступа к элементам дерева по client_id
-        self.grid_items = {}   # Кэш для быстрого доступа к элементам сетки по client_id
+        self.client_data = defaultdict(dict)
+        # Индексы hostname/IP/тег -> client_id: поиск при подключении и фильтр без обхода client_data
+        self.client_index = ClientIndex()
+        # Список и сетка - два вида одной модели; поиск и сортировка - в общем прокси
+        self.client_model = ClientTableModel(self.client_data, self)
+        self.client_proxy = ClientFilterProxyModel(self)
+        self.client_proxy.setSourceModel(self.client_model)
         self.download_contexts = {} # Для скачивания файлов по частям
-        self.pending_downloads = {} # Для предварительно согласованных скачиваний
         self.client_meta = {}
         self._log_lines = []
-        self.metrics_history = defaultdict(lambda: {
-            "cpu": deque(maxlen=120),
-            "mem": deque(maxlen=120),
-            "disk": deque(maxlen=120),
-        })
-        self.scheduled_tasks = []
+        self.task_items = {} # task_id -> элемент списка задач
+        self.fanout_runs = {} # fanout_id -> FanoutCommand, который еще выполняется или ждет запуска
         self._toasts = []
         self.file_processing_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 2)
         self.load_settings()
@@ -146,8 +155,6 @@ class ServerGUI(QMainWindow):
         self.setup_logging()
         self.setup_tray_icon()
 
-        self.placeholder_icon = self._build_placeholder_icon(self.clients_grid.iconSize())
-
         self._setup_message_handlers()
         self.setup_websocket_server()
         
@@ -220,7 +227,7 @@ class ServerGUI(QMainWindow):
                     background: #e2e8f0;
                     border-radius: 6px;
                 }
-                QTreeWidget, QListWidget, QTreeView, QTableWidget {
+                QTreeWidget, QListWidget, QListView, QTreeView, QTableWidget {
                     background-color: #ffffff;
                     color: #111827;
                     border: 1px solid #e5e7eb;
@@ -459,7 +466,7 @@ class ServerGUI(QMainWindow):
                     background: #1e293b;
                     border-radius: 6px;
                 }
-                QTreeWidget, QListWidget, QTreeView, QTableWidget {
+                QTreeWidget, QListWidget, QListView, QTreeView, QTableWidget {
                     background-color: #0b1220;
                     color: #e2e8f0;
                     border: 1px solid #1f2937;
@@ -698,7 +705,7 @@ class ServerGUI(QMainWindow):
                     background: #eadfce;
                     border-radius: 6px;
                 }
-                QTreeWidget, QListWidget, QTreeView, QTableWidget {
+                QTreeWidget, QListWidget, QListView, QTreeView, QTableWidget {
                     background-color: #fffaf2;
                     color: #3f3a2f;
                     border: 1px solid #eadfce;
@@ -937,7 +944,7 @@ class ServerGUI(QMainWindow):
                     background: #2a2a2a;
                     border-radius: 6px;
                 }
-                QTreeWidget, QListWidget, QTreeView, QTableWidget {
+                QTreeWidget, QListWidget, QListView, QTreeView, QTableWidget {
                     background-color: #111111;
                     color: #e5e5e5;
                     border: 1px solid #2a2a2a;
@@ -1144,9 +1151,9 @@ class ServerGUI(QMainWindow):
         handler.setLevel(logging.INFO)
 
     def find_client_id_by_ip(self, ip_address):
-        for client_id, data in self.client_data.items():
+        for client_id in self.client_index.by_ip(ip_address):
             # Статус 'Connected' и активное соединение в WebSocket сервере
-            if data.get('ip') == ip_address and data.get('status') == 'Connected' and client_id in self.ws_server.clients:
+            if self.client_data[client_id].get('status') == 'Connected' and client_id in self.ws_server.clients:
                 return client_id
         return None
 
@@ -1155,15 +1162,21 @@ class ServerGUI(QMainWindow):
         self.message_handlers = {
             'files_list': self._handle_files_list,
             'full_system_info': self._handle_full_system_info,
+            'inventory_delta': self._handle_inventory_delta,
             'file_upload_result': self._handle_file_upload_result,
             'screenshot': self._handle_screenshot_update,
+            'screenshot_update': self._handle_periodic_screenshot,
             'file_delete_result': self._handle_file_delete_result,
             'command_result': self._handle_command_result,
             'command_error': self._handle_command_error,
+            'job_started': self._handle_job_started,
+            'job_output': self._handle_job_output,
+            'job_result': self._handle_job_result,
+            'job_cancelled': self._handle_job_cancelled,
+            'jobs_list': self._handle_jobs_list,
             'prompt_update': self._handle_prompt_update,
             'client_settings': self._handle_client_settings,
             'download_file_start': self._handle_download_start,
-            'download_file_chunk': self._handle_download_chunk,
             'download_file_end': self._handle_download_end,
             'rename_result': self._handle_rename_result,
             'apt_repo_data': self._handle_apt_repo_data,
@@ -1253,6 +1266,9 @@ class ServerGUI(QMainWindow):
         self.show_tasks_action = view_menu.addAction("Показать 'Задачи'")
         self.show_tasks_action.triggered.connect(self.show_tasks_tab)
 
+        self.show_transfers_action = view_menu.addAction("Показать 'Передачи'")
+        self.show_transfers_action.triggered.connect(self.show_transfers_tab)
+
         settings_menu = menu_bar.addMenu("Настройки")
         server_settings_action = settings_menu.addAction("Настройки сервера")
         server_settings_action.triggered.connect(self.open_server_settings)
@@ -1309,8 +1325,18 @@ class ServerGUI(QMainWindow):
         else:
             actions_layout.addWidget(QLabel("Поиск:"))
         self.client_filter_input = QLineEdit()
-        self.client_filter_input.setPlaceholderText("IP, hostname, теги...")
-        self.client_filter_input.textChanged.connect(self.filter_clients)
+        self.client_filter_input.setPlaceholderText("IP, hostname, теги... tag:lab cpu>80 version<26.01")
+        self.client_filter_input.setToolTip(
+            "Слова ищутся в hostname, IP, версии, примечании и тегах.\n"
+            "tag:имя - клиенты с тегом; host:, ip:, version:, note:, status: - подстрока в поле;\n"
+            "cpu, ram, disk, version с >, <, >=, <=, = - сравнения. Условия объединяются через И."
+        )
+        # Фильтр применяется после паузы в наборе, а не на каждое нажатие
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(250)
+        self.filter_timer.timeout.connect(self.filter_clients)
+        self.client_filter_input.textChanged.connect(lambda _text: self.filter_timer.start())
         actions_layout.addWidget(self.client_filter_input)
         clients_layout.addLayout(actions_layout)
 
@@ -1347,28 +1373,36 @@ class ServerGUI(QMainWindow):
         self.view_stack = QStackedWidget()
 
         # --- Вид "Список" (дерево) ---
-        self.clients_tree = QTreeWidget()
+        self.clients_tree = QTreeView()
+        self.clients_tree.setModel(self.client_proxy)
+        self.clients_tree.setRootIsDecorated(False)
+        # Одинаковая высота строк: вид не измеряет каждую строку, рисуются только видимые
+        self.clients_tree.setUniformRowHeights(True)
+        self.clients_tree.setColumnHidden(CARD_COLUMN, True)
         self.clients_tree.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.clients_tree.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.clients_tree.setSortingEnabled(True)
-        self.clients_tree.setHeaderLabels(['IP адрес', 'Hostname', 'Примечание','Версия', 'CPU', 'RAM', 'Диск', 'Сеть (↓/↑)', 'Статус'])
+        self.clients_tree.sortByColumn(0, Qt.AscendingOrder)
         self.clients_tree.header().setSectionResizeMode(QHeaderView.ResizeToContents)
-        self.clients_tree.itemDoubleClicked.connect(self.open_client_tab_from_double_click)
+        self.clients_tree.doubleClicked.connect(self.open_client_tab_from_double_click)
         self.clients_tree.setContextMenuPolicy(Qt.CustomContextMenu)
         self.clients_tree.customContextMenuRequested.connect(self.show_client_context_menu)
         self.view_stack.addWidget(self.clients_tree)
 
         # --- Вид "Сетка" ---
-        self.clients_grid = QListWidget()
+        self.clients_grid = QListView()
         self.clients_grid.setObjectName("clientsGrid")
+        self.clients_grid.setModel(self.client_proxy)
+        self.clients_grid.setModelColumn(CARD_COLUMN)
         self.clients_grid.setViewMode(QListView.IconMode)
-        self.clients_grid.setResizeMode(QListWidget.Fixed)
-        self.clients_grid.setMovement(QListWidget.Static)
+        self.clients_grid.setResizeMode(QListView.Fixed)
+        self.clients_grid.setMovement(QListView.Static)
         self.clients_grid.setUniformItemSizes(True)
         self.clients_grid.setIconSize(QSize(self.grid_card_size - 20, int((self.grid_card_size - 20) * 0.75)))
         self.clients_grid.setSpacing(10)
         self.clients_grid.setWordWrap(True)
         self.clients_grid.setTextElideMode(Qt.ElideRight)
-        self.clients_grid.itemDoubleClicked.connect(self.open_client_tab_from_double_click)
+        self.clients_grid.doubleClicked.connect(self.open_client_tab_from_double_click)
         self.clients_grid.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.clients_grid.setContextMenuPolicy(Qt.CustomContextMenu)
         self.clients_grid.customContextMenuRequested.connect(self.show_client_context_menu)
@@ -1431,6 +1465,15 @@ class ServerGUI(QMainWindow):
         self.task_add_btn = QPushButton("Запланировать")
         self.task_add_btn.clicked.connect(self.add_scheduled_task)
         tasks_form.addWidget(self.task_add_btn)
+        tasks_form.addWidget(QLabel("Одновременно:"))
+        self.fanout_window_input = QSpinBox()
+        self.fanout_window_input.setRange(1, 1000)
+        self.fanout_window_input.setValue(APP_CONFIG.get('FANOUT_WINDOW', 50))
+        self.fanout_window_input.setToolTip("На скольких клиентах команда выполняется одновременно")
+        tasks_form.addWidget(self.fanout_window_input)
+        self.task_run_btn = QPushButton("Выполнить сейчас")
+        self.task_run_btn.clicked.connect(self.run_fanout_now)
+        tasks_form.addWidget(self.task_run_btn)
         tasks_form.addStretch()
 
         self.tasks_list = QListWidget()
@@ -1438,6 +1481,16 @@ class ServerGUI(QMainWindow):
         tasks_layout.addWidget(QLabel("Очередь задач:"))
         tasks_layout.addWidget(self.tasks_list)
         
+        # 4. Вкладка очереди передач файлов (добавляется при первой передаче)
+        self.transfer_queue = TransferQueueWidget()
+        self.transfer_queue.active_count_changed.connect(self._update_transfers_tab_title)
+
+        # 5. Вкладка результатов массового выполнения (добавляется при первом запуске)
+        self.fanout_view = FanoutWidget(self._client_label)
+        self.fanout_view.fanout_progress.connect(self._on_fanout_progress)
+        self.fanout_view.cancel_requested.connect(self._cancel_fanout)
+        self.fanout_view.active_count_changed.connect(self._update_fanout_tab_title)
+
         # Добавляем вкладки
         self.tabs.addTab(self.clients_list_tab, "Клиенты")
         self.tabs.addTab(self.log_view_tab, "Системный лог")
@@ -1446,18 +1499,17 @@ class ServerGUI(QMainWindow):
         
         main_layout.addWidget(self.tabs)
         
-        # Client data storage
-        self.client_data = defaultdict(dict)
+        # Отложенное обновление строк списка и карточек сетки: не чаще раза в 250 мс
+        self.dirty_clients = set()
+        self.items_refresh_timer = QTimer(self)
+        self.items_refresh_timer.setSingleShot(True)
+        self.items_refresh_timer.setInterval(250)
+        self.items_refresh_timer.timeout.connect(self._refresh_dirty_items)
 
         # Таймер для обновления скриншотов в сетке
         self.grid_refresh_timer = QTimer(self)
         self.grid_refresh_timer.timeout.connect(self.request_grid_screenshots)
 
-        # Таймер проверки задач
-        self.tasks_timer = QTimer(self)
-        self.tasks_timer.timeout.connect(self.process_scheduled_tasks)
-        self.tasks_timer.start(1000)
-
     def _set_app_icon(self):
         """
         Загружает иконку приложения.
@@ -1605,6 +1657,18 @@ class ServerGUI(QMainWindow):
                 index = self.tabs.indexOf(self.log_view_tab)
                 if index != -1:
                     self.tabs.setTabIcon(index, icon)
+        if hasattr(self, "transfer_queue"):
+            icon = load_icon_from_assets("download.svg", accent, size=16)
+            if not icon.isNull():
+                index = self.tabs.indexOf(self.transfer_queue)
+                if index != -1:
+                    self.tabs.setTabIcon(index, icon)
+        if hasattr(self, "fanout_view"):
+            icon = load_icon_from_assets("terminal.svg", accent, size=16)
+            if not icon.isNull():
+                index = self.tabs.indexOf(self.fanout_view)
+                if index != -1:
+                    self.tabs.setTabIcon(index, icon)
 
     def toggle_visibility(self):
         """Переключает видимость главного окна."""
@@ -1686,8 +1750,7 @@ class ServerGUI(QMainWindow):
         if widget is None:
             return
 
-        item = widget.itemAt(position)
-        if not item:
+        if not widget.indexAt(position).isValid():
             return
 
         selected_ids = self.get_selected_client_ids()
@@ -1769,9 +1832,15 @@ class ServerGUI(QMainWindow):
         QApplication.instance().quit()
 
     def setup_websocket_server(self):
-        self.ws_server.new_connection.connect(self.handle_new_connection)
-        self.ws_server.connection_lost.connect(self.handle_connection_lost)
-        self.ws_server.new_message.connect(self.handle_new_message)
+        # GUI - один из потребителей ядра сервера: события приходят в поток GUI через мост
+        self.server_events = ServerBridge(self.ws_server, self)
+        self.server_events.new_connection.connect(self.handle_new_connection)
+        self.server_events.connection_lost.connect(self.handle_connection_lost)
+        self.server_events.messages_ready.connect(self.handle_messages)
+        self.server_events.task_fired.connect(self._on_task_fired)
+        self.rollout_finished.connect(self._on_rollout_finished)
+        self.refresh_finished.connect(self._on_refresh_finished)
+        self._update_screenshot_interest()
         
         self.server_thread = Thread(target=self.ws_server.start_server, daemon=True)
         self.server_thread.start()
@@ -1783,12 +1852,16 @@ class ServerGUI(QMainWindow):
         ip_address = connection_data.get('client_ip') or client_id.split(':')[0]
         hostname = client_info.get('hostname', 'N/A')
 
+        if connection_data.get('resumed') and client_id in self.client_data:
+            self._resume_client_session(client_id, client_info, ip_address)
+            return
+
         # --- Проверка на дубликат по hostname ---
         if hostname:
-            for cid, cdata in self.client_data.items():
+            for cid in self.client_index.by_hostname(hostname):
                 # Проверяем, что это не тот же самый client_id (на случай быстрой переподключки)
                 # и что найденный клиент действительно активен.
-                if cid != client_id and cdata.get('hostname') == hostname and cdata.get('status') == 'Connected':
+                if cid != client_id and self.client_data[cid].get('status') == 'Connected':
                     logging.warning(
                         f"Отклонено новое подключение от {ip_address} с hostname '{hostname}', "
                         f"т.к. клиент с таким именем уже подключен (ID: {cid})."
@@ -1808,18 +1881,12 @@ class ServerGUI(QMainWindow):
         # Новая сессия всегда приоритетнее, поэтому ищем любого клиента с таким hostname,
         # даже если он еще числится подключенным (старая сессия могла "зависнуть").
         if not old_client_id and hostname:
-            for cid, cdata in self.client_data.items():
-                if cdata.get('hostname') == hostname:
-                    old_client_id = cid
-                    break
+            old_client_id = next(iter(self.client_index.by_hostname(hostname)), None)
         
         # Если по hostname не нашли, пробуем по IP. Менее надежно, но лучше чем ничего.
+        # Статус не важен, новая сессия с этого IP главнее.
         if not old_client_id and ip_address:
-            for cid, cdata in self.client_data.items():
-                # Статус не важен, новая сессия с этого IP главнее.
-                if cdata.get('ip') == ip_address:
-                    old_client_id = cid
-                    break
+            old_client_id = next(iter(self.client_index.by_ip(ip_address)), None)
 
         if old_client_id:
             # --- Клиент переподключился ---
@@ -1828,6 +1895,7 @@ class ServerGUI(QMainWindow):
             # 1. Переносим данные в новую запись, сохраняя настройки
             old_settings = self.client_data[old_client_id].get('settings', {})
             del self.client_data[old_client_id]
+            self.client_index.remove(old_client_id)
             
             self.client_data[client_id] = { 'status': 'Connected', 'ip': ip_address, 'settings': old_settings }
             self.client_data[client_id].update(client_info)
@@ -1835,16 +1903,9 @@ class ServerGUI(QMainWindow):
                 self.client_meta[client_id] = self.client_meta.pop(old_client_id)
             self.client_data[client_id]['tags'] = self.client_meta.get(client_id, {}).get('tags', [])
 
-            # 2. Обновляем ссылку на элемент дерева
-            item = self.tree_items.pop(old_client_id)
-            item.client_id = client_id
-            self.tree_items[client_id] = item
-
-            # 3. Обновляем ссылку на элемент сетки
-            grid_item = self.grid_items.pop(old_client_id, None)
-            if grid_item:
-                grid_item.setData(Qt.UserRole, client_id)
-                self.grid_items[client_id] = grid_item
+            # 2. Строка клиента в модели остается на месте, меняется только ID
+            self.dirty_clients.discard(old_client_id)
+            self.client_model.rename_client(old_client_id, client_id)
 
         else:
             # --- Новый клиент ---
@@ -1852,23 +1913,47 @@ class ServerGUI(QMainWindow):
             self.client_data[client_id] = { 'status': 'Connected', 'ip': ip_address, 'settings': {} }
             self.client_data[client_id].update(client_info)
             self.client_data[client_id]['tags'] = self.client_meta.get(client_id, {}).get('tags', [])
-            # Создаем для него элементы в GUI
-            self._create_gui_items_for_client(client_id)
+            # Добавляем строку в модель списка и сетки
+            self.client_model.add_client(client_id)
 
+        self._reindex_client(client_id)
         self.update_tree_item(client_id)
         self.update_clients_count()
-        # Запрашиваем актуальные настройки у клиента
-        asyncio.run_coroutine_threadsafe(
-            self.ws_server.send_command(client_id, "get_settings"),
-            self.ws_server.loop
-        )
+        self._resume_downloads(old_client_id or client_id, client_id)
+        # Клиент с сессиями присылает настройки сам (при аутентификации или по запросу сервера)
+        if SESSION_RESUME_CAPABILITY not in (client_info.get('capabilities') or []):
+            # Запрашиваем актуальные настройки у клиента
+            asyncio.run_coroutine_threadsafe(
+                self.ws_server.send_command(client_id, "get_settings"),
+                self.ws_server.loop
+            )
+
+    def _resume_client_session(self, client_id, client_info, ip_address):
+        """
+        Клиент продолжил сессию по токену: запись, метрики, история и строка списка остаются
+        как были, обновляются только статус и переданные поля. Изменившиеся настройки
+        клиент пришлет отдельным сообщением client_settings.
+        """
+        logging.info(f"Клиент '{client_info.get('hostname', client_id)}' продолжил сессию ({client_id})")
+        record = self.client_data[client_id]
+        record.update(client_info)
+        record['status'] = 'Connected'
+        record['ip'] = ip_address
+        self._reindex_client(client_id)
+        self.update_tree_item(client_id)
+        self.update_clients_count()
+        self._resume_downloads(client_id, client_id)
         
     def handle_connection_lost(self, client_id):
         hostname = self.client_data.get(client_id, {}).get('hostname', client_id)
         logging.warning(f"[Отключение] {client_id} ({hostname})")
         if client_id in self.client_data:
             self.client_data[client_id]['status'] = 'Disconnected'
+            # Запись остается в списке: по hostname/IP ее найдет переподключение
+            self._reindex_client(client_id)
             self.update_tree_item(client_id)
+
+        self._suspend_downloads(client_id)
         
         # Закрываем вкладку, если она была открыта для этого клиента
         if client_id in self.client_tabs:
@@ -1878,29 +1963,38 @@ class ServerGUI(QMainWindow):
         
         self.update_clients_count()
         
+    def handle_messages(self, batch):
+        """Пачка сообщений от MessageRouter: метрики уже слиты, история посчитана в потоке event loop."""
+        for data in batch:
+            self.handle_new_message(data)
+
     def handle_new_message(self, data):
         client_id = data.get('client_id', 'unknown')
         if client_id == 'unknown' or client_id not in self.client_data:
             return
         
-        if 'error' in data:
+        msg_type = data.get('type')
+        if msg_type == 'error':
             client_ip = self.client_data[client_id].get('ip')
             logging.error(f"Ошибка от {client_ip}: {data['error']}")
+            if data.get('transfer_id'):
+                self._abort_download_by_transfer_id(data['transfer_id'])
             return
-        
-        # Обновляем данные клиента и главный список
-        self.client_data[client_id].update(data)
-        self._update_history(client_id, data)
-        self.update_tree_item(client_id)
-        
-        # Делегирование обработки конкретным методам через диспетчер
-        for msg_type, handler in self.message_handlers.items():
-            if msg_type in data:
-                handler(client_id, data)
 
-        # Обновляем открытую вкладку клиента
-        if client_id in self.client_tabs:
-            self.client_tabs[client_id].update_client_data(data)
+        # Данные клиента и главный список обновляют только сообщения с метриками
+        if msg_type in METRIC_MESSAGE_TYPES:
+            self.client_data[client_id].update(data)
+            # hostname приходит и с метриками; без изменений ключей переиндексации нет
+            self._reindex_client(client_id)
+            self._update_history(client_id, data)
+            self.update_tree_item(client_id)
+            if client_id in self.client_tabs:
+                self.client_tabs[client_id].update_client_data(data)
+            return
+
+        handler = self.message_handlers.get(msg_type)
+        if handler:
+            handler(client_id, data)
 
     # --- Новые приватные обработчики сообщений ---
 
@@ -1923,18 +2017,22 @@ class ServerGUI(QMainWindow):
         if client_id in self.client_tabs:
             self.client_tabs[client_id].system_info_full_widget.update_info(data['full_system_info'])
 
+    def _handle_inventory_delta(self, client_id, data):
+        # data['inventory'] - инвентаризация клиента после применения разности (см. InventoryStore)
+        if client_id in self.client_tabs:
+            self.client_tabs[client_id].system_info_full_widget.update_info(data['inventory'])
+
     def _handle_screenshot_update(self, client_id, data):
         """Обрабатывает входящий скриншот для сетки и детальной вкладки."""
         # Обновляем иконку в сетке
-        grid_item = self.grid_items.get(client_id)
-        if grid_item and self.view_stack.currentIndex() == 1:
+        if self.view_stack.currentIndex() == 1:
             logging.info(f"Получен скриншот для сетки от {self.client_data[client_id].get('hostname', client_id)}")
             try:
                 img_data = base64.b64decode(data['screenshot'])
                 pixmap = QPixmap()
                 pixmap.loadFromData(img_data)
                 if not pixmap.isNull():
-                    grid_item.setIcon(QIcon(pixmap))
+                    self.client_model.set_screenshot(client_id, QIcon(pixmap))
             except Exception as e:
                 logging.warning(f"Ошибка обновления скриншота в сетке для %s: %s", client_id, e)
 
@@ -1944,7 +2042,13 @@ class ServerGUI(QMainWindow):
                 data['screenshot'], data['quality'], data['timestamp']
             )
 
+    def _handle_periodic_screenshot(self, client_id, data):
+        """Скриншот, который клиент отправляет сам по таймеру: данные вложены в 'screenshot_update'."""
+        self._handle_screenshot_update(client_id, data['screenshot_update'])
+
     def _handle_file_upload_result(self, client_id, data):
+        if data['file_upload_result'] == 'started':
+            return # промежуточный ответ на начало загрузки
         if data['file_upload_result'] == 'success':
             msg = "Файл успешно загружен на клиент."
         else:
@@ -1968,6 +2072,34 @@ class ServerGUI(QMainWindow):
         if client_id in self.client_tabs:
             self.client_tabs[client_id].append_to_terminal(f"Ошибка: {data['command_error']}")
 
+    def _handle_job_started(self, client_id, data):
+        job = data['job_started']
+        self._log_to_client_or_system(client_id, f"Задание {job['job_id'][:8]} запущено: {job['command']}")
+
+    def _handle_job_output(self, client_id, data):
+        if client_id in self.client_tabs:
+            self.client_tabs[client_id].append_to_terminal(data['job_output']['data'])
+
+    def _handle_job_result(self, client_id, data):
+        job = data['job_result']
+        if job.get('error'):
+            status = job['error']
+        else:
+            status = f"код возврата {job.get('exit_code')}"
+        if client_id in self.client_tabs and (job.get('error') or job.get('exit_code')):
+            self.client_tabs[client_id].append_to_terminal(f"\n[{status}]\n")
+        self._log_to_client_or_system(client_id, f"Задание {job['job_id'][:8]} завершено ({status}): {job['command']}")
+
+    def _handle_job_cancelled(self, client_id, data):
+        self._log_to_client_or_system(client_id, f"Задание {data['job_cancelled']['job_id'][:8]} отменяется")
+
+    def _handle_jobs_list(self, client_id, data):
+        jobs = data['jobs_list']
+        if not jobs:
+            self._log_to_client_or_system(client_id, "Нет выполняющихся заданий")
+        for job in jobs:
+            self._log_to_client_or_system(client_id, f"Задание {job['job_id'][:8]} ({job['status']}): {job['command']}")
+
     def _handle_prompt_update(self, client_id, data):
         self._log_to_client_or_system(client_id, f"Директория изменена на: {data['prompt_update']}")
         if client_id in self.client_tabs:
@@ -1975,6 +2107,9 @@ class ServerGUI(QMainWindow):
 
     def _handle_client_settings(self, client_id, data):
         self.client_data[client_id]['settings'] = data['client_settings']
+        # Примечание (info_text) видно в списке и участвует в поиске
+        self._reindex_client(client_id)
+        self.update_tree_item(client_id)
         self._log_to_client_or_system(client_id, "Получены и применены настройки от клиента.")
 
     def _handle_rename_result(self, client_id, data):
@@ -2046,54 +2181,157 @@ class ServerGUI(QMainWindow):
         context_key = (client_id, remote_path)
         context = self.download_contexts.get(context_key)
         # Проверяем, что контекст существует и что загрузка не была уже завершена.
-        # Это предотвращает удаление файла, если диалог закрывается после успешного завершения.
+        # Это предотвращает удаление файла, если отмена приходит после успешного завершения.
         if not context or context.get('finished', False):
             return
 
         logging.warning(f"Отмена скачивания файла {remote_path} от клиента {client_id}.")
 
         # 1. Отправляем команду отмены клиенту
+        transfer_id = context.get('transfer_id')
+        if transfer_id:
+            command = f"transfer:download_cancel:{json.dumps({'transfer_id': transfer_id, 'path': remote_path})}"
+        else:
+            command = f"cancel_download:{remote_path}"
         asyncio.run_coroutine_threadsafe(
-            self.ws_server.send_command(client_id, f"cancel_download:{remote_path}"),
+            self.ws_server.send_command(client_id, command),
             self.ws_server.loop
         )
 
         # 2. Закрываем и удаляем все серверные ресурсы
-        context['progress_timer'].stop()
-        with context['lock']:
-            if not context['handle'].closed:
-                context['handle'].close()
-        self.download_contexts.pop(context_key, None) # Удаляем до попытки удаления файла
+        self._drop_download_context(context_key)
         self._remove_partial_file(context['path'], client_id)
+        self.transfer_queue.finish_transfer(context['row'], False, "Отменено")
 
-    def register_pending_download(self, client_id, remote_path, local_path):
-        """Регистрирует ожидаемое скачивание файла."""
+    def register_pending_download(self, client_id, remote_path, local_path, transfer_id=None, unpack_compression=None):
+        """
+        Регистрирует ожидаемое скачивание файла. Контекст создается сразу: кадры и чанки
+        принимаются в потоке event loop и могут прийти раньше, чем GUI обработает download_file_start.
+        unpack_compression задается для директории, которую нужно распаковать в local_path
+        по мере получения tar-потока.
+        """
         context_key = (client_id, remote_path)
-        self.pending_downloads[context_key] = local_path
+        row_key = self._download_row_key(client_id, remote_path, transfer_id)
+        if transfer_id:
+            handle = TarStreamExtractor(local_path, unpack_compression) if unpack_compression else None
+            context = self._new_download_context(local_path, row_key, handle)
+            context['transfer_id'] = transfer_id
+            context['unpack'] = handle is not None
+            context['key'] = context_key
+            self.download_contexts[context_key] = context
+            self.ws_server.register_transfer_sink(
+                transfer_id, lambda offset, data, c=context: self._write_download_frame(c, offset, data)
+            )
+            # Ключ берется из контекста: после переподключения client_id может измениться
+            cancel_callback = lambda c=context: self._cancel_download(*c['key'])
+        else:
+            context = self._new_download_context(local_path, row_key)
+            context['key'] = context_key
+            self.download_contexts[context_key] = context
+            self.ws_server.router.register_chunk_sink(
+                client_id, remote_path, lambda chunk_b64, c=context: self._queue_download_chunk(c, chunk_b64)
+            )
+            cancel_callback = lambda: self._cancel_download(client_id, remote_path)
+        self.transfer_queue.add_transfer(row_key, "download", self._client_label(client_id),
+                                         remote_path, cancel_callback=cancel_callback)
+        self._show_transfers_tab(activate=False)
         logging.info(f"Ожидание скачивания {remote_path} от {client_id} в {local_path}")
 
+    def _new_download_context(self, local_path, row_key, handle=None):
+        return {
+            'handle': handle or open(local_path, 'wb'),
+            'path': local_path,
+            'lock': Lock(),
+            'expected_size': 0,
+            'received_size': 0,
+            'last_logged_progress': -1,
+            'progress_timer': None,
+            'row': row_key, # Ключ строки в очереди передач
+            'finished': False, # Флаг для предотвращения двойной обработки
+        }
+
+    @staticmethod
+    def _download_row_key(client_id, remote_path, transfer_id):
+        return transfer_id or f"{client_id}|{remote_path}"
+
+    def _client_label(self, client_id):
+        data = self.client_data.get(client_id, {})
+        return data.get('hostname') or data.get('ip') or client_id
+
+    def _suspend_downloads(self, client_id):
+        """Приостанавливает бинарные скачивания отключившегося клиента, сохраняя частичные файлы."""
+        if client_id in self.ws_server.clients:
+            return # Ошибка отправки без фактического разрыва соединения
+        for context_key, context in list(self.download_contexts.items()):
+            cid, remote_path = context_key
+            if cid != client_id or not context.get('transfer_id') or context.get('finished'):
+                continue
+            if context.get('stream'):
+                # Архив директории формируется на лету и не может быть продолжен с середины
+                self._drop_download_context(context_key)
+                self._remove_partial_file(context['path'], client_id)
+                self.transfer_queue.finish_transfer(context['row'], False, "Соединение потеряно")
+                continue
+            context['suspended'] = True
+            self.transfer_queue.set_status(context['row'], "Ожидание переподключения")
+            logging.info(f"Скачивание {remote_path} от {client_id} приостановлено на {context['received_size']} байт.")
+
+    def _resume_downloads(self, old_client_id, client_id):
+        """Запрашивает у переподключившегося клиента продолжение прерванных скачиваний."""
+        chunk_size = self.websocket_chunk_size_mb * 1024 * 1024
+        for context_key, context in list(self.download_contexts.items()):
+            if context_key[0] != old_client_id or not context.get('suspended'):
+                continue
+            remote_path = context_key[1]
+            new_key = (client_id, remote_path)
+            if new_key != context_key:
+                self.download_contexts[new_key] = self.download_contexts.pop(context_key)
+            context['key'] = new_key
+
+            # Отбрасываем возможный хвост незаписанных данных и продолжаем с последнего принятого байта
+            with context['lock']:
+                offset = context['received_size']
+                context['handle'].flush()
+                context['handle'].truncate(offset)
+                context['handle'].seek(offset)
+
+            params = {"transfer_id": context['transfer_id'], "path": remote_path,
+                      "chunk_size": chunk_size, "offset": offset}
+            asyncio.run_coroutine_threadsafe(
+                self.ws_server.send_command(client_id, f"transfer:download_start:{json.dumps(params)}"),
+                self.ws_server.loop
+            )
+            self._log_client_action(client_id, f"[Загрузка] Запрошено продолжение скачивания '{remote_path}' с {offset / 1024 / 1024:.2f} MB.",
+                                     f"Продолжение скачивания {remote_path} от {client_id} с {offset} байт.")
+
+    def _drop_download_context(self, context_key):
+        """Останавливает таймер, закрывает файл и удаляет контекст скачивания."""
+        context = self.download_contexts.pop(context_key, None)
+        if not context:
+            return None
+        if context.get('transfer_id'):
+            self.ws_server.unregister_transfer_sink(context['transfer_id'])
+        else:
+            self.ws_server.router.unregister_chunk_sink(*context_key)
+        if context.get('progress_timer'):
+            context['progress_timer'].stop()
+        if context.get('unpack'):
+            # close() распаковщика ждет окончания распаковки (thread.join) - не в потоке GUI
+            context['closing'] = self.file_processing_executor.submit(context['handle'].close)
+            return context
+        with context['lock']:
+            if not context['handle'].closed:
+                context['handle'].close()
+        return context
+
     def update_download_progress(self, context_key):
-        """Обновляет диалог прогресса скачивания."""
+        """Обновляет прогресс скачивания в очереди передач."""
         context = self.download_contexts.get(context_key)
         if not context:
             return
 
-        progress_dialog = context.get('progress_dialog')
-        if not progress_dialog:
-            return
-
-        with context['lock']:
-            received = context['received_size']
-            total = context['expected_size']
-        
-        if total > 0:
-            percent = int(received * 100 / total)
-            progress_dialog.setValue(percent)
-        
-        progress_dialog.setLabelText(
-            f"Скачивание файла '{os.path.basename(context['path'])}' ભ...\n"
-            f"{received / 1024 / 1024:.2f} MB / {total / 1024 / 1024:.2f} MB"
-        )
+        # Без context['lock']: запись в распаковщик может ждать под ней, пока распаковка отстает
+        self.transfer_queue.update_transfer(context['row'], context['received_size'], context['expected_size'])
 
     def _handle_download_start(self, client_id, data):
         """Начало скачивания файла с клиента."""
@@ -2104,44 +2342,53 @@ class ServerGUI(QMainWindow):
             remote_path = info['path']
             context_key = (client_id, remote_path)
 
-            # Получаем пред-согласованный путь сохранения
-            local_path = self.pending_downloads.pop(context_key, None)
-            if not local_path:
+            # Контекст создан при регистрации скачивания
+            context = self.download_contexts.get(context_key)
+            if context is None:
                 logging.error(f"Получено начало скачивания для {remote_path} от {client_id}, но путь не был согласован.")
                 return
+            context['key'] = context_key
+            context['expected_size'] = filesize
+            context['stream'] = bool(info.get('stream'))
+
+            if context.get('progress_timer'):
+                # Клиент продолжил прерванную передачу после переподключения
+                context['suspended'] = False
+                self.transfer_queue.set_status(context['row'], "Передача")
+                self._log_client_action(client_id, f"[Загрузка] Скачивание файла '{filename}' продолжено с {int(info.get('offset', 0)) / 1024 / 1024:.2f} MB.", "")
+                return
 
-            # Создаем модальный диалог прогресса
-            progress_dialog = QProgressDialog(f"Подготовка к скачиванию '{filename}'...", "Отмена", 0, 100, self)
-            progress_dialog.setWindowModality(Qt.WindowModal)
-            progress_dialog.setWindowTitle("Скачивание файла")
-            progress_dialog.setValue(0)
-            progress_dialog.setAutoClose(False)
-            progress_dialog.setAutoReset(False)
-            # Подключаем сигнал отмены
-            progress_dialog.canceled.connect(lambda: self._cancel_download(client_id, remote_path))
-            progress_dialog.show()
-
-            # Таймер для обновления UI
+            # Таймер для обновления прогресса в очереди передач
             timer = QTimer(self)
-            timer.timeout.connect(lambda: self.update_download_progress(context_key))
+            timer.timeout.connect(lambda c=context: self.update_download_progress(c['key']))
             timer.start(250) # Обновление 4 раза в секунду
 
-            self.download_contexts[context_key] = {
-                'handle': open(local_path, 'wb'),
-                'path': local_path,
-                'lock': Lock(),
-                'expected_size': filesize,
-                'received_size': 0,
-                'last_logged_progress': -1,
-                'progress_dialog': progress_dialog,
-                'progress_timer': timer,
-                'finished': False, # Флаг для предотвращения двойной обработки
-            }
+            context['progress_timer'] = timer
+            self.transfer_queue.update_transfer(context['row'], 0, filesize)
             self._log_client_action(client_id, f"[Загрузка] Началось скачивание файла '{filename}' ({filesize / 1024 / 1024:.2f} MB).", "")
         except Exception as e:
             self._log_client_action(client_id, f"Ошибка начала скачивания: {e}", f"Ошибка начала скачивания от {client_id}: {e}")
-            if 'progress_dialog' in locals():
-                progress_dialog.close()
+
+    def _write_download_frame(self, context, offset, data):
+        """Записывает бинарный кадр по его смещению (вызывается в пуле потоков event loop)."""
+        if context.get('unpack'):
+            # Кадры приходят по порядку, а write() распаковщика блокируется, пока распаковка
+            # отстает: под context['lock'] это ожидание остановило бы таймер прогресса GUI
+            handle = context['handle']
+            if handle.closed:
+                return
+            if handle.tell() != offset:
+                handle.seek(offset)
+            handle.write(data)
+            context['received_size'] += len(data)
+            return
+        with context['lock']:
+            if context['handle'].closed:
+                return
+            if context['handle'].tell() != offset:
+                context['handle'].seek(offset)
+            context['handle'].write(data)
+            context['received_size'] += len(data)
 
     def _process_download_chunk(self, context, chunk_b64):
         """Обрабатывает чанк в фоновом потоке (декодирование и запись)."""
@@ -2157,25 +2404,16 @@ class ServerGUI(QMainWindow):
                 if not context['handle'].closed:
                     context['handle'].close()
 
-    def _handle_download_chunk(self, client_id, data):
-        """Прием очередного чанка файла и передача в фоновый обработчик."""
-        chunk_info = data['download_file_chunk']
-        remote_path = chunk_info['path']
-        context_key = (client_id, remote_path)
-
-        context = self.download_contexts.get(context_key)
-        if not context:
-            return
-
-        # Добавляем 'futures' при первом чанке
+    def _queue_download_chunk(self, context, chunk_b64):
+        """
+        Прием base64-чанка прежнего протокола (вызывается маршрутизатором в потоке event loop):
+        декодирование и запись выполняются в фоновом пуле.
+        """
         if 'futures' not in context:
             context['futures'] = []
-
-        future = self.file_processing_executor.submit(self._process_download_chunk, context, chunk_info['data'])
+        future = self.file_processing_executor.submit(self._process_download_chunk, context, chunk_b64)
         context['futures'].append(future)
 
-        # Логирование прогресса убрано отсюда, т.к. теперь есть диалог
-
     def _handle_download_end(self, client_id, data):
         """Завершение скачивания файла: ожидает завершения всех обработчиков."""
         end_info = data['download_file_end']
@@ -2183,37 +2421,34 @@ class ServerGUI(QMainWindow):
         context_key = (client_id, remote_path)
 
         context = self.download_contexts.get(context_key)
-        if not context or 'futures' not in context:
+        if not context:
             return
+        if 'size' in end_info:
+            # Размер потокового архива становится известен только в конце передачи
+            context['expected_size'] = int(end_info['size'])
 
         def check_completion():
-            if all(f.done() for f in context['futures']):
+            if all(f.done() for f in context.get('futures', [])):
                 self._finalize_and_cleanup(context, client_id, context_key)
             else:
                 QTimer.singleShot(200, check_completion)
 
         check_completion()
 
-    def _create_gui_items_for_client(self, client_id):
-        """Создает элементы GUI (для списка и сетки) для нового клиента."""
-        # Элемент для дерева
-        tree_item = SortableTreeWidgetItem(self.clients_tree)
-        tree_item.client_id = client_id
-        self.tree_items[client_id] = tree_item
-
-        # Элемент для сетки
-        grid_item = QListWidgetItem()
-        grid_item.setIcon(self.placeholder_icon)
-        grid_item.setData(Qt.UserRole, client_id)
-        grid_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignBottom)
-        grid_item.setSizeHint(QSize(self.grid_card_size, int(self.grid_card_size * 1.2)))
-        self.clients_grid.addItem(grid_item)
-        self.grid_items[client_id] = grid_item
+    def _abort_download_by_transfer_id(self, transfer_id):
+        """Удаляет контекст и частичный файл скачивания, которое клиент не смог выполнить."""
+        for context_key, context in list(self.download_contexts.items()):
+            if context.get('transfer_id') == transfer_id:
+                self._drop_download_context(context_key)
+                self._remove_partial_file(context['path'], context_key[0])
+                self.transfer_queue.finish_transfer(context['row'], False, "Ошибка на стороне клиента")
+                return
 
     def _remove_partial_file(self, file_path, client_id_for_log=None):
         """Безопасное удаление частично скачанного/загруженного файла."""
         try:
-            if os.path.exists(file_path):
+            # Частично распакованную директорию не удаляем: в ней могут быть файлы пользователя
+            if os.path.isfile(file_path):
                 os.remove(file_path)
                 self._log_client_action(client_id_for_log, f"[Очистка] Частично переданный файл '{os.path.basename(file_path)}' удален.", "")
         except OSError as e:
@@ -2224,122 +2459,74 @@ class ServerGUI(QMainWindow):
         # Устанавливаем флаг, что обработка завершена, чтобы избежать вызова отмены.
         context['finished'] = True
 
-        # Останавливаем таймер и получаем диалог
-        context['progress_timer'].stop()
-        progress_dialog = context.get('progress_dialog')
+        # Останавливаем таймер и закрываем файл
+        self._drop_download_context(context_key)
+        self._report_download_result(context, client_id)
 
-        with context['lock']:
-            if not context['handle'].closed:
-                context['handle'].close()
-            final_size = context['received_size']
+    def _report_download_result(self, context, client_id):
+        """Итог скачивания; для архива - после того, как распаковка дойдет до конца."""
+        closing = context.get('closing')
+        if closing is not None and not closing.done():
+            QTimer.singleShot(200, lambda: self._report_download_result(context, client_id))
+            return
+        final_size = context['received_size']
 
         expected_size = context['expected_size']
         path = context['path']
-
-        if final_size != expected_size:
+        unpack_error = context['handle'].error if context.get('unpack') else None
+
+        if unpack_error:
+            msg = f"Ошибка распаковки архива в '{path}': {unpack_error}"
+            self._log_client_action(client_id, msg, msg)
+            self.transfer_queue.finish_transfer(context['row'], False, "Ошибка распаковки")
+            self.show_toast(msg, level="error", duration_ms=6000)
+        elif final_size != expected_size:
             msg = f"Ошибка: размер файла не совпадает. Ожидалось {expected_size}, получено {final_size}. Файл '{os.path.basename(path)}' может быть поврежден."
-            self._log_client_action(client_id, msg, "")
-            if progress_dialog:
-                progress_dialog.close()
-            QMessageBox.critical(self, "Ошибка скачивания", msg)
+            self._log_client_action(client_id, msg, msg)
+            self.transfer_queue.finish_transfer(context['row'], False, "Размер не совпадает")
+            self.show_toast(msg, level="error", duration_ms=6000)
             self._remove_partial_file(path) # Удаляем поврежденный файл
         else:
-            msg = f"Файл '{os.path.basename(path)}' успешно скачан."
+            skipped = context['handle'].skipped if context.get('unpack') else []
+            if skipped:
+                names = ", ".join(skipped[:10]) + (f" и еще {len(skipped) - 10}" if len(skipped) > 10 else "")
+                msg = f"Директория распакована в '{path}', пропущено элементов: {len(skipped)} ({names})."
+            elif context.get('unpack'):
+                msg = f"Директория успешно распакована в '{path}'."
+            else:
+                msg = f"Файл '{os.path.basename(path)}' успешно скачан."
             self._log_client_action(client_id, msg, "")
-            if progress_dialog:
-                progress_dialog.setValue(100)
-                progress_dialog.close()
-            self.show_toast(msg, level="success")
-
-        self.download_contexts.pop(context_key, None)
+            self.transfer_queue.update_transfer(context['row'], final_size, expected_size)
+            if skipped:
+                self.transfer_queue.finish_transfer(context['row'], True, f"Пропущено: {len(skipped)}")
+                self.show_toast(msg, level="warning", duration_ms=6000)
+            else:
+                self.transfer_queue.finish_transfer(context['row'], True)
+                self.show_toast(msg, level="success")
 
     def update_tree_item(self, client_id):
-        """Обновление или создание элемента в дереве клиентов."""
-        tree_item = self.tree_items.get(client_id)
-        grid_item = self.grid_items.get(client_id)
+        """Помечает строку клиента для обновления; изменения применяются пачкой в _refresh_dirty_items."""
+        self.dirty_clients.add(client_id)
+        if not self.items_refresh_timer.isActive():
+            self.items_refresh_timer.start()
 
-        if not tree_item or not grid_item:
-            return
-
-        data = self.client_data[client_id]
-        hostname = data.get('hostname', 'N/A')
-        tags = data.get('tags', [])
-        info_text = data.get('settings', {}).get('info_text', '')
-        note_text = info_text
-        if tags:
-            tag_str = ", ".join(tags)
-            note_text = f"{info_text} | Теги: {tag_str}" if info_text else f"Теги: {tag_str}"
-        cpu = round(data.get('cpu_percent', 0))
-        mem = round(data.get('memory_percent', 0))
-        status = data.get('status', 'Unknown')
-        
-        # --- Обновляем элемент дерева ---
-        tree_item.setText(0, data.get('ip', 'N/A'))
-        tree_item.setText(1, hostname)
-        tree_item.setText(2, note_text)
-        tree_item.setText(3, data.get('version', 'N/A'))
-        tree_item.setText(4, f"{cpu}%")
-        tree_item.setText(5, f"{mem}%")
-        tree_item.setText(6, f"{round(data.get('disk_percent', 0))}%")
-        
-        recv = data.get('bytes_recv_speed', 0) / 1024
-        sent = data.get('bytes_sent_speed', 0) / 1024
-        tree_item.setText(7, f"{recv:.1f} / {sent:.1f} KB/s")
-        
-        gray_brush = QBrush(Qt.gray)
-
-        if status == 'Connected':
-            status_text = "Подключен"
-            # Сбрасываем цвет на дефолтный
-            for i in range(tree_item.columnCount()):
-                tree_item.setData(i, Qt.ForegroundRole, QVariant())
-            tree_item.setForeground(8, QBrush(QColor("green")))
-            
-            grid_item.setData(Qt.ForegroundRole, QVariant())
-            # Включаем элемент
-            grid_item.setFlags(grid_item.flags() | Qt.ItemIsEnabled)
-            tree_item.setFlags(tree_item.flags() | Qt.ItemIsEnabled)
-            # Обновляем текст в сетке
-            grid_info = f"{hostname}"
-            if info_text:
-                grid_info += f" {info_text}"
-            if tags:
-                grid_info += f"\nТеги: {', '.join(tags)}"
-            grid_item.setText(f"{grid_info}\nCPU: {cpu}% | RAM: {mem}%")
-            # Если иконки нет (например, после переподключения), ставим заглушку, чтобы зарезервировать место
-            if grid_item.icon().isNull():
-                grid_item.setIcon(self.placeholder_icon)
-
-        elif status == 'Disconnected':
-            status_text = "Отключен"
-            # Устанавливаем серый цвет
-            for i in range(tree_item.columnCount()):
-                tree_item.setForeground(i, gray_brush)
-            grid_item.setForeground(gray_brush)
-            tree_item.setForeground(8, QBrush(QColor("red")))
-            # Отключаем элемент, чтобы он не был интерактивным
-            grid_item.setFlags(grid_item.flags() & ~Qt.ItemIsEnabled)
-            tree_item.setFlags(tree_item.flags() & ~Qt.ItemIsEnabled)
-            # Обновляем текст и иконку в сетке
-            grid_item.setText(f"{hostname}\n(Отключен)")
-            grid_item.setIcon(QIcon())
-        else:
-            status_text = "Неизвестно"
-
-        tree_item.setText(8, status_text)
-        if self.clients_tree.isSortingEnabled():
-            self.clients_tree.sortItems(self.clients_tree.sortColumn(), self.clients_tree.header().sortIndicatorOrder())
+    def _refresh_dirty_items(self):
+        """Пересчитывает измененные строки модели: каждый непрерывный диапазон - один dataChanged."""
+        dirty, self.dirty_clients = self.dirty_clients, set()
+        self.client_model.refresh_clients(dirty)
 
     def get_selected_client_ids(self):
         """Получение списка client_id выбранных клиентов."""
         current_view_idx = self.view_stack.currentIndex()
         
         if current_view_idx == 0: # Список
-            selected_items = self.clients_tree.selectedItems()
-            return [item.client_id for item in selected_items if hasattr(item, 'client_id')]
+            indexes = self.clients_tree.selectionModel().selectedIndexes()
         elif current_view_idx == 1: # Сетка
-            selected_items = self.clients_grid.selectedItems()
-            return [item.data(Qt.UserRole) for item in selected_items]
+            indexes = self.clients_grid.selectionModel().selectedIndexes()
+        else:
+            return []
+        # В списке выделены все ячейки строки - оставляем по одному ID на клиента
+        return list(dict.fromkeys(index.data(CLIENT_ID_ROLE) for index in indexes))
         
         return []
     
@@ -2348,29 +2535,21 @@ class ServerGUI(QMainWindow):
         self.clients_count_label.setText(f"Клиентов: {count}")
 
     def filter_clients(self):
-        query = (self.client_filter_input.text() or "").strip().lower()
-        for i in range(self.clients_tree.topLevelItemCount()):
-            item = self.clients_tree.topLevelItem(i)
-            client_id = getattr(item, "client_id", "")
-            tags = self.client_data.get(client_id, {}).get("tags", [])
-            haystack = " ".join([
-                item.text(0),
-                item.text(1),
-                item.text(2),
-                item.text(3),
-                " ".join(tags) if tags else ""
-            ]).lower()
-            item.setHidden(bool(query) and query not in haystack)
-
-        for i in range(self.clients_grid.count()):
-            item = self.clients_grid.item(i)
-            client_id = item.data(Qt.UserRole)
-            tags = self.client_data.get(client_id, {}).get("tags", [])
-            haystack = " ".join([item.text(), " ".join(tags) if tags else ""]).lower()
-            item.setHidden(bool(query) and query not in haystack)
-
+        self.filter_timer.stop()
+        text = (self.client_filter_input.text() or "").strip()
+        if text:
+            query = ClientQuery(text)
+            self.client_proxy.set_filter(query, query.candidates(self.client_index))
+        else:
+            self.client_proxy.set_filter(None)
         if self.view_stack.currentIndex() == 1:
-            self.request_grid_screenshots()
+            # Скриншоты запрашиваются только для появившихся карточек без изображения
+            self.request_grid_screenshots(only_missing=True)
+
+    def _reindex_client(self, client_id):
+        """Обновляет индексы клиента; если изменились искомые поля, активный фильтр пересчитывается."""
+        if self.client_index.update(client_id, self.client_data[client_id]) and self.client_proxy.query is not None:
+            self.filter_timer.start()
 
     def _append_log_line(self, line):
         self._log_lines.append(line)
@@ -2543,23 +2722,13 @@ class ServerGUI(QMainWindow):
         text_area = 56
         grid_size = QSize(self.grid_card_size, icon_h + text_area)
         self.clients_grid.setGridSize(grid_size)
-        self.placeholder_icon = self._build_placeholder_icon(self.clients_grid.iconSize())
-        for item in self.grid_items.values():
-            item.setSizeHint(grid_size)
-            if item.icon().isNull():
-                item.setIcon(self.placeholder_icon)
+        self.client_model.set_card_appearance(self._build_placeholder_icon(self.clients_grid.iconSize()), grid_size)
 
     def _update_history(self, client_id, data):
-        history = self.metrics_history[client_id]
-        cpu = data.get("cpu_percent")
-        mem = data.get("memory_percent")
-        disk = data.get("disk_percent")
-        if isinstance(cpu, (int, float)):
-            history["cpu"].append(float(cpu))
-        if isinstance(mem, (int, float)):
-            history["mem"].append(float(mem))
-        if isinstance(disk, (int, float)):
-            history["disk"].append(float(disk))
+        # Историю ведет MessageRouter, с метриками приходит ее снимок
+        history = data.get("history")
+        if history is None:
+            return
         self.client_data[client_id]["history"] = history
         if client_id in self.client_tabs:
             self.client_tabs[client_id].update_history(history)
@@ -2582,38 +2751,85 @@ class ServerGUI(QMainWindow):
             return
 
         delay = max(1, delay)
-        run_at = time.time() + delay
-        task = {
-            "run_at": run_at,
-            "command": command,
-            "clients": list(selected_ids),
-        }
+        # Задачу ведет планировщик ядра сервера, GUI только показывает ее в списке,
+        # результаты клиентов собираются в сводку на вкладке "Выполнение"
+        fanout = self._create_fanout(command)
+        task_id = self.ws_server.tasks.schedule(f"execute:{command}", selected_ids, delay, run=fanout.run)
         item_text = f"{command} -> {len(selected_ids)} клиент(ов) через {delay} сек"
         item = QListWidgetItem(item_text)
         self.tasks_list.addItem(item)
-        task["item"] = item
-        self.scheduled_tasks.append(task)
+        self.task_items[task_id] = item
         self.task_command_input.clear()
 
-    def process_scheduled_tasks(self):
-        if not self.scheduled_tasks:
+    def run_fanout_now(self):
+        """Выполняет команду на выбранных клиентах со сводкой результатов."""
+        command = self.task_command_input.text().strip()
+        if not command:
+            self.show_toast("Введите команду для выполнения.", level="warning")
             return
-        now = time.time()
-        remaining = []
-        for task in self.scheduled_tasks:
-            if now < task["run_at"]:
-                remaining.append(task)
-                continue
-            for client_id in task["clients"]:
-                asyncio.run_coroutine_threadsafe(
-                    self.ws_server.send_command(client_id, f"execute:{task['command']}"),
-                    self.ws_server.loop
-                )
-            if task.get("item"):
-                row = self.tasks_list.row(task["item"])
-                if row != -1:
-                    self.tasks_list.takeItem(row)
-        self.scheduled_tasks = remaining
+
+        selected_ids = self.get_selected_client_ids()
+        if not selected_ids:
+            self.show_toast("Выберите одного или нескольких клиентов.", level="warning")
+            return
+
+        fanout = self._create_fanout(command)
+        logging.info(f"Массовое выполнение '{command}' на {len(selected_ids)} клиент(ах)...")
+        asyncio.run_coroutine_threadsafe(fanout.run(selected_ids), self.ws_server.loop)
+        self._show_fanout_tab(activate=True)
+        self.task_command_input.clear()
+
+    def _create_fanout(self, command):
+        fanout = FanoutCommand(
+            self.ws_server, command,
+            window=self.fanout_window_input.value(),
+            timeout=APP_CONFIG.get('FANOUT_TIMEOUT', 620),
+            progress_callback=self.fanout_view.fanout_progress.emit
+        )
+        self.fanout_runs[fanout.fanout_id] = fanout
+        return fanout
+
+    def _cancel_fanout(self, fanout_id):
+        fanout = self.fanout_runs.get(fanout_id)
+        if fanout is not None:
+            fanout.cancel()
+
+    def _on_fanout_progress(self, summary):
+        if not summary['done'] and not summary['finished']:
+            # Первая сводка - запуск (в том числе запланированной задачи)
+            self._show_fanout_tab(activate=False)
+            return
+        if not summary['finished']:
+            return
+        self.fanout_runs.pop(summary['fanout_id'], None)
+        parts = [f"{len(group['client_ids'])}: {group['outcome']}" for group in summary['groups'][:5]]
+        if summary['pending']:
+            parts.append(f"{len(summary['pending'])}: не начато")
+        msg = f"Массовое выполнение '{summary['command']}' {'отменено' if summary['cancelled'] else 'завершено'}: {', '.join(parts)}"
+        logging.info(msg)
+        all_ok = all(group['ok'] for group in summary['groups']) and not summary['other_groups'] and not summary['pending']
+        self.show_toast(msg, level="success" if all_ok else "warning", duration_ms=6000)
+
+    def _show_fanout_tab(self, activate):
+        index = self.tabs.indexOf(self.fanout_view)
+        if index == -1:
+            index = self.tabs.addTab(self.fanout_view, "Выполнение")
+            self._apply_tab_icons()
+            self._update_fanout_tab_title(self.fanout_view.active_count())
+        if activate:
+            self.tabs.setCurrentIndex(index)
+
+    def _update_fanout_tab_title(self, active_count):
+        index = self.tabs.indexOf(self.fanout_view)
+        if index != -1:
+            self.tabs.setTabText(index, f"Выполнение ({active_count})" if active_count else "Выполнение")
+
+    def _on_task_fired(self, task_id):
+        item = self.task_items.pop(task_id, None)
+        if item is not None:
+            row = self.tasks_list.row(item)
+            if row != -1:
+                self.tasks_list.takeItem(row)
         
     def _log_client_action(self, client_id, message_for_client_log, message_for_system_log):
         """Логирует действие в лог клиента или в системный лог."""
@@ -2632,6 +2848,8 @@ class ServerGUI(QMainWindow):
         """Слот для сохранения настроек клиента."""
         if client_id in self.client_data:
             self.client_data[client_id]['settings'].update(new_settings)
+            self._reindex_client(client_id)
+            self.update_tree_item(client_id)
             client_name = self.client_data[client_id].get('hostname', client_id)
             self._log_client_action(client_id, "Настройки клиента обновлены.", f"Настройки для клиента {client_name} обновлены в памяти сервера.")
 
@@ -2641,10 +2859,10 @@ class ServerGUI(QMainWindow):
             return
         tags = meta.get("tags", [])
         self.client_data[client_id]["tags"] = tags
+        self._reindex_client(client_id)
         self.client_meta[client_id] = {"tags": tags}
         self.save_settings()
         self.update_tree_item(client_id)
-        self.filter_clients()
 
     def disconnect_client(self):
         selected_ids = self.get_selected_client_ids()
@@ -2660,26 +2878,18 @@ class ServerGUI(QMainWindow):
             )
         self.show_toast(f"Команда на отключение отправлена {len(selected_ids)} клиентам.", level="info")
 
-    def open_client_tab_from_double_click(self, item, column=None):
-        self.open_client_tab(item)
+    def open_client_tab_from_double_click(self, index):
+        self.open_client_tab(index.data(CLIENT_ID_ROLE))
 
     def open_client_tab_from_button(self):
-        selected_items = self.clients_tree.selectedItems()
-        if not selected_items:
+        selected_ids = self.get_selected_client_ids()
+        if not selected_ids:
             self.show_toast("Пожалуйста, выберите клиента для открытия вкладки.", level="warning")
             return
-        self.open_client_tab(selected_items[0])
+        self.open_client_tab(selected_ids[0])
 
-    def open_client_tab(self, item):
+    def open_client_tab(self, client_id):
         """Открытие вкладки с детальной информацией о клиенте (для обоих видов)."""
-        client_id = None
-        # Определяем, из какого виджета пришел item
-        if isinstance(item, SortableTreeWidgetItem): # Элемент из дерева
-            if hasattr(item, 'client_id'):
-                client_id = item.client_id
-        else: # Элемент из сетки (QListWidgetItem)
-            client_id = item.data(Qt.UserRole)
-
         if not client_id:
             return
 
@@ -2715,6 +2925,7 @@ class ServerGUI(QMainWindow):
         tab_index = self.tabs.addTab(tab, f"{client_name}")
         self.tabs.setCurrentIndex(tab_index)
         self.client_tabs[client_id] = tab
+        self._update_screenshot_interest()
 
     def show_clients_tab(self):
         """Показывает вкладку 'Клиенты', если она закрыта."""
@@ -2762,6 +2973,24 @@ class ServerGUI(QMainWindow):
         index = self.tabs.insertTab(insert_pos, self.tasks_tab, "Задачи")
         self.tabs.setCurrentIndex(index)
 
+    def show_transfers_tab(self):
+        """Показывает вкладку 'Передачи', если она закрыта."""
+        self._show_transfers_tab(activate=True)
+
+    def _show_transfers_tab(self, activate):
+        index = self.tabs.indexOf(self.transfer_queue)
+        if index == -1:
+            index = self.tabs.addTab(self.transfer_queue, "Передачи")
+            self._apply_tab_icons()
+            self._update_transfers_tab_title(self.transfer_queue.active_count())
+        if activate:
+            self.tabs.setCurrentIndex(index)
+
+    def _update_transfers_tab_title(self, active_count):
+        index = self.tabs.indexOf(self.transfer_queue)
+        if index != -1:
+            self.tabs.setTabText(index, f"Передачи ({active_count})" if active_count else "Передачи")
+
     def close_tab(self, index):
         """Закрытие вкладки."""
         widget = self.tabs.widget(index)
@@ -2786,6 +3015,7 @@ class ServerGUI(QMainWindow):
         
         if client_id_to_remove:
             del self.client_tabs[client_id_to_remove]
+            self._update_screenshot_interest()
             logging.info(f"Закрыта вкладка для клиента {client_id_to_remove}")
 
         self.tabs.removeTab(index)
@@ -2831,40 +3061,81 @@ class ServerGUI(QMainWindow):
         
         if reply != QMessageBox.Yes: return
 
+        filename = os.path.basename(package_path)
+        remote_path = f"/tmp/{filename}"
+        broadcast = BroadcastUpload(
+            self.ws_server, package_path, remote_path,
+            chunk_size=self.websocket_chunk_size_mb * 1024 * 1024,
+            concurrency=APP_CONFIG.get('ROLLOUT_CONCURRENCY', 20),
+            progress_callback=lambda cid, sent, total: self.transfer_queue.transfer_progress.emit(
+                f"{broadcast.transfer_id}:{cid}", sent, total)
+        )
         for client_id in selected_ids:
-            client_ip = self.client_data[client_id].get('ip', 'unknown')
-            logging.info(f"Запуск обновления для клиента {client_ip}...")
-            asyncio.run_coroutine_threadsafe(
-                self._perform_update(client_id, package_path),
-                self.ws_server.loop
-            )
+            self.transfer_queue.add_transfer(f"{broadcast.transfer_id}:{client_id}", "upload",
+                                             self._client_label(client_id), remote_path, total=os.path.getsize(package_path))
+        self._show_transfers_tab(activate=False)
+        logging.info(f"Запуск обновления {len(selected_ids)} клиент(ов) пакетом '{filename}'...")
+        asyncio.run_coroutine_threadsafe(
+            self._perform_rollout(broadcast, selected_ids, remote_path),
+            self.ws_server.loop
+        )
 
-    async def _perform_update(self, client_id, deb_path):
-        """Асинхронный процесс обновления клиента."""
-        filename = os.path.basename(deb_path)
-        remote_path = f"/tmp/{filename}"
-        self._log_client_action(client_id, f"Начало обновления. Загрузка пакета '{filename}'...", "")
-        try:
-            file_size = os.path.getsize(deb_path)
-            await self.ws_server.send_command(client_id, f"upload_file_start:{remote_path}:{file_size}")
-
-            CHUNK_SIZE = self.websocket_chunk_size_mb * 1024 * 1024
-            hasher = hashlib.sha256()
-            with open(deb_path, 'rb') as f:
-                while chunk := f.read(CHUNK_SIZE):
-                    hasher.update(chunk)
-                    chunk_b64 = base64.b64encode(chunk).decode('ascii')
-                    await self.ws_server.send_command(client_id, f"upload_file_chunk:{chunk_b64}")
-            
-            await self.ws_server.send_command(client_id, f"upload_file_end:{hasher.hexdigest()}")
+    async def _perform_rollout(self, broadcast, client_ids, remote_path):
+        """Асинхронный процесс обновления клиентов: пакет рассылается одним проходом по файлу."""
+        filename = os.path.basename(remote_path)
+
+        async def install(client_id):
             self._log_client_action(client_id, f"Пакет '{filename}' успешно загружен в {remote_path}.", "")
             self._log_client_action(client_id, "Запуск установки пакета. Клиент будет перезапущен.", "")
-            await self.ws_server.send_command(client_id, f"install_package:{remote_path}")
-        except Exception as e:
-            self._log_client_action(client_id, f"Ошибка в процессе обновления: {e}", "")
+            if not await self.ws_server.send_command(client_id, f"install_package:{remote_path}"):
+                raise RuntimeError("не удалось отправить команду установки")
+
+        def on_client_done(client_id, success, reason):
+            self.transfer_queue.transfer_finished.emit(f"{broadcast.transfer_id}:{client_id}", success,
+                                                       "Установка запущена" if success else reason)
+            if not success:
+                self._log_client_action(client_id, f"Ошибка загрузки пакета '{filename}' на клиент: {reason}", "")
+
+        summary = await broadcast.run(client_ids, after_upload=install, on_client_done=on_client_done)
+        self.rollout_finished.emit(summary)
+
+    def _on_rollout_finished(self, summary):
+        """Выводит итог массового обновления: успешно, с ошибкой, не начато."""
+        succeeded, failed, pending = summary['succeeded'], summary['failed'], summary['pending']
+        msg = (f"Обновление пакетом '{summary['file']}' завершено: "
+               f"успешно {len(succeeded)}, с ошибкой {len(failed)}, ожидают {len(pending)}.")
+        logging.info(msg)
+        for client_id, reason in failed.items():
+            logging.warning(f"[Обновление] {self._client_label(client_id)}: {reason}")
+        for client_id in pending:
+            self.transfer_queue.finish_transfer(f"{summary['transfer_id']}:{client_id}", False, "Не начато")
+        self.show_toast(msg, level="success" if not failed and not pending else "warning", duration_ms=6000)
 
     def refresh_client_data(self):
-        self.send_command_to_selected("refresh", "обновления")
+        """Запрашивает свежие данные у выбранных клиентов и сообщает, кто не ответил."""
+        selected_ids = self.get_selected_client_ids()
+        if not selected_ids:
+            self.show_toast("Пожалуйста, выберите клиента(ов) для обновления.", level="warning")
+            return
+
+        future = asyncio.run_coroutine_threadsafe(
+            self.ws_server.request_many(selected_ids, "refresh", timeout=15),
+            self.ws_server.loop
+        )
+        future.add_done_callback(
+            lambda f: self.refresh_finished.emit(f.result()) if not f.cancelled() and f.exception() is None else None)
+
+    def _on_refresh_finished(self, results):
+        """Итог обновления: ответы уже применены обработчиком сообщений, здесь - только сводка."""
+        failed = {client_id: result for client_id, result in results.items() if isinstance(result, BaseException)}
+        for client_id, error in failed.items():
+            reason = "нет ответа" if isinstance(error, asyncio.TimeoutError) else str(error) or type(error).__name__
+            logging.warning(f"[Обновление данных] {self._client_label(client_id)}: {reason}")
+        if failed:
+            self.show_toast(f"Обновлено {len(results) - len(failed)} из {len(results)}, не ответили: {len(failed)}.",
+                            level="warning")
+        else:
+            self.show_toast(f"Данные обновлены: {len(results)} клиент(ов).", level="success")
 
     def shutdown_client(self):
         self.send_command_to_selected("shutdown", "выключения", needs_confirmation=True)
@@ -2908,21 +3179,29 @@ class ServerGUI(QMainWindow):
             self._set_grid_scale_visible(True)
             self.request_grid_screenshots() # Немедленное обновление
             self.grid_refresh_timer.start(self.grid_refresh_interval * 1000)
+        self._update_screenshot_interest()
+
+    def _update_screenshot_interest(self):
+        """Сообщает маршрутизатору, чьи скриншоты видны: в сетке - всех, иначе - открытых вкладок."""
+        if self.view_stack.currentIndex() == 1:
+            self.ws_server.router.set_screenshot_clients(None)
+        else:
+            self.ws_server.router.set_screenshot_clients(self.client_tabs.keys())
 
-    def request_grid_screenshots(self):
-        """Запрашивает скриншоты у всех подключенных клиентов для сетки."""
+    def request_grid_screenshots(self, only_missing=False):
+        """Запрашивает скриншоты у подключенных клиентов сетки (only_missing - только у карточек без скриншота)."""
         if self.view_stack.currentIndex() != 1:
             return # Не запрашивать, если сетка не активна
 
         logging.info("Запрос скриншотов для вида 'Сетка'...")
-        for i in range(self.clients_grid.count()):
-            item = self.clients_grid.item(i)
-            if item.isHidden():
+        # Скрытые фильтром карточки в прокси не попадают
+        for row in range(self.client_proxy.rowCount()):
+            client_id = self.client_proxy.index(row, CARD_COLUMN).data(CLIENT_ID_ROLE)
+            if only_missing and client_id in self.client_model.screenshots:
                 continue
-            client_id = item.data(Qt.UserRole)
             if self.client_data.get(client_id, {}).get('status') == 'Connected':
                 asyncio.run_coroutine_threadsafe(
-                    self.ws_server.send_command(client_id, f"screenshot_quality:{self.quality_grid}"),
+                    self.ws_server.send_command(client_id, f"screenshot_quality:{self.quality_grid}", coalesce=True),
                     self.ws_server.loop
                 )
 
@@ -0,0 +1,21 @@
+# astra_monitor_server/gui/server_bridge.py
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class ServerBridge(QObject):
+    """
+    Переносит события ядра сервера из потока event loop в поток GUI: сигналы ядра
+    вызывают emit() Qt-сигналов моста, а Qt доставляет их слотам GUI через очередь событий.
+    """
+    messages_ready = pyqtSignal(list)
+    new_connection = pyqtSignal(str)
+    connection_lost = pyqtSignal(str)
+    task_fired = pyqtSignal(str)
+
+    def __init__(self, ws_server, parent=None):
+        super().__init__(parent)
+        ws_server.messages_ready.connect(self.messages_ready.emit)
+        ws_server.new_connection.connect(self.new_connection.emit)
+        ws_server.connection_lost.connect(self.connection_lost.emit)
+        ws_server.tasks.task_fired.connect(self.task_fired.emit)
@@ -0,0 +1,167 @@
+# astra_monitor_server/gui/widgets/fanout_widget.py
+
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTreeWidget, QTreeWidgetItem,
+                             QHeaderView, QAbstractItemView, QSplitter, QTextEdit)
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QFont
+
+from ..icon_utils import load_icon_from_assets
+
+
+class FanoutWidget(QWidget):
+    """
+    Результаты массового выполнения команд. У каждого запуска - группы одинаковых
+    результатов с числом клиентов; вывод и список клиентов группы - в панели под деревом.
+    """
+
+    # Сводка FanoutCommand.summary(), сигнал безопасно вызывать из потока asyncio
+    fanout_progress = pyqtSignal(dict)
+    cancel_requested = pyqtSignal(str) # fanout_id
+    active_count_changed = pyqtSignal(int)
+
+    COL_RESULT, COL_CLIENTS, COL_STATUS = range(3)
+
+    def __init__(self, client_label, parent=None):
+        super().__init__(parent)
+        self.client_label = client_label # client_id -> подпись клиента
+        self.runs = {} # fanout_id -> {'item', 'groups', 'finished'}
+        self.init_ui()
+        self.fanout_progress.connect(self.update_run)
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        actions_layout = QHBoxLayout()
+        self.cancel_btn = QPushButton("Отменить выбранные")
+        self.cancel_btn.clicked.connect(self.cancel_selected)
+        self.clear_btn = QPushButton("Очистить завершенные")
+        self.clear_btn.clicked.connect(self.clear_finished)
+        cancel_icon = load_icon_from_assets("stop.svg", QColor("#64748b"), size=16)
+        if not cancel_icon.isNull():
+            self.cancel_btn.setIcon(cancel_icon)
+        clear_icon = load_icon_from_assets("clear_all.svg", QColor("#64748b"), size=16)
+        if not clear_icon.isNull():
+            self.clear_btn.setIcon(clear_icon)
+        actions_layout.addWidget(self.cancel_btn)
+        actions_layout.addWidget(self.clear_btn)
+        actions_layout.addStretch()
+        layout.addLayout(actions_layout)
+
+        splitter = QSplitter(Qt.Vertical)
+        self.tree = QTreeWidget()
+        self.tree.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.tree.setHeaderLabels(["Команда / результат", "Клиентов", "Статус"])
+        self.tree.header().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.tree.header().setSectionResizeMode(self.COL_RESULT, QHeaderView.Stretch)
+        self.tree.header().setStretchLastSection(False)
+        self.tree.itemSelectionChanged.connect(self.show_details)
+        splitter.addWidget(self.tree)
+
+        self.details = QTextEdit()
+        self.details.setReadOnly(True)
+        self.details.setFont(QFont("Monospace", 10))
+        splitter.addWidget(self.details)
+        splitter.setSizes([400, 200])
+        layout.addWidget(splitter)
+
+    def update_run(self, summary):
+        fanout_id = summary['fanout_id']
+        row = self.runs.get(fanout_id)
+        if row is None:
+            item = QTreeWidgetItem([summary['command'], "", ""])
+            item.setToolTip(self.COL_RESULT, summary['command'])
+            font = item.font(self.COL_RESULT)
+            font.setBold(True)
+            item.setFont(self.COL_RESULT, font)
+            self.tree.insertTopLevelItem(0, item)
+            item.setExpanded(True)
+            row = {'item': item, 'groups': {}, 'finished': False}
+            self.runs[fanout_id] = row
+            self.active_count_changed.emit(self.active_count())
+        elif row['finished']:
+            return
+
+        item = row['item']
+        item.setText(self.COL_CLIENTS, f"{summary['done']} / {summary['total']}")
+        if summary['cancelled']:
+            status = "Отменено"
+        elif summary['finished']:
+            status = "Завершено"
+        else:
+            status = f"Выполняется на {summary['running']}"
+        item.setText(self.COL_STATUS, status)
+        self._sync_groups(row, summary)
+
+        if summary['finished']:
+            row['finished'] = True
+            self.active_count_changed.emit(self.active_count())
+        self.show_details()
+
+    def _sync_groups(self, row, summary):
+        """Обновляет группы запуска, переиспользуя элементы дерева, чтобы не терять выделение."""
+        parent = row['item']
+        selected = [item for item in self.tree.selectedItems() if item.parent() is parent]
+        items = []
+        for group in summary['groups']:
+            key = (group['outcome'], group['output'])
+            item = row['groups'].get(key)
+            if item is None:
+                lines = group['output'].splitlines()
+                first_line = lines[0] if lines else "(нет вывода)"
+                if len(lines) > 1:
+                    first_line += f"  … (+{len(lines) - 1} стр.)"
+                item = QTreeWidgetItem([first_line, "", group['outcome']])
+                item.setForeground(self.COL_STATUS, QColor("#16a34a") if group['ok'] else QColor("#dc2626"))
+                row['groups'][key] = item
+            item.setText(self.COL_CLIENTS, str(len(group['client_ids'])))
+            item.setData(self.COL_RESULT, Qt.UserRole, group)
+            items.append(item)
+
+        extra = []
+        if summary['other_groups']:
+            extra.append((f"… еще {summary['other_groups']} различных результатов", summary['other_clients'], None))
+        if summary['finished'] and summary['pending']:
+            extra.append(("Не начато", len(summary['pending']),
+                          {'outcome': "не начато", 'ok': False, 'output': "", 'client_ids': summary['pending']}))
+        for text, count, group in extra:
+            item = QTreeWidgetItem([text, str(count), ""])
+            item.setForeground(self.COL_RESULT, QColor("#64748b"))
+            item.setData(self.COL_RESULT, Qt.UserRole, group)
+            items.append(item)
+
+        parent.takeChildren()
+        parent.addChildren(items)
+        for item in selected:
+            if any(item is kept for kept in items):
+                item.setSelected(True)
+
+    def show_details(self):
+        items = self.tree.selectedItems()
+        group = items[0].data(self.COL_RESULT, Qt.UserRole) if len(items) == 1 else None
+        if not group:
+            self.details.clear()
+            return
+        clients = ", ".join(self.client_label(client_id) for client_id in group['client_ids'])
+        self.details.setPlainText(
+            f"Результат: {group['outcome']}\n"
+            f"Клиенты ({len(group['client_ids'])}): {clients}\n\n"
+            f"{group['output'] or '(нет вывода)'}"
+        )
+
+    def active_count(self):
+        return sum(1 for row in self.runs.values() if not row['finished'])
+
+    def cancel_selected(self):
+        selected = set(id(item) for item in self.tree.selectedItems())
+        for fanout_id, row in self.runs.items():
+            if id(row['item']) in selected and not row['finished']:
+                self.cancel_requested.emit(fanout_id)
+
+    def clear_finished(self):
+        for fanout_id, row in list(self.runs.items()):
+            if row['finished']:
+                index = self.tree.indexOfTopLevelItem(row['item'])
+                if index != -1:
+                    self.tree.takeTopLevelItem(index)
+                del self.runs[fanout_id]
+        self.details.clear()
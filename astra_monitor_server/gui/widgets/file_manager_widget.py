@@ -1,22 +1,23 @@
 # astra_monitor_server/gui/widgets/file_manager_widget.py
 
 import os
+import json
 import posixpath
-import base64
 import asyncio
 import logging
 
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QFrame,
                              QTreeWidget, QTreeWidgetItem, QMessageBox, QFileDialog, QInputDialog, QLineEdit,
-                             QProgressDialog, QMenu)
+                             QMenu)
 from PyQt5.QtCore import Qt, pyqtSignal, QSize
 from PyQt5.QtGui import QColor
 
 from ..icon_utils import load_icon_from_assets
+from ...server.transfer_frames import BINARY_FRAMES_CAPABILITY, new_transfer_id
+from ...server.tar_stream import DIR_STREAM_CAPABILITY, ZSTD_CAPABILITY, zstandard
 
 class FileManagerWidget(QWidget):
-    # Сигналы для безопасного обновления GUI из другого потока
-    upload_progress = pyqtSignal(int, str)
+    # Сигнал для безопасного обновления GUI из другого потока
     upload_finished = pyqtSignal(bool, str)
 
     def __init__(self, parent=None, ws_server=None, client_id=None, log_callback=None, main_window=None):
@@ -28,8 +29,9 @@ class FileManagerWidget(QWidget):
         self.forward_stack = []
         self.log_callback = log_callback or (lambda msg: print(msg))
         self.main_window = main_window # Store main window reference
-        self.upload_task = None
+        self.upload_tasks = {} # transfer_id -> concurrent.futures.Future корутины загрузки
         self.init_ui()
+        self.upload_finished.connect(self.on_upload_finished)
         
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -236,11 +238,14 @@ class FileManagerWidget(QWidget):
             else:
                 QMessageBox.warning(self, "Ошибка", "Не удалось получить информацию о файле.")
             return
+        if file_info['type'] == 'directory':
+            self.download_directory(file_info['path'])
+            return
         if file_info['type'] != 'file':
             if self.main_window:
-                self.main_window.show_toast("Можно скачивать только файлы", level="warning")
+                self.main_window.show_toast("Можно скачивать только файлы и папки", level="warning")
             else:
-                QMessageBox.warning(self, "Ошибка", "Можно скачивать только файлы")
+                QMessageBox.warning(self, "Ошибка", "Можно скачивать только файлы и папки")
             return
 
         remote_path = file_info['path']
@@ -253,8 +258,10 @@ class FileManagerWidget(QWidget):
             return
 
         # 2. Регистрируем ожидаемое скачивание в главном окне
+        binary = self.ws_server.client_supports(self.client_id, BINARY_FRAMES_CAPABILITY)
+        transfer_id = new_transfer_id() if binary else None
         if self.main_window:
-            self.main_window.register_pending_download(self.client_id, remote_path, local_save_path)
+            self.main_window.register_pending_download(self.client_id, remote_path, local_save_path, transfer_id=transfer_id)
         else:
             QMessageBox.critical(self, "Критическая ошибка", "Не удалось получить доступ к главному окну.")
             return
@@ -264,99 +271,142 @@ class FileManagerWidget(QWidget):
             chunk_size_bytes = self.main_window.websocket_chunk_size_mb * 1024 * 1024
         else:
             chunk_size_bytes = 4 * 1024 * 1024 # Fallback
-        command = f"download_file_chunked:{chunk_size_bytes}:{remote_path}"
+        if binary:
+            params = {"transfer_id": transfer_id, "path": remote_path, "chunk_size": chunk_size_bytes}
+            command = f"transfer:download_start:{json.dumps(params)}"
+        else:
+            command = f"download_file_chunked:{chunk_size_bytes}:{remote_path}"
         asyncio.run_coroutine_threadsafe(
             self.ws_server.send_command(self.client_id, command), 
             self.ws_server.loop
         )
         self.log_callback(f"[Скачивание] Запрос на скачивание файла '{filename}' отправлен.")
 
-    def upload_file(self):
-        """Загрузка файла на клиента (с поддержкой чанков)"""
-        file_path, _ = QFileDialog.getOpenFileName(self, "Выберите файл для загрузки")
-        if not file_path:
+    def download_directory(self, remote_path):
+        """Скачивание папки потоковым tar-архивом: сохранение архива или распаковка на лету."""
+        if not self.main_window:
+            QMessageBox.critical(self, "Критическая ошибка", "Не удалось получить доступ к главному окну.")
+            return
+        if not self.ws_server.client_supports(self.client_id, DIR_STREAM_CAPABILITY):
+            self.main_window.show_toast("Клиент не поддерживает скачивание папок. Обновите клиент.", level="warning")
             return
 
-        filename = os.path.basename(file_path)
-        file_size = os.path.getsize(file_path)
+        dirname = posixpath.basename(remote_path.rstrip('/')) or "root"
+        compression = "zstd" if zstandard and self.ws_server.client_supports(self.client_id, ZSTD_CAPABILITY) else "gzip"
+
+        box = QMessageBox(self)
+        box.setWindowTitle("Скачивание папки")
+        box.setText(f"Как сохранить папку '{remote_path}'?")
+        archive_btn = box.addButton("Архивом", QMessageBox.AcceptRole)
+        unpack_btn = box.addButton("Распаковать", QMessageBox.AcceptRole)
+        box.addButton("Отмена", QMessageBox.RejectRole)
+        box.exec_()
+
+        if box.clickedButton() == archive_btn:
+            extension = ".tar.zst" if compression == "zstd" else ".tar.gz"
+            local_path, _ = QFileDialog.getSaveFileName(self, "Сохранить архив", dirname + extension)
+            unpack_compression = None
+        elif box.clickedButton() == unpack_btn:
+            # Корнем архива является сама папка, поэтому она появится внутри выбранного каталога
+            local_path = QFileDialog.getExistingDirectory(self, "Куда распаковать папку")
+            unpack_compression = compression
+        else:
+            local_path = ""
+        if not local_path:
+            self.log_callback(f"Скачивание папки '{dirname}' отменено пользователем.")
+            return
 
-        progress_dialog = QProgressDialog(f"Подготовка к загрузке '{filename}'...", "Отмена", 0, 100, self)
-        progress_dialog.setWindowModality(Qt.WindowModal)
-        progress_dialog.setWindowTitle("Загрузка файла на клиент")
-        progress_dialog.setAutoClose(False)
-        progress_dialog.setAutoReset(False)
+        transfer_id = new_transfer_id()
+        self.main_window.register_pending_download(self.client_id, remote_path, local_path,
+                                                   transfer_id=transfer_id, unpack_compression=unpack_compression)
+        params = {
+            "transfer_id": transfer_id,
+            "path": remote_path,
+            "chunk_size": self.main_window.websocket_chunk_size_mb * 1024 * 1024,
+            "compression": compression
+        }
+        asyncio.run_coroutine_threadsafe(
+            self.ws_server.send_command(self.client_id, f"transfer:download_dir_stream:{json.dumps(params)}"),
+            self.ws_server.loop
+        )
+        self.log_callback(f"[Скачивание] Запрос на скачивание папки '{remote_path}' отправлен.")
 
-        # Подключаем сигналы
-        self.upload_progress.connect(progress_dialog.setValue)
-        self.upload_progress.connect(lambda _, text: progress_dialog.setLabelText(text))
-        self.upload_finished.connect(lambda success, msg: self.on_upload_finished(success, msg, progress_dialog))
-        progress_dialog.canceled.connect(self.cancel_upload)
+    def upload_file(self):
+        """Загрузка файлов на клиента (с поддержкой чанков, несколько файлов параллельно)"""
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Выберите файлы для загрузки")
+        if not file_paths:
+            return
+        if not self.main_window:
+            QMessageBox.critical(self, "Критическая ошибка", "Не удалось получить доступ к главному окну.")
+            return
 
-        progress_dialog.show()
+        transfer_queue = self.main_window.transfer_queue
+        for file_path in file_paths:
+            filename = os.path.basename(file_path)
+            file_size = os.path.getsize(file_path)
+            remote_path = posixpath.join(self.current_path, filename)
+            transfer_id = new_transfer_id()
 
-        # Запускаем корутину в фоновом потоке asyncio
-        self.upload_task = asyncio.run_coroutine_threadsafe(
-            self._send_file_in_chunks_async(file_path, filename, file_size),
-            self.ws_server.loop
-        )
+            transfer_queue.add_transfer(transfer_id, "upload", self.main_window._client_label(self.client_id),
+                                        remote_path, total=file_size,
+                                        cancel_callback=lambda tid=transfer_id: self.cancel_upload(tid))
 
-    def on_upload_finished(self, success, message, dialog):
+            # Запускаем корутину в фоновом потоке asyncio
+            self.upload_tasks[transfer_id] = asyncio.run_coroutine_threadsafe(
+                self._send_file_in_chunks_async(file_path, remote_path, file_size, transfer_id),
+                self.ws_server.loop
+            )
+        self.main_window._show_transfers_tab(activate=False)
+
+    def on_upload_finished(self, success, message):
         """Слот для обработки завершения загрузки."""
-        dialog.close()
         self.log_callback(message)
-        if not success and "отменена" not in message:
-             QMessageBox.critical(self, "Ошибка загрузки", message)
+        if success:
+            self.refresh_files()
+        elif "отменена" not in message and self.main_window:
+            self.main_window.show_toast(message, level="error", duration_ms=6000)
 
-    def cancel_upload(self):
+    def cancel_upload(self, transfer_id):
         """Слот для отмены загрузки."""
-        if self.upload_task and not self.upload_task.done():
+        task = self.upload_tasks.get(transfer_id)
+        if task and not task.done():
             # Потокобезопасно отменяем задачу в цикле asyncio
-            self.ws_server.loop.call_soon_threadsafe(self.upload_task.cancel)
+            task.cancel()
         self.log_callback("[Загрузка] Отмена загрузки файла...")
 
-    async def _send_file_in_chunks_async(self, file_path, filename, file_size):
+    async def _send_file_in_chunks_async(self, file_path, remote_path, file_size, transfer_id):
         """Асинхронная корутина для отправки файла по частям."""
-        remote_path = posixpath.join(self.current_path, filename)
+        filename = os.path.basename(file_path)
+        transfer_queue = self.main_window.transfer_queue
         try:
             self.log_callback(f"[Загрузка] Начало загрузки файла '{filename}' ({file_size / 1024 / 1024:.2f} MB).")
+            chunk_size = self.main_window.websocket_chunk_size_mb * 1024 * 1024
 
-            # 1. Отправляем команду начала
-            start_cmd = f"upload_file_start:{remote_path}:{file_size}"
-            await self.ws_server.send_command(self.client_id, start_cmd)
+            def on_progress(sent_bytes, total_bytes):
+                # Обновляем прогресс через сигнал очереди передач
+                transfer_queue.transfer_progress.emit(transfer_id, sent_bytes, total_bytes)
 
-            # 2. Отправляем файл по частям
-            if self.main_window:
-                CHUNK_SIZE = self.main_window.websocket_chunk_size_mb * 1024 * 1024
+            success = await self.ws_server.upload_file_to_client(
+                self.client_id, file_path, remote_path, chunk_size,
+                progress_callback=on_progress, transfer_id=transfer_id
+            )
+            if success:
+                transfer_queue.transfer_finished.emit(transfer_id, True, "Завершено")
+                self.upload_finished.emit(True, f"Загрузка файла '{filename}' завершена.")
             else:
-                CHUNK_SIZE = 4 * 1024 * 1024 # Fallback
-
-            with open(file_path, 'rb') as f:
-                sent_bytes = 0
-                while chunk := f.read(CHUNK_SIZE):
-                    chunk_b64 = base64.b64encode(chunk).decode('ascii')
-                    chunk_cmd = f"upload_file_chunk:{chunk_b64}"
-                    await self.ws_server.send_command(self.client_id, chunk_cmd)
-                    sent_bytes += len(chunk)
-
-                    # Обновляем прогресс через сигнал
-                    if file_size > 0:
-                        percent = int(sent_bytes * 100 / file_size)
-                        progress_text = (f"Загрузка файла '{filename}'...\n"
-                                         f"{sent_bytes / 1024 / 1024:.2f} MB / {file_size / 1024 / 1024:.2f} MB")
-                        self.upload_progress.emit(percent, progress_text)
-                    await asyncio.sleep(0) # Уступаем управление
-
-            # 3. Отправляем команду завершения
-            await self.ws_server.send_command(self.client_id, "upload_file_end")
-            self.upload_finished.emit(True, f"Загрузка файла '{filename}' завершена.")
+                transfer_queue.transfer_finished.emit(transfer_id, False, "Ошибка")
+                # Ошибку клиента GUI получает отдельным сообщением file_upload_result
+                self.upload_finished.emit(False, f"Ошибка при загрузке файла '{filename}'.")
 
         except asyncio.CancelledError:
-            await self.ws_server.send_command(self.client_id, f"cancel_upload:{remote_path}")
-            self.upload_finished.emit(False, "Загрузка отменена пользователем.")
+            transfer_queue.transfer_finished.emit(transfer_id, False, "Отменено")
+            self.upload_finished.emit(False, f"Загрузка файла '{filename}' отменена пользователем.")
             raise # Важно для корректной отмены задачи
         except Exception as e:
-            error_message = f"Ошибка при загрузке файла: {e}"
-            self.upload_finished.emit(False, error_message)
+            transfer_queue.transfer_finished.emit(transfer_id, False, "Ошибка")
+            self.upload_finished.emit(False, f"Ошибка при загрузке файла: {e}")
+        finally:
+            self.upload_tasks.pop(transfer_id, None)
 
     def rename_file(self, item=None):
         """Переименование файла или папки"""
@@ -475,8 +525,7 @@ class FileManagerWidget(QWidget):
         if selected_item:
             file_info = selected_item.data(0, Qt.UserRole)
             if file_info:
-                is_file = file_info.get('type') == 'file'
-                download_action.setEnabled(is_file)
+                download_action.setEnabled(file_info.get('type') in ('file', 'directory'))
             else:
                 download_action.setEnabled(False)
                 rename_action.setEnabled(False)
@@ -0,0 +1,136 @@
+# astra_monitor_server/gui/widgets/transfer_queue_widget.py
+
+import time
+
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTreeWidget,
+                             QTreeWidgetItem, QHeaderView, QProgressBar, QAbstractItemView)
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtGui import QColor
+
+from ..icon_utils import load_icon_from_assets
+
+
+class TransferQueueWidget(QWidget):
+    """Немодальная очередь передач файлов: скачивания и загрузки всех клиентов."""
+
+    # Сигналы для безопасного обновления из потока asyncio
+    transfer_progress = pyqtSignal(str, object, object)  # key, переданные байты, всего байт
+    transfer_status = pyqtSignal(str, str)               # key, текст статуса
+    transfer_finished = pyqtSignal(str, bool, str)       # key, успех, сообщение
+    active_count_changed = pyqtSignal(int)
+
+    COL_DIRECTION, COL_CLIENT, COL_FILE, COL_PROGRESS, COL_SPEED, COL_STATUS = range(6)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = {} # key -> {'item', 'bar', 'cancel', 'started', 'done', 'total', 'finished'}
+        self.init_ui()
+        self.transfer_progress.connect(self.update_transfer)
+        self.transfer_status.connect(self.set_status)
+        self.transfer_finished.connect(self.finish_transfer)
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        actions_layout = QHBoxLayout()
+        self.cancel_btn = QPushButton("Отменить выбранные")
+        self.cancel_btn.clicked.connect(self.cancel_selected)
+        self.clear_btn = QPushButton("Очистить завершенные")
+        self.clear_btn.clicked.connect(self.clear_finished)
+        cancel_icon = load_icon_from_assets("stop.svg", QColor("#64748b"), size=16)
+        if not cancel_icon.isNull():
+            self.cancel_btn.setIcon(cancel_icon)
+        clear_icon = load_icon_from_assets("clear_all.svg", QColor("#64748b"), size=16)
+        if not clear_icon.isNull():
+            self.clear_btn.setIcon(clear_icon)
+        actions_layout.addWidget(self.cancel_btn)
+        actions_layout.addWidget(self.clear_btn)
+        actions_layout.addStretch()
+        layout.addLayout(actions_layout)
+
+        self.tree = QTreeWidget()
+        self.tree.setRootIsDecorated(False)
+        self.tree.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.tree.setHeaderLabels(["", "Клиент", "Файл", "Прогресс", "Скорость", "Статус"])
+        self.tree.header().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.tree.header().setSectionResizeMode(self.COL_FILE, QHeaderView.Stretch)
+        self.tree.setColumnWidth(self.COL_PROGRESS, 180)
+        layout.addWidget(self.tree)
+
+    def add_transfer(self, key, direction, client_label, name, total=0, cancel_callback=None):
+        """
+        Добавляет передачу в очередь. direction: 'download' (с клиента) или 'upload' (на клиент).
+        cancel_callback вызывается в GUI-потоке при отмене пользователем.
+        """
+        item = QTreeWidgetItem(["↓" if direction == "download" else "↑", client_label, name, "", "", "Ожидание"])
+        item.setToolTip(self.COL_DIRECTION, "Скачивание с клиента" if direction == "download" else "Загрузка на клиент")
+        item.setToolTip(self.COL_FILE, name)
+        self.tree.addTopLevelItem(item)
+        bar = QProgressBar()
+        bar.setRange(0, 100)
+        bar.setValue(0)
+        self.tree.setItemWidget(item, self.COL_PROGRESS, bar)
+        self.rows[key] = {
+            'item': item,
+            'bar': bar,
+            'cancel': cancel_callback,
+            'started': time.monotonic(),
+            'done': 0,
+            'total': total,
+            'finished': False,
+        }
+        self.active_count_changed.emit(self.active_count())
+
+    def update_transfer(self, key, done, total=None):
+        row = self.rows.get(key)
+        if not row or row['finished']:
+            return
+        if total:
+            row['total'] = total
+        row['done'] = done
+        if row['total']:
+            row['bar'].setValue(int(done * 100 / row['total']))
+        row['bar'].setFormat(f"{done / 1024 / 1024:.1f} / {row['total'] / 1024 / 1024:.1f} MB")
+        elapsed = time.monotonic() - row['started']
+        if elapsed > 0:
+            row['item'].setText(self.COL_SPEED, f"{done / elapsed / 1024 / 1024:.2f} MB/s")
+        if row['item'].text(self.COL_STATUS) == "Ожидание":
+            row['item'].setText(self.COL_STATUS, "Передача")
+
+    def set_status(self, key, text):
+        row = self.rows.get(key)
+        if row and not row['finished']:
+            row['item'].setText(self.COL_STATUS, text)
+
+    def finish_transfer(self, key, success, message=""):
+        row = self.rows.get(key)
+        if not row or row['finished']:
+            return
+        row['finished'] = True
+        row['cancel'] = None
+        if success:
+            row['bar'].setValue(100)
+        row['item'].setText(self.COL_SPEED, "")
+        row['item'].setText(self.COL_STATUS, message or ("Завершено" if success else "Ошибка"))
+        row['item'].setForeground(self.COL_STATUS, QColor("#16a34a") if success else QColor("#dc2626"))
+        self.active_count_changed.emit(self.active_count())
+
+    def has_transfer(self, key):
+        return key in self.rows and not self.rows[key]['finished']
+
+    def active_count(self):
+        return sum(1 for row in self.rows.values() if not row['finished'])
+
+    def cancel_selected(self):
+        selected = set(id(item) for item in self.tree.selectedItems())
+        for row in list(self.rows.values()):
+            if id(row['item']) in selected and not row['finished'] and row['cancel']:
+                row['cancel']()
+
+    def clear_finished(self):
+        for key, row in list(self.rows.items()):
+            if row['finished']:
+                index = self.tree.indexOfTopLevelItem(row['item'])
+                if index != -1:
+                    self.tree.takeTopLevelItem(index)
+                del self.rows[key]
@@ -3,7 +3,8 @@
 import sys
 import os
 import logging
-from PyQt5.QtWidgets import QApplication
+import argparse
+import multiprocessing
 
 # Добавляем корневую папку проекта в sys.path, чтобы разрешить абсолютные импорты.
 # Это позволяет запускать main.py напрямую из его папки.
@@ -12,14 +13,20 @@ if __package__ is None or __package__ == '':
     if project_root not in sys.path:
         sys.path.insert(0, project_root)
 
-from astra_monitor_server.gui.main_window import ServerGUI
-
 # Этот файл является точкой входа для запуска серверного приложения.
 # Чтобы запустить его, выполните следующую команду из корневого каталога проекта:
 # python -m astra_monitor_server.main
+# Без GUI (сервер-коллектор без дисплея и PyQt5):
+# python -m astra_monitor_server.main --headless
 
 def main() -> None:
     """Главная функция для запуска приложения сервера."""
+    parser = argparse.ArgumentParser(description="Сервер Astra Monitor")
+    parser.add_argument("--headless", action="store_true", help="запустить сервер без GUI (режим демона)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="число процессов-шардов в headless-режиме (по умолчанию SHARD_WORKERS из конфигурации)")
+    args = parser.parse_args()
+
     # Настройка базового логирования в консоль и файл
     log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
     root_logger = logging.getLogger()
@@ -35,6 +42,16 @@ def main() -> None:
     file_handler.setFormatter(log_formatter)
     root_logger.addHandler(file_handler)
 
+    if args.headless:
+        # Ядро сервера не зависит от Qt: PyQt5 в этом режиме не импортируется
+        from astra_monitor_server.config_loader import APP_CONFIG
+        from astra_monitor_server.server.headless import run_headless
+        run_headless(args.workers if args.workers is not None else APP_CONFIG.get('SHARD_WORKERS', 0))
+        return
+
+    from PyQt5.QtWidgets import QApplication
+    from astra_monitor_server.gui.main_window import ServerGUI
+
     app = QApplication(sys.argv)
     # Запрещаем приложению завершаться при закрытии последнего окна,
     # чтобы оно могло оставаться в системном трее.
@@ -45,5 +62,7 @@ def main() -> None:
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
+    # Процессы-шарды запускаются через spawn: в собранном исполняемом файле это обязательно
+    multiprocessing.freeze_support()
     main()
     
\ No newline at end of file
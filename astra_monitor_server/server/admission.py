@@ -0,0 +1,37 @@
+# astra_monitor_server/server/admission.py
+
+import time
+
+
+class AdmissionControl:
+    """
+    Ограничение частоты новых подключений (token bucket): burst подключений принимается
+    сразу, дальше - rate в секунду. Отклоненный клиент получает свой слот в будущем:
+    слоты выдаются через 1/rate секунды друг за другом, поэтому после перезапуска сервера
+    клиенты возвращаются равномерно, а не снова все разом.
+    """
+
+    def __init__(self, rate, burst, max_retry_after=120, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_retry_after = max_retry_after
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self.next_slot = 0.0 # момент, начиная с которого выдаются слоты следующим отклоненным
+
+    def admit(self):
+        """0 - подключение принято, иначе - через сколько секунд клиенту прийти снова."""
+        if self.rate <= 0:
+            return 0
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        # Токен для этого клиента появится не раньше, чем через (1 - tokens) / rate
+        slot = max(self.next_slot, now + (1 - self.tokens) / self.rate)
+        retry_after = min(slot - now, self.max_retry_after)
+        self.next_slot = now + retry_after + 1 / self.rate
+        return retry_after
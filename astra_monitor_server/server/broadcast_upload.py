@@ -0,0 +1,244 @@
+# astra_monitor_server/server/broadcast_upload.py
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from .delta_sync import DELTA_SYNC_CAPABILITY, choose_block_size, compute_delta, delta_executor, delta_worthwhile
+from .transfer_frames import BINARY_FRAMES_CAPABILITY, new_transfer_id, pack_frame, unpack_frame
+
+
+class _SharedChunks:
+    """
+    Чанки файла, прочитанные и закодированные один раз для всех получателей. Хранится
+    только готовый бинарный кадр (и JSON с base64, пока чанк нужен клиенту без бинарных
+    кадров), причем не больше max_chunks последних использованных чанков: отставший
+    клиент получает вытесненный чанк повторным чтением с диска. Память ограничена
+    max_chunks * chunk_size (вдвое больше при клиентах без бинарных кадров), а не размером файла.
+    """
+
+    def __init__(self, loop, path, chunk_size, transfer_id, max_chunks=16):
+        self.loop = loop
+        self.path = path
+        self.chunk_size = chunk_size
+        self.transfer_id = transfer_id
+        self.max_chunks = max(1, max_chunks)
+        self.size = os.path.getsize(path)
+        self.count = (self.size + chunk_size - 1) // chunk_size
+        self.chunks = OrderedDict() # index -> {'offset', 'size', 'frame', 'legacy'}, в порядке использования
+        self.hashed = 0 # сколько чанков от начала файла учтено в hasher
+        self.hasher = hashlib.sha256()
+        self.lock = asyncio.Lock()
+
+    async def get(self, index, legacy=False):
+        """Возвращает чанк {'offset', 'size', 'frame', 'legacy'}."""
+        async with self.lock:
+            chunk = self.chunks.get(index)
+            if chunk is None:
+                offset = index * self.chunk_size
+                data = await self._hash_until(index)
+                if data is None:
+                    data = await self.loop.run_in_executor(None, self._read_at, offset)
+                chunk = {
+                    'offset': offset,
+                    'size': len(data),
+                    'frame': pack_frame(self.transfer_id, offset, data),
+                    'legacy': None,
+                }
+                self.chunks[index] = chunk
+                while len(self.chunks) > self.max_chunks:
+                    self.chunks.popitem(last=False)
+            else:
+                self.chunks.move_to_end(index)
+            if legacy and chunk['legacy'] is None:
+                _, _, payload = unpack_frame(chunk['frame'])
+                chunk_b64 = base64.b64encode(payload).decode('ascii')
+                chunk['legacy'] = json.dumps({"command": f"upload_file_chunk:{chunk_b64}"})
+            return chunk
+
+    async def _hash_until(self, index):
+        """
+        Дочитывает в hasher чанки до index включительно: хэш считается за один
+        последовательный проход. Возвращает данные чанка index, если он прочитан сейчас.
+        """
+        data = None
+        while self.hashed <= index:
+            data = await self.loop.run_in_executor(None, self._read_at, self.hashed * self.chunk_size)
+            self.hasher.update(data)
+            self.hashed += 1
+        return data
+
+    def _read_at(self, offset):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(self.chunk_size)
+
+    async def sha256(self):
+        async with self.lock:
+            await self._hash_until(self.count - 1)
+        return self.hasher.hexdigest()
+
+
+class BroadcastUpload:
+    """
+    Рассылка одного файла на множество клиентов. Файл хэшируется один раз, а чанки
+    читаются и кодируются для всех получателей сразу (см. _SharedChunks); повторно
+    читается только чанк, уже вытесненный из памяти к приходу отставшего клиента.
+
+    - concurrency ограничивает число клиентов, которым файл передается одновременно;
+    - у каждого клиента своя корутина отправки, которая ждет освобождения буфера его
+      соединения (backpressure): медленный клиент тормозит только себя, а при
+      превышении send_timeout считается неудачным.
+    """
+
+    def __init__(self, ws_server, local_path, remote_path, chunk_size=4 * 1024 * 1024,
+                 concurrency=20, send_timeout=120, progress_callback=None):
+        self.ws_server = ws_server
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.chunk_size = chunk_size
+        self.concurrency = max(1, concurrency)
+        self.send_timeout = send_timeout
+        self.progress_callback = progress_callback # (client_id, sent_bytes, total_bytes)
+        self.transfer_id = new_transfer_id()
+        self.succeeded = []
+        self.failed = {} # client_id -> причина
+        self.pending = []
+        self.delta_plans = {} # sha256 сигнатуры клиента -> Future с планом разности (одинаковые версии считаются один раз)
+
+    async def run(self, client_ids, after_upload=None, on_client_done=None):
+        """
+        Выполняет рассылку. after_upload(client_id) - корутина, вызываемая после успешной
+        передачи (например, установка пакета); on_client_done(client_id, success, reason)
+        вызывается по завершении каждого клиента. Возвращает сводку summary().
+        """
+        self.pending = list(client_ids)
+        chunks = _SharedChunks(self.ws_server.loop, self.local_path, self.chunk_size, self.transfer_id)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def worker(client_id):
+            async with semaphore:
+                self.pending.remove(client_id)
+                reason = await self._push(client_id, chunks)
+                if reason is None and after_upload:
+                    try:
+                        await after_upload(client_id)
+                    except Exception as e:
+                        reason = f"Ошибка после загрузки: {e}"
+                if reason is None:
+                    self.succeeded.append(client_id)
+                else:
+                    self.failed[client_id] = reason
+                if on_client_done:
+                    on_client_done(client_id, reason is None, reason)
+
+        tasks = [asyncio.ensure_future(worker(client_id)) for client_id in client_ids]
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.summary()
+
+    def summary(self):
+        return {
+            'transfer_id': self.transfer_id,
+            'file': os.path.basename(self.local_path),
+            'succeeded': list(self.succeeded),
+            'failed': dict(self.failed),
+            'pending': list(self.pending),
+        }
+
+    async def _delta_plan(self, blocks, block_size):
+        """План разности для сигнатуры клиента; у клиентов с одинаковой версией файла он общий."""
+        key = hashlib.sha256(json.dumps(blocks).encode('utf-8')).hexdigest()
+        plan_future = self.delta_plans.get(key)
+        if plan_future is None:
+            plan_future = self.ws_server.loop.run_in_executor(delta_executor(), compute_delta, self.local_path, blocks, block_size)
+            self.delta_plans[key] = plan_future
+        return await asyncio.shield(plan_future)
+
+    async def _push_delta(self, client_id, size):
+        """
+        Передает клиенту только отличия от имеющейся у него версии файла.
+        Возвращает (True, None или текст ошибки) или (False, None), если нужно отправить файл целиком.
+        """
+        block_size = choose_block_size(size)
+        blocks = await self.ws_server.request_signature(client_id, self.transfer_id, self.remote_path, block_size)
+        if not blocks:
+            return False, None
+        plan = await self._delta_plan(blocks, block_size)
+        if plan is None:
+            return False, None
+
+        def report(sent_bytes, total_bytes):
+            self.progress_callback(client_id, sent_bytes, total_bytes)
+
+        error = await self.ws_server.send_delta_plan(client_id, self.transfer_id, self.local_path, self.remote_path,
+                                                     plan, block_size, report if self.progress_callback else None)
+        return True, error
+
+    async def _push(self, client_id, chunks):
+        """Передает файл одному клиенту. Возвращает None при успехе или текст ошибки."""
+        if client_id not in self.ws_server.clients:
+            return "Клиент не подключен"
+        binary = self.ws_server.client_supports(client_id, BINARY_FRAMES_CAPABILITY)
+        try:
+            if binary and delta_worthwhile(chunks.size) and self.ws_server.client_supports(client_id, DELTA_SYNC_CAPABILITY):
+                sent, error = await self._push_delta(client_id, chunks.size)
+                if sent:
+                    return error
+
+            if binary:
+                start_params = {"transfer_id": self.transfer_id, "path": self.remote_path, "size": chunks.size}
+                error = await self.ws_server.start_upload(client_id, self.transfer_id,
+                                                          f"transfer:upload_start:{json.dumps(start_params)}")
+                if error is not None:
+                    return error
+            elif not await self.ws_server.send_command(client_id, f"upload_file_start:{self.remote_path}:{chunks.size}"):
+                return "Не удалось начать передачу"
+
+            sent_bytes = 0
+            for index in range(chunks.count):
+                if self.ws_server.upload_errors.get((client_id, self.transfer_id)):
+                    # Клиент отказался принимать данные (например, ошибка записи на диск)
+                    return self.ws_server.upload_errors[(client_id, self.transfer_id)]
+                chunk = await chunks.get(index, legacy=not binary)
+                message = chunk['frame'] if binary else chunk['legacy']
+                # Очередь клиента ограничена: send_raw ждет, пока медленный клиент примет предыдущие чанки
+                if not await asyncio.wait_for(self.ws_server.send_raw(client_id, message), timeout=self.send_timeout):
+                    return "Клиент отключился"
+                sent_bytes += chunk['size']
+                if self.progress_callback:
+                    self.progress_callback(client_id, sent_bytes, chunks.size)
+
+            sha256 = await chunks.sha256()
+            if binary:
+                end_params = {"transfer_id": self.transfer_id, "sha256": sha256}
+                end_command = f"transfer:upload_end:{json.dumps(end_params)}"
+            else:
+                end_command = f"upload_file_end:{sha256}"
+            # Успех - только file_upload_result "success": подтверждение команды приходит до проверки файла
+            try:
+                return await self.ws_server.finish_upload(client_id, self.transfer_id, end_command)
+            except ConnectionError:
+                return "Клиент отключился до подтверждения загрузки"
+            except asyncio.TimeoutError:
+                return "Клиент не подтвердил завершение передачи"
+        except asyncio.TimeoutError:
+            return "Клиент не успевает принимать данные"
+        except asyncio.CancelledError:
+            if binary:
+                cancel_params = {"transfer_id": self.transfer_id, "path": self.remote_path}
+                await self.ws_server.send_command(client_id, f"transfer:upload_cancel:{json.dumps(cancel_params)}")
+            else:
+                await self.ws_server.send_command(client_id, f"cancel_upload:{self.remote_path}")
+            raise
+        except Exception as e:
+            return f"Ошибка передачи: {e}"
+        finally:
+            self.ws_server.upload_errors.pop((client_id, self.transfer_id), None)
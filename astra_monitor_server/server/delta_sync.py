@@ -0,0 +1,136 @@
+# astra_monitor_server/server/delta_sync.py
+
+import hashlib
+import math
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+from ..config_loader import APP_CONFIG
+
+# Возможность клиента: загрузка файлов разностью (rsync-подобные блоки)
+DELTA_SYNC_CAPABILITY = "delta_sync"
+
+# Файлы меньше этого размера передаются целиком: обмен сигнатурами дороже выигрыша
+DELTA_MIN_SIZE = 1024 * 1024
+# Файлы больше этого размера тоже: сканирование идет побайтно на чистом Python
+DELTA_MAX_SIZE = APP_CONFIG.get('DELTA_MAX_SIZE', 64 * 1024 * 1024)
+DELTA_MAX_LITERAL_RATIO = APP_CONFIG.get('DELTA_MAX_LITERAL_RATIO', 0.5)
+
+WEAK_MODULUS = 1 << 16
+
+_executor = None
+
+
+def delta_worthwhile(size):
+    """Стоит ли искать разность для файла такого размера."""
+    return DELTA_MIN_SIZE <= size <= DELTA_MAX_SIZE
+
+
+def delta_executor():
+    """
+    Пул процессов для compute_delta. Сканирование держит GIL все время работы, поэтому
+    в пуле потоков оно останавливало бы event loop сервера. spawn - как у процессов-шардов.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max(1, APP_CONFIG.get('DELTA_WORKERS', 2)),
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def choose_block_size(size):
+    """Размер блока ~ sqrt(размера файла), кратный 1 КБ, в пределах 2-64 КБ."""
+    block_size = int(math.sqrt(size)) // 1024 * 1024
+    return max(2048, min(64 * 1024, block_size))
+
+
+def weak_checksum(block):
+    """Слабая (rolling) контрольная сумма блока, как в rsync: пара (a, b) по модулю 2^16."""
+    a = sum(block) % WEAK_MODULUS
+    b = sum(accumulate(block)) % WEAK_MODULUS
+    return a, b
+
+
+def strong_checksum(block):
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+def compute_delta(path, blocks, block_size, max_literal_ratio=DELTA_MAX_LITERAL_RATIO):
+    """
+    Сравнивает локальный файл с сигнатурой файла клиента и строит план передачи:
+    {'size', 'sha256', 'literal_bytes', 'ops'}, где ops - список
+    ('copy', target_offset, block_index, count) и ('data', target_offset, length).
+
+    Совпадения ищутся скользящим окном: сначала по слабой сумме (O(1) на сдвиг),
+    затем проверяются сильной. Если передавать пришлось бы больше max_literal_ratio
+    файла, возвращает None - выгоднее отправить файл целиком.
+    Выполняется в delta_executor().
+    """
+    size = os.path.getsize(path)
+    table = {}
+    for index, (weak, strong) in enumerate(blocks):
+        table.setdefault(weak, {}).setdefault(strong, index)
+
+    ops = []
+    literal_limit = size * max_literal_ratio
+    literal_bytes = 0
+
+    def add_copy(offset, index):
+        last = ops[-1] if ops else None
+        if last and last[0] == 'copy' and last[2] + last[3] == index and last[1] + last[3] * block_size == offset:
+            ops[-1] = ('copy', last[1], last[2], last[3] + 1)
+        else:
+            ops.append(('copy', offset, index, 1))
+
+    with open(path, 'rb') as f:
+        if size == 0:
+            return {'size': 0, 'sha256': hashlib.sha256().hexdigest(), 'literal_bytes': 0, 'ops': []}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            sha256 = hashlib.sha256(data).hexdigest()
+            position = 0
+            literal_start = 0
+            a = b = None
+            while position + block_size <= size:
+                if a is None:
+                    a, b = weak_checksum(data[position:position + block_size])
+                candidates = table.get((b << 16) | a)
+                if candidates:
+                    index = candidates.get(strong_checksum(data[position:position + block_size]))
+                    if index is not None:
+                        if literal_start < position:
+                            ops.append(('data', literal_start, position - literal_start))
+                            literal_bytes += position - literal_start
+                        add_copy(position, index)
+                        position += block_size
+                        literal_start = position
+                        a = None
+                        continue
+                if literal_bytes + (position - literal_start) > literal_limit:
+                    return None
+                # Сдвиг окна на один байт: пересчет слабой суммы за O(1)
+                out_byte = data[position]
+                if position + block_size < size:
+                    in_byte = data[position + block_size]
+                    a = (a - out_byte + in_byte) % WEAK_MODULUS
+                    b = (b - block_size * out_byte + a) % WEAK_MODULUS
+                position += 1
+
+            # Хвост короче блока может совпасть только с последним (неполным) блоком клиента
+            tail = size - literal_start
+            if 0 < size - position < block_size and position == literal_start and blocks:
+                last_block = data[position:size]
+                a_tail, b_tail = weak_checksum(last_block)
+                last_weak, last_strong = blocks[-1]
+                if last_weak == (b_tail << 16) | a_tail and last_strong == strong_checksum(last_block):
+                    ops.append(('copy', position, len(blocks) - 1, 1))
+                    tail = 0
+            if tail > 0:
+                ops.append(('data', literal_start, tail))
+                literal_bytes += tail
+
+    if literal_bytes > literal_limit:
+        return None
+    return {'size': size, 'sha256': sha256, 'literal_bytes': literal_bytes, 'ops': ops}
@@ -0,0 +1,22 @@
+# astra_monitor_server/server/events.py
+
+
+class Signal:
+    """
+    Сигнал ядра сервера без Qt: connect()/emit() как у pyqtSignal, но обработчики
+    вызываются синхронно в потоке, где вызван emit (в потоке event loop сервера).
+    GUI переносит события в свой поток через ServerBridge.
+    """
+
+    def __init__(self):
+        self.handlers = []
+
+    def connect(self, handler):
+        self.handlers.append(handler)
+
+    def disconnect(self, handler):
+        self.handlers.remove(handler)
+
+    def emit(self, *args):
+        for handler in list(self.handlers):
+            handler(*args)
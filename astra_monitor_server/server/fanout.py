@@ -0,0 +1,143 @@
+# astra_monitor_server/server/fanout.py
+
+import asyncio
+import uuid
+from collections import deque
+
+
+class FanoutCommand:
+    """
+    Выполнение одной shell-команды (execute:) на множестве клиентов со сводкой результатов.
+
+    - window ограничивает число клиентов, на которых команда выполняется одновременно;
+    - результат клиента (код возврата или ошибка и вывод) попадает в группу одинаковых
+      результатов, поэтому сводка по тысячам клиентов - несколько строк вида
+      "312 клиентов: код 0, OK";
+    - progress_callback(summary) получает текущую сводку не чаще publish_interval секунд
+      и еще раз по завершении;
+    - отмена корутины run() отменяет задания, уже запущенные на клиентах.
+    """
+
+    def __init__(self, ws_server, command, window=50, timeout=620, progress_callback=None,
+                 publish_interval=0.25, max_groups=200):
+        self.ws_server = ws_server
+        self.command = command
+        self.window = max(1, window)
+        self.timeout = timeout
+        self.progress_callback = progress_callback
+        self.publish_interval = publish_interval
+        self.max_groups = max_groups # сколько самых крупных групп передается в сводке
+        self.fanout_id = uuid.uuid4().hex
+        self.total = 0
+        self.done = 0
+        self.pending = deque()
+        self.running = {} # client_id -> command_id задания на клиенте
+        self.groups = {} # (исход, вывод) -> {'outcome', 'ok', 'output', 'client_ids'}
+        self.finished = False
+        self.cancelled = False
+        self.publish_handle = None
+        self.task = None
+
+    async def run(self, client_ids):
+        """Выполняет команду на client_ids. Возвращает итоговую сводку summary()."""
+        self.task = asyncio.current_task()
+        self.pending = deque(client_ids)
+        self.total = len(self.pending)
+        self._publish()
+        workers = [asyncio.ensure_future(self._worker()) for _ in range(min(self.window, self.total))]
+        try:
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            for client_id, command_id in list(self.running.items()):
+                asyncio.ensure_future(self.ws_server.send_command(client_id, f"cancel_job:{command_id}"))
+        finally:
+            self.finished = True
+            if self.publish_handle is not None:
+                self.publish_handle.cancel()
+                self.publish_handle = None
+            self._publish()
+        return self.summary()
+
+    def cancel(self):
+        """Отменяет выполнение; можно вызывать из любого потока."""
+        if self.task is not None:
+            self.ws_server.loop.call_soon_threadsafe(self.task.cancel)
+
+    async def _worker(self):
+        while self.pending:
+            client_id = self.pending.popleft()
+            command_id = uuid.uuid4().hex
+            self.running[client_id] = command_id
+            self._schedule_publish()
+            try:
+                response = await self.ws_server.request(client_id, f"execute:{self.command}",
+                                                        timeout=self.timeout, emit=False, command_id=command_id)
+                outcome, ok, output = self._parse_response(response)
+            except ConnectionError:
+                outcome, ok, output = "клиент не подключен", False, ""
+            except asyncio.TimeoutError:
+                asyncio.ensure_future(self.ws_server.send_command(client_id, f"cancel_job:{command_id}"))
+                outcome, ok, output = f"нет ответа за {self.timeout} сек", False, ""
+            del self.running[client_id]
+            self._add_result(client_id, outcome, ok, output)
+
+    @staticmethod
+    def _parse_response(response):
+        """(исход, успех, вывод) из ответа клиента на execute:."""
+        job = response.get('job_result')
+        if job is not None:
+            if job.get('error'):
+                return job['error'], False, job.get('output', '')
+            exit_code = job.get('exit_code')
+            return f"код {exit_code}", exit_code == 0, job.get('output', '')
+        # Клиенты без фоновых заданий (и команда cd) отвечают command_result / command_error
+        error = response.get('command_error', response.get('error'))
+        if error is not None:
+            return "ошибка", False, str(error)
+        return "код 0", True, response.get('command_result', '')
+
+    def _add_result(self, client_id, outcome, ok, output):
+        output = output.strip()
+        group = self.groups.get((outcome, output))
+        if group is None:
+            group = {'outcome': outcome, 'ok': ok, 'output': output, 'client_ids': []}
+            self.groups[(outcome, output)] = group
+        group['client_ids'].append(client_id)
+        self.done += 1
+        self._schedule_publish()
+
+    def _schedule_publish(self):
+        if self.progress_callback is None or self.publish_handle is not None:
+            return
+        self.publish_handle = asyncio.get_running_loop().call_later(self.publish_interval, self._publish)
+
+    def _publish(self):
+        self.publish_handle = None
+        if self.progress_callback:
+            self.progress_callback(self.summary())
+
+    def summary(self):
+        groups = sorted(self.groups.values(), key=lambda group: len(group['client_ids']), reverse=True)
+        shown = groups[:self.max_groups]
+        return {
+            'fanout_id': self.fanout_id,
+            'command': self.command,
+            'total': self.total,
+            'done': self.done,
+            'running': len(self.running),
+            'pending': list(self.pending),
+            'finished': self.finished,
+            'cancelled': self.cancelled,
+            'groups': [
+                {'outcome': group['outcome'], 'ok': group['ok'], 'output': group['output'],
+                 'client_ids': list(group['client_ids'])}
+                for group in shown
+            ],
+            # Остальные (мелкие) группы - только количество
+            'other_groups': len(groups) - len(shown),
+            'other_clients': sum(len(group['client_ids']) for group in groups[self.max_groups:]),
+        }
@@ -0,0 +1,106 @@
+# astra_monitor_server/server/headless.py
+
+import json
+import logging
+import signal
+
+from ..config_loader import APP_CONFIG
+from .protocol import METRIC_MESSAGE_TYPES
+from .websocket_server import WebSocketServer
+from .sharding import ShardCoordinator
+
+
+class HeadlessConsole:
+    """
+    Потребитель ядра сервера без GUI: ведет реестр клиентов, пишет в лог подключения
+    и отключения, раз в stats_interval секунд - сводку по клиентам и сообщениям.
+    """
+
+    def __init__(self, ws_server, stats_interval=60):
+        self.ws_server = ws_server
+        self.stats_interval = stats_interval
+        self.clients = {} # client_id -> {'hostname', 'ip', 'status', 'metrics'}
+        self.messages = 0
+        ws_server.started.connect(self.on_started)
+        ws_server.new_connection.connect(self.on_new_connection)
+        ws_server.connection_lost.connect(self.on_connection_lost)
+        ws_server.messages_ready.connect(self.on_messages)
+
+    def on_started(self):
+        loop = self.ws_server.loop
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, self.ws_server.stop_server)
+            except (NotImplementedError, RuntimeError):
+                pass # Windows или не главный поток: остается KeyboardInterrupt
+        if self.stats_interval > 0:
+            loop.call_later(self.stats_interval, self.report)
+
+    def on_new_connection(self, connection_data_json):
+        connection_data = json.loads(connection_data_json)
+        client_id = connection_data['client_id']
+        client_info = connection_data.get('client_info', {})
+        record = self.clients.setdefault(client_id, {'metrics': {}})
+        record.update({
+            'hostname': client_info.get('hostname', record.get('hostname', 'N/A')),
+            'ip': connection_data.get('client_ip'),
+            'status': 'Connected',
+        })
+        action = "продолжил сессию" if connection_data.get('resumed') else "подключен"
+        logging.info("Клиент %s (%s) %s", record['hostname'], client_id, action)
+
+    def on_connection_lost(self, client_id):
+        record = self.clients.get(client_id)
+        if record is not None:
+            record['status'] = 'Disconnected'
+            logging.warning("[Отключение] %s (%s)", client_id, record.get('hostname'))
+
+    def on_messages(self, batch):
+        self.messages += len(batch)
+        for data in batch:
+            if data.get('type') in METRIC_MESSAGE_TYPES:
+                record = self.clients.get(data.get('client_id'))
+                if record is not None:
+                    record['metrics'] = {key: data.get(key) for key in ('cpu_percent', 'memory_percent', 'disk_percent')}
+
+    def report(self):
+        connected = sum(1 for record in self.clients.values() if record['status'] == 'Connected')
+        logging.info(
+            "Клиентов подключено: %d из %d, сообщений за %d с: %d",
+            connected, len(self.clients), self.stats_interval, self.messages
+        )
+        self.messages = 0
+        self.ws_server.loop.call_later(self.stats_interval, self.report)
+
+
+def _load_max_size_mb():
+    """Максимальный размер сообщения - из тех же настроек, что использует GUI."""
+    try:
+        with open(APP_CONFIG['SETTINGS_FILE'], 'r', encoding='utf-8') as f:
+            settings = json.load(f)
+        return settings.get('server_settings', {}).get('websocket_max_size_mb', 100)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 100
+
+
+def run_headless(workers=0):
+    """
+    Запускает сервер без GUI в текущем потоке до SIGTERM/SIGINT.
+    workers > 1 - шардированный режим: соединения принимают процессы-шарды, здесь работает координатор.
+    """
+    max_size = _load_max_size_mb() * 1024 * 1024
+    if workers > 1:
+        ws_server = ShardCoordinator(workers, max_size=max_size)
+    else:
+        ws_server = WebSocketServer(
+            host=APP_CONFIG['SERVER_HOST'],
+            port=APP_CONFIG['SERVER_PORT'],
+            max_size=max_size
+        )
+    HeadlessConsole(ws_server, APP_CONFIG.get('HEADLESS_STATS_INTERVAL', 60))
+    logging.info("Сервер запущен в headless-режиме.")
+    try:
+        ws_server.start_server()
+    except KeyboardInterrupt:
+        pass
+    logging.info("Сервер остановлен.")
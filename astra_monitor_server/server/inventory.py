@@ -0,0 +1,88 @@
+# astra_monitor_server/server/inventory.py
+
+import asyncio
+
+
+def apply_merge_patch(target, patch):
+    """Применяет JSON Merge Patch (RFC 7386) к target и возвращает результат; target не меняется."""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+class InventoryStore:
+    """
+    Последняя известная инвентаризация (get_full_system_info) каждого клиента. Клиенты с
+    возможностью inventory_push сами присылают изменения (inventory_delta) относительно
+    версии, которую сервер уже получил; при расхождении версий сервер один раз
+    запрашивает полный снимок. Данные переживают отключение клиента.
+    """
+
+    def __init__(self, ws_server, resync_timeout=60):
+        self.ws_server = ws_server
+        self.resync_timeout = resync_timeout
+        self.inventories = {} # client_id -> {'version', 'data'}
+        self.resyncs = {} # client_id -> задача запроса полного снимка
+
+    def get(self, client_id):
+        """Инвентаризация клиента или None, если она еще не получена."""
+        inventory = self.inventories.get(client_id)
+        return inventory['data'] if inventory and inventory['data'] else None
+
+    def on_connect(self, client_id, version):
+        """
+        Сверяет версию, предъявленную клиентом при аутентификации. Новый процесс клиента
+        (версия None) сам пришлет полную разность, иначе расхождение - повод для снимка.
+        """
+        inventory = self.inventories.get(client_id)
+        if version is None or (inventory and inventory['version'] == version):
+            return
+        self.resync(client_id)
+
+    def apply_full(self, client_id, data, version):
+        """Полный снимок из ответа на get_full_system_info."""
+        if not isinstance(data, dict) or 'error' in data:
+            return
+        self.inventories[client_id] = {'version': version, 'data': data}
+
+    def apply_delta(self, client_id, delta):
+        """
+        Применяет inventory_delta и возвращает объединенную инвентаризацию. Разность
+        относительно неизвестной серверу версии не применяется (None), вместо этого
+        запрашивается полный снимок.
+        """
+        base = delta.get('base')
+        inventory = self.inventories.get(client_id)
+        if base is None:
+            # Первая разность процесса клиента построена от пустой инвентаризации
+            data = {}
+        elif inventory and inventory['version'] == base:
+            data = inventory['data']
+        else:
+            self.resync(client_id)
+            return None
+        merged = apply_merge_patch(data, delta.get('patch') or {})
+        self.inventories[client_id] = {'version': delta.get('version'), 'data': merged}
+        return merged
+
+    def resync(self, client_id):
+        """Запрашивает полный снимок (не чаще одного одновременного запроса на клиента)."""
+        task = self.resyncs.get(client_id)
+        if task is None or task.done():
+            self.resyncs[client_id] = asyncio.ensure_future(self._resync(client_id))
+
+    async def _resync(self, client_id):
+        try:
+            # Ответ проходит через основной цикл обработчика, где и попадает в apply_full
+            await self.ws_server.request(client_id, "get_full_system_info",
+                                         timeout=self.resync_timeout, emit=False)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            print(f"⚠️  Не удалось получить инвентаризацию {client_id}: {e}")
+        finally:
+            self.resyncs.pop(client_id, None)
@@ -0,0 +1,136 @@
+# astra_monitor_server/server/message_router.py
+
+import asyncio
+import threading
+from collections import deque
+
+from .protocol import METRIC_MESSAGE_TYPES
+
+# Скриншоты: из нескольких за интервал доставляется только последний
+SCREENSHOT_MESSAGE_TYPES = frozenset({"screenshot", "screenshot_update"})
+
+
+class MessageRouter:
+    """
+    Маршрутизация сообщений клиентов в потоке event loop, без обращения к Qt.
+
+    - чанки скачивания прежнего протокола передаются зарегистрированным приемникам сразу;
+    - история метрик ведется здесь, в GUI уходит ее снимок вместе с метриками;
+    - остальные сообщения копятся и отдаются publish(list) пачкой раз в flush_interval,
+      при этом метрики клиента сливаются в одно сообщение, от скриншотов остается
+      последний, а фрагменты вывода терминала и заданий склеиваются.
+    """
+
+    def __init__(self, publish, flush_interval=0.1, history_size=120):
+        self.publish = publish
+        self.flush_interval = flush_interval
+        self.history_size = history_size
+        self.chunk_sinks = {} # (client_id, remote_path) -> функция приема base64-чанка
+        self.history = {} # client_id -> {'cpu': deque, 'mem': deque, 'disk': deque}
+        self.history_lock = threading.Lock()
+        self.screenshot_clients = None # None - скриншоты нужны от всех, иначе множество client_id
+        self.pending = []
+        self.slots = {} # (client_id, тип) -> индекс сообщения в pending, с которым сливаются новые
+        self.flush_handle = None
+
+    def register_chunk_sink(self, client_id, remote_path, sink):
+        self.chunk_sinks[(client_id, remote_path)] = sink
+
+    def unregister_chunk_sink(self, client_id, remote_path):
+        self.chunk_sinks.pop((client_id, remote_path), None)
+
+    def set_screenshot_clients(self, client_ids):
+        """Клиенты, скриншоты которых сейчас видны в GUI (None - все). Остальные отбрасываются."""
+        self.screenshot_clients = None if client_ids is None else frozenset(client_ids)
+
+    def get_history(self, client_id):
+        """Снимок истории метрик клиента: {'cpu': [...], 'mem': [...], 'disk': [...]}."""
+        with self.history_lock:
+            history = self.history.get(client_id)
+            if history is None:
+                return {"cpu": [], "mem": [], "disk": []}
+            return {name: list(values) for name, values in history.items()}
+
+    def route(self, data):
+        client_id = data.get('client_id')
+        msg_type = data.get('type')
+
+        if msg_type == 'download_file_chunk':
+            info = data['download_file_chunk']
+            sink = self.chunk_sinks.get((client_id, info.get('path')))
+            if sink:
+                sink(info['data'])
+            return
+
+        if msg_type in SCREENSHOT_MESSAGE_TYPES:
+            wanted = self.screenshot_clients
+            if wanted is not None and client_id not in wanted:
+                return
+            self._merge(client_id, msg_type, data, replace=True)
+        elif msg_type in METRIC_MESSAGE_TYPES:
+            self._record_history(client_id, data)
+            self._merge(client_id, msg_type, data, replace=False)
+        elif msg_type == 'interactive_output':
+            slot = self.slots.get((client_id, msg_type))
+            if slot is None:
+                self._append(client_id, msg_type, data)
+            else:
+                merged = self.pending[slot]
+                merged['interactive_output'] = {
+                    'data': merged['interactive_output']['data'] + data['interactive_output']['data']
+                }
+        elif msg_type == 'job_output':
+            info = data['job_output']
+            key = (client_id, msg_type, info.get('job_id'))
+            slot = self.slots.get(key)
+            # Склеиваются только подряд идущие фрагменты одного потока - порядок stdout/stderr сохраняется
+            if slot is None or self.pending[slot]['job_output'].get('stream') != info.get('stream'):
+                self.slots[key] = len(self.pending)
+                self.pending.append(data)
+            else:
+                merged = self.pending[slot]
+                merged['job_output'] = {**merged['job_output'], 'data': merged['job_output']['data'] + info['data']}
+        else:
+            # Вывод терминала после другого сообщения клиента не должен обгонять его
+            self.slots.pop((client_id, 'interactive_output'), None)
+            self.pending.append(data)
+
+        self._schedule_flush()
+
+    def _merge(self, client_id, msg_type, data, replace):
+        slot = self.slots.get((client_id, msg_type))
+        if slot is None:
+            self._append(client_id, msg_type, data)
+        elif replace:
+            self.pending[slot] = data
+        else:
+            self.pending[slot].update(data)
+
+    def _append(self, client_id, msg_type, data):
+        self.slots[(client_id, msg_type)] = len(self.pending)
+        self.pending.append(data)
+
+    def _record_history(self, client_id, data):
+        with self.history_lock:
+            history = self.history.get(client_id)
+            if history is None:
+                history = {name: deque(maxlen=self.history_size) for name in ("cpu", "mem", "disk")}
+                self.history[client_id] = history
+            for name, key in (("cpu", "cpu_percent"), ("mem", "memory_percent"), ("disk", "disk_percent")):
+                value = data.get(key)
+                if isinstance(value, (int, float)):
+                    history[name].append(float(value))
+
+    def _schedule_flush(self):
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        self.flush_handle = None
+        if not self.pending:
+            return
+        batch, self.pending, self.slots = self.pending, [], {}
+        for data in batch:
+            if data.get('type') in METRIC_MESSAGE_TYPES:
+                data['history'] = self.get_history(data.get('client_id'))
+        self.publish(batch)
@@ -0,0 +1,127 @@
+# astra_monitor_server/server/outbox.py
+
+import asyncio
+from collections import deque
+
+# Максимальный объем сообщений, ожидающих отправки одному клиенту
+OUTBOX_MAX_BYTES = 16 * 1024 * 1024
+
+
+class OutboxClosed(ConnectionError):
+    """Соединение клиента закрыто, сообщение не будет отправлено."""
+
+
+class ClientOutbox:
+    """
+    Исходящая очередь одного клиента. Все сообщения в сокет пишет единственная
+    корутина-писатель; websocket.send() внутри нее ждет, пока буфер транспорта
+    опустится ниже high-water mark (write_limit), поэтому медленный клиент
+    сначала заполняет буфер транспорта, затем эту очередь, а дальше отправители
+    ждут в send() - память сервера ограничена max_bytes на клиента.
+    """
+
+    def __init__(self, websocket, max_bytes=OUTBOX_MAX_BYTES):
+        self.websocket = websocket
+        self.max_bytes = max_bytes
+        self.items = deque() # [message, future, coalesce_key]
+        self.queued_bytes = 0
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.closed = False
+        self.changed = asyncio.Condition()
+        self.writer_task = asyncio.ensure_future(self._write_loop())
+
+    async def send(self, message, coalesce_key=None):
+        """
+        Ставит сообщение в очередь и ждет, пока писатель отправит его.
+        Если coalesce_key задан и такое сообщение еще ждет в очереди, новое не добавляется:
+        отправитель дожидается уже стоящего (так повторные запросы не копятся).
+        """
+        async with self.changed:
+            future = self._find_queued(coalesce_key) if coalesce_key is not None else None
+            if future is None:
+                size = len(message)
+                # Сообщение крупнее лимита пропускается в пустую очередь, иначе оно не ушло бы никогда
+                await self.changed.wait_for(
+                    lambda: self.closed or not self.items or self.queued_bytes + size <= self.max_bytes)
+                if self.closed:
+                    raise OutboxClosed("Соединение с клиентом закрыто")
+                future = asyncio.get_running_loop().create_future()
+                self.items.append([message, future, coalesce_key])
+                self.queued_bytes += size
+                self.changed.notify_all()
+        # shield: отмена одного из ожидающих не должна отменять общее сообщение
+        return await asyncio.shield(future) if coalesce_key is not None else await future
+
+    def _find_queued(self, coalesce_key):
+        for _, future, key in self.items:
+            if key == coalesce_key and not future.done():
+                return future
+        return None
+
+    def depth(self):
+        """Состояние очереди: сообщения и байты в очереди, байты в буфере транспорта."""
+        transport = getattr(self.websocket, 'transport', None)
+        return {
+            'messages': len(self.items),
+            'bytes': self.queued_bytes,
+            'transport_bytes': transport.get_write_buffer_size() if transport else 0,
+            'sent_messages': self.sent_messages,
+            'sent_bytes': self.sent_bytes,
+        }
+
+    async def close(self):
+        """Отклоняет все ожидающие сообщения и останавливает писателя."""
+        async with self.changed:
+            self.closed = True
+            self._fail_pending()
+            self.changed.notify_all()
+
+    def _fail_pending(self):
+        while self.items:
+            message, future, _ = self.items.popleft()
+            if not future.done():
+                future.set_exception(OutboxClosed("Соединение с клиентом закрыто"))
+                # Исключение могло остаться без получателя, если отправитель уже отменен
+                future.exception()
+        self.queued_bytes = 0
+
+    async def _write_loop(self):
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.closed or self.items)
+                if self.closed:
+                    return
+                message, future, _ = self.items[0]
+
+            error = None
+            sent = False
+            if not future.done(): # отправитель мог быть отменен, пока сообщение ждало очереди
+                try:
+                    await self.websocket.send(message)
+                    sent = True
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    error = e
+
+            async with self.changed:
+                if self.items and self.items[0][1] is future:
+                    self.items.popleft()
+                    self.queued_bytes -= len(message)
+                if not future.done():
+                    if error is None:
+                        future.set_result(True)
+                    else:
+                        future.set_exception(error)
+                        future.exception()
+                if sent:
+                    self.sent_messages += 1
+                    self.sent_bytes += len(message)
+                if error is not None:
+                    # Сокет сломан - остальные сообщения тоже не уйдут
+                    self.closed = True
+                    self._fail_pending()
+                self.changed.notify_all()
+                if self.closed:
+                    return
@@ -0,0 +1,47 @@
+# astra_monitor_server/server/protocol.py
+
+# Версия протокола, с которой клиент указывает поле "type" в каждом сообщении
+PROTOCOL_VERSION = 2
+
+# Клиент умеет продолжать сессию по токену сервера, не пересылая неизменившиеся настройки
+SESSION_RESUME_CAPABILITY = "session_resume"
+
+# Клиент сам отправляет изменения инвентаризации (inventory_delta) в формате JSON Merge Patch
+INVENTORY_PUSH_CAPABILITY = "inventory_push"
+
+# Код закрытия "Try Again Later" (RFC 6455): сервер перегружен, причина - "retry_after=<секунды>"
+RETRY_AFTER_CLOSE_CODE = 1013
+
+# Сообщения с метриками клиента: только они обновляют данные клиента в списке и сетке
+METRIC_MESSAGE_TYPES = frozenset({"system_info"})
+
+# Ключи сообщений клиентов версии 1 (без поля "type"), в порядке проверки
+_LEGACY_MESSAGE_KEYS = (
+    'files_list', 'full_system_info', 'file_upload_result', 'screenshot_update', 'screenshot',
+    'file_delete_result', 'command_result', 'command_error', 'prompt_update', 'client_settings',
+    'download_file_start', 'download_file_chunk', 'download_file_end', 'rename_result',
+    'apt_repo_data', 'apt_upgradable_list', 'apt_command_output', 'apt_command_result',
+    'install_output', 'install_result', 'message_result', 'interactive_started',
+    'interactive_output', 'interactive_stopped', 'settings_applied', 'folder_created',
+    'screenshot_settings_updated', 'screenshot_settings', 'status',
+)
+
+
+def message_type(data):
+    """Тип сообщения клиента: поле "type", а для клиентов версии 1 - по ключам сообщения."""
+    msg_type = data.get('type')
+    if isinstance(msg_type, str):
+        return msg_type
+    if 'error' in data:
+        return 'error'
+    for key in _LEGACY_MESSAGE_KEYS:
+        if key in data:
+            return key
+    if 'cpu_percent' in data:
+        return 'system_info'
+    return 'unknown'
+
+
+def retry_after_reason(seconds):
+    """Причина закрытия с кодом RETRY_AFTER_CLOSE_CODE: через сколько секунд клиенту переподключаться."""
+    return f"retry_after={seconds:.1f}"
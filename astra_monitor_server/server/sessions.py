@@ -0,0 +1,58 @@
+# astra_monitor_server/server/sessions.py
+
+import secrets
+import time
+from collections import deque
+
+
+class SessionStore:
+    """
+    Токены продолжения сессий клиентов. Токен выдается при каждой аутентификации (старый
+    при этом становится недействительным) и после отключения живет resume_timeout секунд:
+    переподключившийся за это время клиент продолжает сессию без полной передачи данных.
+    """
+
+    def __init__(self, resume_timeout, clock=time.monotonic):
+        self.resume_timeout = resume_timeout
+        self.clock = clock
+        self.sessions = {} # token -> {'client_id', 'settings_hash', 'expires' (None, пока клиент подключен)}
+        self.tokens = {} # client_id -> токен текущей сессии
+        self.expiry = deque() # (expires, token) в порядке отключения
+
+    def resume(self, token, client_id):
+        """Сессия по токену клиента или None, если токен неизвестен, истек или выдан другому клиенту."""
+        self._prune()
+        session = self.sessions.get(token) if isinstance(token, str) else None
+        if session is None or session['client_id'] != client_id:
+            return None
+        return session
+
+    def open(self, client_id, settings_hash):
+        """Выдает клиенту новый токен; прежняя сессия клиента закрывается."""
+        old_token = self.tokens.pop(client_id, None)
+        if old_token:
+            self.sessions.pop(old_token, None)
+        token = secrets.token_urlsafe(24)
+        self.sessions[token] = {'client_id': client_id, 'settings_hash': settings_hash, 'expires': None}
+        self.tokens[client_id] = token
+        return token
+
+    def detach(self, client_id):
+        """Клиент отключился: его сессию можно продолжить в течение resume_timeout."""
+        token = self.tokens.get(client_id)
+        session = self.sessions.get(token)
+        if session is None:
+            return
+        session['expires'] = self.clock() + self.resume_timeout
+        self.expiry.append((session['expires'], token))
+
+    def _prune(self):
+        now = self.clock()
+        while self.expiry and self.expiry[0][0] <= now:
+            expires, token = self.expiry.popleft()
+            session = self.sessions.get(token)
+            # Сессия могла быть продолжена и снова отключена - тогда у нее другой срок
+            if session is not None and session['expires'] == expires:
+                del self.sessions[token]
+                if self.tokens.get(session['client_id']) == token:
+                    del self.tokens[session['client_id']]
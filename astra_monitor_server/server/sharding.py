@@ -0,0 +1,229 @@
+# astra_monitor_server/server/sharding.py
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+from collections import deque
+
+from ..config_loader import APP_CONFIG
+from .events import Signal
+from .task_scheduler import TaskScheduler
+from .websocket_server import WebSocketServer
+
+# Кадр IPC: 4 байта длины (big-endian) + JSON
+_LENGTH = struct.Struct('>I')
+
+
+def _pack(payload):
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    return _LENGTH.pack(len(data)) + data
+
+
+async def _read_frame(reader):
+    header = await reader.readexactly(_LENGTH.size)
+    (length,) = _LENGTH.unpack(header)
+    return json.loads(await reader.readexactly(length))
+
+
+class ShardWorker:
+    """
+    Процесс-шард: обычный WebSocketServer, слушающий общий порт через SO_REUSEPORT
+    (ядро само распределяет новые соединения между шардами). События своих клиентов
+    шард пересылает координатору, команды координатора выполняет у своих клиентов.
+    """
+
+    def __init__(self, shard_id, ipc_path, max_size):
+        self.shard_id = shard_id
+        self.ipc_path = ipc_path
+        self.ws_server = WebSocketServer(
+            host=APP_CONFIG['SERVER_HOST'],
+            port=APP_CONFIG['SERVER_PORT'],
+            max_size=max_size,
+            reuse_port=True
+        )
+        self.outgoing = deque() # кадры, ожидающие отправки координатору
+        self.wakeup = None
+        self.ws_server.started.connect(self._on_started)
+        self.ws_server.new_connection.connect(
+            lambda data: self._forward({'event': 'new_connection', 'data': data}))
+        self.ws_server.connection_lost.connect(
+            lambda client_id: self._forward({'event': 'connection_lost', 'client_id': client_id}))
+        self.ws_server.messages_ready.connect(
+            lambda batch: self._forward({'event': 'messages', 'batch': batch}))
+
+    def run(self):
+        try:
+            self.ws_server.start_server()
+        except KeyboardInterrupt:
+            pass
+
+    def _forward(self, payload):
+        self.outgoing.append(_pack(payload))
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def _on_started(self):
+        self.wakeup = asyncio.Event()
+        asyncio.ensure_future(self._ipc_session())
+
+    async def _ipc_session(self):
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.ipc_path)
+        except OSError as e:
+            logging.error("Шард %d: нет связи с координатором: %s", self.shard_id, e)
+            self.ws_server.stop_server()
+            return
+        writer.write(_pack({'hello': self.shard_id}))
+        sender = asyncio.ensure_future(self._send_loop(writer))
+        try:
+            while True:
+                await self._execute(await _read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logging.warning("Шард %d: координатор закрыл канал, остановка", self.shard_id)
+        finally:
+            sender.cancel()
+            self.ws_server.stop_server()
+
+    async def _send_loop(self, writer):
+        while True:
+            while self.outgoing:
+                writer.write(self.outgoing.popleft())
+            # drain - backpressure: если координатор не успевает, шард копит кадры у себя
+            await writer.drain()
+            self.wakeup.clear()
+            if not self.outgoing:
+                await self.wakeup.wait()
+
+    async def _execute(self, request):
+        op = request.get('op')
+        client_id = request.get('client_id')
+        if op == 'send_command':
+            asyncio.ensure_future(self.ws_server.send_command(
+                client_id, request['command'], coalesce=request.get('coalesce', False)))
+        elif op == 'client_disconnect':
+            asyncio.ensure_future(self.ws_server.client_disconnect(client_id))
+
+
+def run_shard_worker(shard_id, ipc_path, max_size):
+    """Точка входа процесса-шарда."""
+    logging.basicConfig(
+        level=logging.INFO, stream=sys.stdout,
+        format=f'%(asctime)s - %(levelname)s - [shard {shard_id}] - %(message)s'
+    )
+    ShardWorker(shard_id, ipc_path, max_size).run()
+
+
+class ShardCoordinator:
+    """
+    Координатор шардированного режима. Запускает процессы-шарды, собирает их события
+    в те же сигналы, что у WebSocketServer (new_connection, connection_lost, messages_ready,
+    started), и направляет команды шарду, которому принадлежит клиент. Поэтому потребители
+    ядра (headless-консоль, планировщик задач) работают с ним так же, как с одиночным сервером.
+    Передачи файлов и запросы с ответом в этом режиме не поддерживаются.
+    """
+
+    def __init__(self, workers, max_size=100 * 1024 * 1024):
+        self.workers = workers
+        self.max_size = max_size
+        self.messages_ready = Signal()
+        self.new_connection = Signal()
+        self.connection_lost = Signal()
+        self.started = Signal()
+        self.owners = {} # client_id -> номер шарда
+        self.shard_writers = {} # номер шарда -> StreamWriter канала
+        self.processes = []
+        self.ipc_path = os.path.join(tempfile.gettempdir(), f"astra-monitor-shards-{os.getpid()}.sock")
+        self.tasks = TaskScheduler(self)
+        self.loop = None
+
+    def start_server(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._start())
+            self.loop.run_forever()
+        finally:
+            self._stop_workers()
+            if os.path.exists(self.ipc_path):
+                os.remove(self.ipc_path)
+
+    async def _start(self):
+        await asyncio.start_unix_server(self._handle_shard, path=self.ipc_path)
+        # spawn: шард не наследует event loop и потоки координатора
+        context = multiprocessing.get_context('spawn')
+        for shard_id in range(self.workers):
+            process = context.Process(
+                target=run_shard_worker, args=(shard_id, self.ipc_path, self.max_size),
+                name=f"astra-monitor-shard-{shard_id}", daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        print(f"Server started on ws://{APP_CONFIG['SERVER_HOST']}:{APP_CONFIG['SERVER_PORT']} with {self.workers} shard workers")
+        self.started.emit()
+
+    def stop_server(self):
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _stop_workers(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout=5)
+
+    async def _handle_shard(self, reader, writer):
+        shard_id = None
+        try:
+            shard_id = (await _read_frame(reader))['hello']
+            self.shard_writers[shard_id] = writer
+            logging.info("Шард %d подключен к координатору", shard_id)
+            while True:
+                self._dispatch(shard_id, await _read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if shard_id is not None and self.shard_writers.get(shard_id) is writer:
+                del self.shard_writers[shard_id]
+                logging.error("Шард %d отключился от координатора", shard_id)
+                # Клиенты упавшего шарда переподключатся к остальным
+                for client_id, owner in list(self.owners.items()):
+                    if owner == shard_id:
+                        del self.owners[client_id]
+                        self.connection_lost.emit(client_id)
+
+    def _dispatch(self, shard_id, payload):
+        event = payload.get('event')
+        if event == 'messages':
+            self.messages_ready.emit(payload['batch'])
+        elif event == 'new_connection':
+            client_id = json.loads(payload['data'])['client_id']
+            self.owners[client_id] = shard_id
+            self.new_connection.emit(payload['data'])
+        elif event == 'connection_lost':
+            client_id = payload['client_id']
+            # Клиент мог уже переподключиться к другому шарду - старое отключение не в счет
+            if self.owners.get(client_id) == shard_id:
+                del self.owners[client_id]
+                self.connection_lost.emit(client_id)
+
+    async def _send_to_owner(self, client_id, request):
+        writer = self.shard_writers.get(self.owners.get(client_id))
+        if writer is None:
+            return False
+        writer.write(_pack(request))
+        await writer.drain()
+        return True
+
+    async def send_command(self, client_id, command, expect_ack=False, ack_timeout=5, retries=0, coalesce=False):
+        """Команда клиенту через его шард. Подтверждение (expect_ack) в этом режиме не ожидается."""
+        return await self._send_to_owner(
+            client_id, {'op': 'send_command', 'client_id': client_id, 'command': command, 'coalesce': coalesce})
+
+    async def client_disconnect(self, client_id):
+        return await self._send_to_owner(client_id, {'op': 'client_disconnect', 'client_id': client_id})
@@ -0,0 +1,122 @@
+# astra_monitor_server/server/tar_stream.py
+
+import os
+import queue
+import tarfile
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Возможности клиента: потоковая передача директорий и сжатие zstd
+DIR_STREAM_CAPABILITY = "dir_stream"
+ZSTD_CAPABILITY = "zstd"
+
+# Ошибки отдельного элемента архива: элемент пропускается, распаковка продолжается
+if hasattr(tarfile, "FilterError"):
+    MEMBER_ERRORS = (tarfile.FilterError, tarfile.ExtractError)
+else:
+    MEMBER_ERRORS = (tarfile.ExtractError,)
+
+
+class _QueueReader:
+    """Файлоподобный объект для чтения tar-потока из очереди чанков."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        # bytearray: удаление прочитанного начала не копирует остаток (tarfile читает по ~10 КБ)
+        self.buffer = bytearray()
+        self.eof = False
+
+    def read(self, size=-1):
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.eof = True
+            else:
+                self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+class TarStreamExtractor:
+    """
+    Распаковывает tar-архив (без сжатия, gzip или zstd) по мере поступления чанков.
+    Имеет интерфейс записываемого файла, поэтому может стоять на месте обычного
+    файла в контексте скачивания: write() передает данные потоку распаковки,
+    close() дожидается его завершения. Элементы, отклоненные фильтром распаковки
+    (абсолютные ссылки, выход за пределы каталога и т.п.), пропускаются и
+    перечисляются в skipped.
+    """
+
+    def __init__(self, dest_dir, compression="gzip", max_chunks=8):
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("Для распаковки zstd требуется модуль zstandard")
+        os.makedirs(dest_dir, exist_ok=True)
+        self.dest_dir = dest_dir
+        self.compression = compression
+        self.chunks = queue.Queue(maxsize=max_chunks)
+        self.written = 0
+        self.error = None
+        self.skipped = [] # имена пропущенных элементов архива
+        self.closed = False
+        self.thread = threading.Thread(target=self._extract, daemon=True)
+        self.thread.start()
+
+    def _extract(self):
+        reader = _QueueReader(self.chunks)
+        try:
+            if self.compression == "zstd":
+                source = zstandard.ZstdDecompressor().stream_reader(reader)
+                mode = "r|"
+            else:
+                source = reader
+                mode = "r|gz" if self.compression == "gzip" else "r|"
+            with tarfile.open(fileobj=source, mode=mode) as tar:
+                for member in tar:
+                    # Фильтр 'data' отбрасывает абсолютные пути, выход за пределы каталога и спецфайлы
+                    try:
+                        if hasattr(tarfile, "data_filter"):
+                            tar.extract(member, self.dest_dir, filter="data")
+                        elif not (member.name.startswith("/") or ".." in member.name.split("/")):
+                            tar.extract(member, self.dest_dir)
+                        else:
+                            raise tarfile.ExtractError(f"небезопасный путь {member.name}")
+                    except MEMBER_ERRORS as e:
+                        print(f"⚠️  Элемент архива '{member.name}' пропущен: {e}")
+                        self.skipped.append(member.name)
+        except Exception as e:
+            self.error = e
+            # Дочитываем поток, чтобы не блокировать запись
+            while not reader.eof:
+                reader.read(1024 * 1024)
+
+    def tell(self):
+        return self.written
+
+    def seek(self, offset):
+        if offset != self.written:
+            raise OSError("Архив распаковывается потоково и не поддерживает произвольное смещение")
+
+    def write(self, data):
+        self.chunks.put(bytes(data))
+        self.written += len(data)
+
+    def flush(self):
+        pass
+
+    def truncate(self, size):
+        if size != self.written:
+            raise OSError("Архив распаковывается потоково и не поддерживает усечение")
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.chunks.put(None)
+        self.thread.join()
@@ -0,0 +1,53 @@
+# astra_monitor_server/server/task_scheduler.py
+
+import asyncio
+import time
+import uuid
+
+from .events import Signal
+
+
+class TaskScheduler:
+    """
+    Отложенные команды клиентам. Таймеры живут в event loop сервера, поэтому задачи
+    выполняются и без GUI (headless-режим). schedule() и cancel() можно вызывать из любого потока.
+    """
+
+    def __init__(self, ws_server):
+        self.ws_server = ws_server
+        self.tasks = {} # task_id -> {'command', 'clients', 'run_at', 'run', 'handle'}
+        self.task_fired = Signal() # (task_id) - команды задачи отправлены клиентам
+
+    def schedule(self, command, client_ids, delay, run=None):
+        """
+        Через delay секунд отправляет command всем client_ids. Возвращает ID задачи.
+        run(client_ids) - корутина, которая выполняет задачу вместо простой отправки команды
+        (например, массовое выполнение со сводкой результатов, см. FanoutCommand).
+        """
+        task_id = uuid.uuid4().hex
+        task = {'command': command, 'clients': list(client_ids), 'run_at': time.time() + delay, 'run': run, 'handle': None}
+        self.ws_server.loop.call_soon_threadsafe(self._arm, task_id, task, delay)
+        return task_id
+
+    def cancel(self, task_id):
+        self.ws_server.loop.call_soon_threadsafe(self._cancel, task_id)
+
+    def _arm(self, task_id, task, delay):
+        task['handle'] = self.ws_server.loop.call_later(delay, self._fire, task_id)
+        self.tasks[task_id] = task
+
+    def _cancel(self, task_id):
+        task = self.tasks.pop(task_id, None)
+        if task and task['handle']:
+            task['handle'].cancel()
+
+    def _fire(self, task_id):
+        task = self.tasks.pop(task_id, None)
+        if task is None:
+            return
+        if task['run'] is not None:
+            asyncio.ensure_future(task['run'](task['clients']))
+        else:
+            for client_id in task['clients']:
+                asyncio.ensure_future(self.ws_server.send_command(client_id, task['command']))
+        self.task_fired.emit(task_id)
@@ -5,27 +5,65 @@ import json
 import os
 import base64
 import websockets
-from PyQt5.QtCore import QObject, pyqtSignal
 import uuid
 import hashlib
 
 # Используем относительный импорт для доступа к config.py
 from ..config_loader import APP_CONFIG
+from .transfer_frames import BINARY_FRAMES_CAPABILITY, new_transfer_id, pack_frame, unpack_frame
+from .outbox import ClientOutbox
+from .protocol import (RETRY_AFTER_CLOSE_CODE, SESSION_RESUME_CAPABILITY, INVENTORY_PUSH_CAPABILITY,
+                       message_type, retry_after_reason)
+from .admission import AdmissionControl
+from .sessions import SessionStore
+from .events import Signal
+from .task_scheduler import TaskScheduler
+from .message_router import MessageRouter
+from .inventory import InventoryStore
+from .ws_compression import CompressionPolicy, SelectiveDeflateFactory
+from .delta_sync import DELTA_SYNC_CAPABILITY, choose_block_size, compute_delta, delta_executor, delta_worthwhile
 
-class WebSocketServer(QObject):
-    new_message = pyqtSignal(dict)
-    new_connection = pyqtSignal(str)
-    connection_lost = pyqtSignal(str)
-    
-    def __init__(self, host, port, max_size=100 * 1024 * 1024):
-        super().__init__()
+# Ответ клиента на upload_resume: файл уже принят целиком (потерялся только итог upload_end)
+UPLOAD_COMPLETED = "completed"
+
+class WebSocketServer:
+    """
+    Ядро сервера на asyncio без зависимости от Qt: соединения, маршрутизация сообщений,
+    история метрик, передачи файлов и отложенные задачи. Потребители (GUI, headless-режим)
+    подписываются на сигналы; обработчики вызываются в потоке event loop сервера.
+    """
+
+    def __init__(self, host, port, max_size=100 * 1024 * 1024, reuse_port=False):
+        self.messages_ready = Signal() # (list) пачка сообщений клиентов, подготовленная MessageRouter
+        self.new_connection = Signal() # (str) JSON с client_id и client_info
+        self.connection_lost = Signal() # (str) client_id
+        self.started = Signal() # () сервер слушает порт, обработчики вызываются в потоке event loop
         self.host = host
         self.port = port
         self.clients = {}
+        self.outboxes = {} # client_id -> ClientOutbox, единственный путь записи в сокет клиента
         self.pending_acks = {}
+        self.pending_responses = {} # command_id -> (client_id, Future с ответом, emit)
+        self.router = MessageRouter(self.messages_ready.emit)
+        self.client_capabilities = {}
+        self.transfer_sinks = {} # transfer_id -> функция записи (offset, data) для входящих бинарных кадров
+        self.transfer_waiters = {} # (client_id, transfer_id) -> Future с ответом клиента (смещение, сигнатура)
+        self.legacy_upload_locks = {} # client_id -> asyncio.Lock для клиентов без бинарных кадров
+        self.upload_errors = {} # (client_id, transfer_id) -> первая ошибка клиента по идущей загрузке (None, пока ошибок нет)
+        self.resume_timeout = APP_CONFIG.get('TRANSFER_RESUME_TIMEOUT', 300)
+        # Лавина переподключений после перезапуска сервера принимается постепенно
+        self.admission = AdmissionControl(
+            APP_CONFIG.get('ADMISSION_RATE', 20),
+            APP_CONFIG.get('ADMISSION_BURST', 50),
+            APP_CONFIG.get('ADMISSION_MAX_RETRY_AFTER', 120)
+        )
+        self.sessions = SessionStore(APP_CONFIG.get('SESSION_RESUME_TIMEOUT', 300))
+        self.tasks = TaskScheduler(self)
+        self.inventory = InventoryStore(self) # инвентаризация клиентов, обновляемая разностями
         self.server = None
         self.loop = None
         self.max_size = max_size
+        self.reuse_port = reuse_port # SO_REUSEPORT: порт делят процессы-шарды (см. sharding.py)
         
     def start_server(self):
         self.loop = asyncio.new_event_loop()
@@ -35,10 +73,16 @@ class WebSocketServer(QObject):
             self.server = await websockets.serve(
                 self.handler, self.host, self.port,
                 max_size=self.max_size,
+                # permessage-deflate с выборочным сжатием: крупный JSON сжимается, бинарные кадры и мелкие сообщения - нет
+                extensions=[SelectiveDeflateFactory(CompressionPolicy(APP_CONFIG.get('WS_COMPRESSION_MIN_SIZE', 1024)))],
+                # High-water mark буфера транспорта: выше него писатель очереди клиента ждет опустошения
+                write_limit=APP_CONFIG.get('WS_WRITE_LIMIT', 64 * 1024),
                 ping_interval=30,      # Отправлять пинг каждые 30 секунд
-                ping_timeout=60        # Ожидать понг в течение 60 секунд
+                ping_timeout=60,       # Ожидать понг в течение 60 секунд
+                reuse_port=self.reuse_port or None
             )
             print(f"Server started on ws://{self.host}:{self.port} with max_size={self.max_size / 1024 / 1024:.0f}MB")
+            self.started.emit()
 
         self.loop.run_until_complete(_start_server())
         self.loop.run_forever()
@@ -47,6 +91,12 @@ class WebSocketServer(QObject):
         client_ip = websocket.remote_address[0]
         client_port = websocket.remote_address[1]
         client_id = f"{client_ip}:{client_port}"
+
+        retry_after = self.admission.admit()
+        if retry_after:
+            # До аутентификации: отклоненный клиент не стоит серверу ни auth, ни get_settings, ни строки в GUI
+            await websocket.close(code=RETRY_AFTER_CLOSE_CODE, reason=retry_after_reason(retry_after))
+            return
         
         try:
             # Ждем аутентификации в течение 10 секунд
@@ -87,22 +137,34 @@ class WebSocketServer(QObject):
                 await old_ws.close(code=4000, reason="Replaced by new connection")
 
             self.clients[client_id] = websocket
+            self.outboxes[client_id] = ClientOutbox(websocket, APP_CONFIG.get('OUTBOX_MAX_BYTES', 16 * 1024 * 1024))
+            self.client_capabilities[client_id] = set(data.get('capabilities') or [])
+            resumed = False
+            if SESSION_RESUME_CAPABILITY in self.client_capabilities[client_id]:
+                resumed = await self._start_session(client_id, data, client_info)
+            if INVENTORY_PUSH_CAPABILITY in self.client_capabilities[client_id]:
+                self.inventory.on_connect(client_id, data.get('inventory_version'))
             # Отправляем ID и информацию о клиенте для немедленного отображения
             self.new_connection.emit(json.dumps({
                 'client_id': client_id,
                 'client_info': client_info,
                 'client_ip': client_ip,
-                'client_port': client_port
+                'client_port': client_port,
+                'resumed': resumed
             }))
             
             # Основной цикл обработки сообщений
             async for message in websocket:
+                if isinstance(message, bytes):
+                    await self._handle_binary_frame(client_id, message)
+                    continue
                 try:
                     # Выполняем парсинг JSON в отдельном потоке, чтобы не блокировать event loop
                     # при обработке очень больших сообщений (например, чанков файлов).
                     data = await self.loop.run_in_executor(None, json.loads, message)
                     data['client_id'] = client_id
                     data['client_ip'] = client_ip
+                    data['type'] = message_type(data)
                     if 'command_ack' in data:
                         command_id = data.get('command_ack')
                         event = self.pending_acks.get(command_id)
@@ -110,37 +172,213 @@ class WebSocketServer(QObject):
                             event.set()
                             self.pending_acks.pop(command_id, None)
                         continue
-                    self.new_message.emit(data)
+                    reply = data.get('transfer_offset') or data.get('transfer_signature')
+                    if reply:
+                        self._resolve_transfer_reply(client_id, reply)
+                        continue
+                    if data.get('file_upload_result') == 'error':
+                        self._record_upload_error(client_id, data)
+                    if not self._track_inventory(client_id, data):
+                        continue
+                    if not self._resolve_response(client_id, data):
+                        continue
+                    self.router.route(data)
                 except json.JSONDecodeError:
-                    error_msg = {"error": "Invalid JSON", "message": message, "client_id": client_id}
-                    self.new_message.emit(error_msg)
+                    error_msg = {"type": "error", "error": "Invalid JSON", "message": message, "client_id": client_id}
+                    self.router.route(error_msg)
                     
         except websockets.exceptions.ConnectionClosed:
             print(f"Соединение закрыто: {client_id}")
         except Exception as e:
             print(f"⚠️  Ошибка обработчика: {client_id} - {e}")
         finally:
-            if client_id in self.clients:
+            # Соединение могло быть уже заменено новым - удаляем только свои записи
+            if self.clients.get(client_id) is websocket:
                 del self.clients[client_id]
+            outbox = self.outboxes.get(client_id)
+            if outbox and outbox.websocket is websocket:
+                del self.outboxes[client_id]
+                await outbox.close()
+                self._fail_responses(client_id)
+                self.sessions.detach(client_id)
             self.connection_lost.emit(client_id)
             
+    async def _start_session(self, client_id, data, client_info):
+        """
+        Выдает клиенту новый токен сессии. Если клиент предъявил действующий токен, сессия
+        продолжается: GUI сохраняет запись клиента, а настройки запрашиваются, только если
+        их хэш изменился. Возвращает True для продолженной сессии.
+        """
+        settings_hash = data.get('settings_hash')
+        session = self.sessions.resume(data.get('resume_token'), client_id)
+        resumed = session is not None
+        settings_required = 'settings' not in client_info and not (resumed and session['settings_hash'] == settings_hash)
+        token = self.sessions.open(client_id, settings_hash)
+        await self.send_raw(client_id, json.dumps({
+            "type": "session",
+            "session_token": token,
+            "resumed": resumed,
+            "settings_required": settings_required
+        }))
+        if resumed:
+            print(f"🔁 Сессия продолжена: {client_id}")
+        return resumed
+
+    async def _handle_binary_frame(self, client_id, message):
+        """Передает бинарный кадр зарегистрированному получателю передачи."""
+        try:
+            transfer_id, offset, payload = unpack_frame(message)
+        except ValueError as e:
+            print(f"⚠️  Некорректный бинарный кадр от {client_id}: {e}")
+            return
+        sink = self.transfer_sinks.get(transfer_id)
+        if sink is None:
+            print(f"⚠️  Бинарный кадр для неизвестной передачи {transfer_id} от {client_id}")
+            return
+        # Запись выполняется в пуле потоков, но дожидаемся ее до чтения следующего
+        # сообщения: так сохраняется порядок чанков и появляется естественный backpressure.
+        try:
+            await self.loop.run_in_executor(None, sink, offset, payload)
+        except Exception as e:
+            print(f"⚠️  Ошибка записи бинарного кадра {transfer_id}: {e}")
+
+    def _track_inventory(self, client_id, data):
+        """
+        Обновляет InventoryStore по полному снимку или разности инвентаризации.
+        Возвращает False, если сообщение не нужно передавать дальше.
+        """
+        if 'inventory_delta' in data:
+            merged = self.inventory.apply_delta(client_id, data['inventory_delta'])
+            if merged is None:
+                return False
+            data['inventory'] = merged
+        elif 'full_system_info' in data and 'inventory_version' in data:
+            self.inventory.apply_full(client_id, data['full_system_info'], data['inventory_version'])
+        return True
+
+    def _resolve_response(self, client_id, data):
+        """
+        Передает ответ ожидающему request() по command_id.
+        Возвращает False, если ответ не нужно передавать в GUI.
+        """
+        job = data.get('job_started') or data.get('job_output')
+        if isinstance(job, dict):
+            # Ход задания клиента (job_id = command_id запроса) скрывается вместе с его итогом при emit=False
+            pending = self.pending_responses.get(job.get('job_id'))
+            return not (pending and pending[0] == client_id and not pending[2])
+        pending = self.pending_responses.get(data.get('command_id'))
+        if not pending or pending[0] != client_id:
+            return True
+        self.pending_responses.pop(data['command_id'], None)
+        _, future, emit = pending
+        if not future.done():
+            future.set_result(data)
+        return emit
+
+    def _fail_responses(self, client_id):
+        for command_id, (pending_client_id, future, _) in list(self.pending_responses.items()):
+            if pending_client_id == client_id:
+                self.pending_responses.pop(command_id, None)
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Клиент {client_id} отключился"))
+
+    def _resolve_transfer_reply(self, client_id, info):
+        waiter = self.transfer_waiters.pop((client_id, info.get('transfer_id')), None)
+        if waiter and not waiter.done():
+            waiter.set_result(info)
+
+    async def _request_transfer_reply(self, client_id, transfer_id, command, timeout):
+        """Отправляет команду передачи и ждет ответа клиента по transfer_id. None при ошибке или таймауте."""
+        waiter = self.loop.create_future()
+        self.transfer_waiters[(client_id, transfer_id)] = waiter
+        try:
+            if not await self.send_command(client_id, command):
+                return None
+            return await asyncio.wait_for(waiter, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.transfer_waiters.pop((client_id, transfer_id), None)
+
+    def _record_upload_error(self, client_id, data):
+        key = (client_id, data.get('transfer_id'))
+        if key in self.upload_errors and self.upload_errors[key] is None:
+            self.upload_errors[key] = data.get('error') or "Неизвестная ошибка клиента"
+
+    def client_supports(self, client_id, capability):
+        return capability in self.client_capabilities.get(client_id, ())
+
+    def register_transfer_sink(self, transfer_id, sink):
+        self.transfer_sinks[transfer_id] = sink
+
+    def unregister_transfer_sink(self, transfer_id):
+        self.transfer_sinks.pop(transfer_id, None)
+
     def stop_server(self):
         if self.loop and self.loop.is_running():
             self.loop.call_soon_threadsafe(self.loop.stop)
             
-    async def send_command(self, client_id, command, expect_ack=False, ack_timeout=5, retries=0):
+    async def send_raw(self, client_id, message, coalesce_key=None):
+        """
+        Отправляет готовое сообщение через очередь клиента и ждет его записи в сокет.
+        Если очередь заполнена, ожидание и есть backpressure для отправителя.
+        """
+        outbox = self.outboxes.get(client_id)
+        if outbox is None:
+            return False
+        await outbox.send(message, coalesce_key)
+        return True
+
+    async def request(self, client_id, command, timeout=30, emit=True, command_id=None):
+        """
+        Отправляет команду и возвращает ответ клиента на нее (сопоставляется по command_id).
+        Подходит для команд с одним ответом (refresh, get_full_system_info, list_files и т.п.).
+        Исключения: ConnectionError - клиент не подключен или отключился,
+        asyncio.TimeoutError - ответа нет за timeout секунд; отмена корутины снимает ожидание.
+        emit=False - ответ не передается в GUI (нужен только вызывающему).
+        command_id можно задать заранее, чтобы ссылаться на команду (например, отменять задание клиента).
+        """
+        command_id = command_id or uuid.uuid4().hex
+        future = self.loop.create_future()
+        self.pending_responses[command_id] = (client_id, future, emit)
+        try:
+            payload = {"command": command, "command_id": command_id}
+            if not await self.send_raw(client_id, json.dumps(payload)):
+                raise ConnectionError(f"Клиент {client_id} не подключен")
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            self.pending_responses.pop(command_id, None)
+
+    async def request_many(self, client_ids, command, timeout=30, emit=True):
+        """Одна команда многим клиентам параллельно. Возвращает {client_id: ответ или исключение}."""
+        client_ids = list(client_ids)
+        results = await asyncio.gather(
+            *(self.request(client_id, command, timeout=timeout, emit=emit) for client_id in client_ids),
+            return_exceptions=True)
+        return dict(zip(client_ids, results))
+
+    def get_outbound_depth(self, client_id):
+        """Глубина исходящей очереди клиента (см. ClientOutbox.depth) или None, если клиент не подключен."""
+        outbox = self.outboxes.get(client_id)
+        return outbox.depth() if outbox else None
+
+    async def send_command(self, client_id, command, expect_ack=False, ack_timeout=5, retries=0, coalesce=False):
+        """
+        Отправляет команду клиенту. coalesce=True для повторяемых запросов (например, скриншотов):
+        пока такая же команда ждет в очереди клиента, новая не добавляется.
+        """
         if client_id in self.clients:
             try:
                 command_id = uuid.uuid4().hex
                 payload = {"command": command, "command_id": command_id}
                 if not expect_ack:
-                    await self.clients[client_id].send(json.dumps(payload))
-                    return True
+                    return await self.send_raw(client_id, json.dumps(payload), command if coalesce else None)
 
                 event = asyncio.Event()
                 self.pending_acks[command_id] = event
                 for attempt in range(retries + 1):
-                    await self.clients[client_id].send(json.dumps(payload))
+                    if not await self.send_raw(client_id, json.dumps(payload)):
+                        break
                     try:
                         await asyncio.wait_for(event.wait(), timeout=ack_timeout)
                         return True
@@ -155,29 +393,324 @@ class WebSocketServer(QObject):
                 return False
         return False
 
-    async def upload_file_to_client(self, client_id, local_path, remote_path):
+    async def send_binary_frame(self, client_id, transfer_id, offset, data):
+        """
+        Отправляет клиенту чанк файла бинарным кадром. False - кадр не отправлен; решение
+        (ждать переподключения или прервать передачу) принимает вызывающий. Об обрыве
+        соединения сообщает handler, отмена корутины передается дальше.
+        """
+        if client_id not in self.clients:
+            return False
+        try:
+            return await self.send_raw(client_id, pack_frame(transfer_id, offset, data))
+        except Exception as e:
+            print(f"⚠️  Кадр передачи {transfer_id} не отправлен {client_id}: {e}")
+            return False
+
+    async def upload_file_to_client(self, client_id, local_path, remote_path, chunk_size=4 * 1024 * 1024, progress_callback=None, transfer_id=None):
+        """
+        Загружает файл на клиент по частям. Если клиент поддерживает бинарные кадры,
+        чанки отправляются без base64/JSON, а при обрыве соединения загрузка продолжается
+        с подтвержденного клиентом смещения после его переподключения.
+        progress_callback(sent_bytes, total_bytes) вызывается в потоке event loop.
+        Несколько загрузок на один клиент выполняются параллельно, каждая со своим transfer_id.
+        """
         if client_id not in self.clients:
             return False
+        if not self.client_supports(client_id, BINARY_FRAMES_CAPABILITY):
+            # Прежний протокол не различает передачи, поэтому загрузки выполняются по очереди
+            lock = self.legacy_upload_locks.setdefault(client_id, asyncio.Lock())
+            async with lock:
+                return await self._upload_file_legacy(client_id, local_path, remote_path, chunk_size, progress_callback)
+
+        transfer_id = transfer_id or new_transfer_id()
+        try:
+            delta_result = await self._upload_file_delta(client_id, local_path, remote_path, transfer_id, progress_callback)
+            if delta_result is not None:
+                return delta_result
+
+            file_size = os.path.getsize(local_path)
+            start_command = f"transfer:upload_start:{json.dumps({'transfer_id': transfer_id, 'path': remote_path, 'size': file_size})}"
+            error = await self.start_upload(client_id, transfer_id, start_command)
+            if error is not None:
+                print(f"Загрузка {remote_path} на {client_id} не начата: {error}")
+                return False
+
+            hasher = hashlib.sha256()
+            offset = 0
+            with open(local_path, 'rb') as f:
+                while True:
+                    while offset < file_size:
+                        if self.upload_errors.get((client_id, transfer_id)):
+                            # Клиент отказался принимать данные - остальные кадры отправлять бессмысленно
+                            print(f"Загрузка {remote_path} на {client_id} прервана: {self.upload_errors[(client_id, transfer_id)]}")
+                            return False
+                        websocket = self.clients.get(client_id)
+                        chunk = await self.loop.run_in_executor(None, f.read, chunk_size)
+                        if not chunk:
+                            break
+                        if not await self.send_binary_frame(client_id, transfer_id, offset, chunk):
+                            offset = await self._resume_upload(client_id, websocket, transfer_id, start_command)
+                            if offset is None:
+                                return False
+                            if offset == UPLOAD_COMPLETED:
+                                return True
+                            hasher = await self.loop.run_in_executor(None, self._hash_prefix, f, offset)
+                            continue
+                        hasher.update(chunk)
+                        offset += len(chunk)
+                        progress_callback = self._report_progress(progress_callback, offset, file_size)
+
+                    websocket = self.clients.get(client_id)
+                    end_params = {"transfer_id": transfer_id, "sha256": hasher.hexdigest()}
+                    try:
+                        error = await self.finish_upload(client_id, transfer_id, f"transfer:upload_end:{json.dumps(end_params)}")
+                    except (ConnectionError, asyncio.TimeoutError):
+                        # Итог неизвестен: после переподключения клиент сообщит, что принял
+                        offset = await self._resume_upload(client_id, websocket, transfer_id, start_command)
+                        if offset is None:
+                            return False
+                        if offset == UPLOAD_COMPLETED:
+                            return True
+                        hasher = await self.loop.run_in_executor(None, self._hash_prefix, f, offset)
+                        continue
+                    if error is not None:
+                        print(f"Загрузка {remote_path} на {client_id} не удалась: {error}")
+                        return False
+                    return True
+        except asyncio.CancelledError:
+            cancel_params = {"transfer_id": transfer_id, "path": remote_path}
+            await self.send_command(client_id, f"transfer:upload_cancel:{json.dumps(cancel_params)}")
+            raise
+        except Exception as e:
+            print(f"Error uploading file: {e}")
+            return False
+        finally:
+            self.upload_errors.pop((client_id, transfer_id), None)
+
+    async def start_upload(self, client_id, transfer_id, start_command, timeout=30):
+        """
+        Начинает загрузку бинарными кадрами и ждет, пока клиент откроет файл. С этого момента
+        первая ошибка клиента по передаче попадает в upload_errors (запись удаляет вызывающий).
+        Возвращает None, если клиент готов принимать кадры, иначе текст ошибки.
+        """
+        try:
+            reply = await self.request(client_id, start_command, timeout=timeout, emit=False)
+        except ConnectionError:
+            return "Клиент не подключен"
+        except asyncio.TimeoutError:
+            return "Клиент не ответил на начало передачи"
+        if reply.get('file_upload_result') != 'started':
+            # Ошибка открытия файла показывается в GUI, как и остальные ошибки передачи
+            self.router.route(reply)
+            return reply.get('error') or "Клиент не начал прием файла"
+        self.upload_errors[(client_id, transfer_id)] = None
+        return None
+
+    async def finish_upload(self, client_id, transfer_id, end_command, timeout=300):
+        """
+        Завершает загрузку и ждет file_upload_result - итог проверки размера и SHA-256 на клиенте.
+        Возвращает None при успехе или текст ошибки (первую ошибку клиента по передаче).
+        Если ответа нет, исключения request() (ConnectionError, asyncio.TimeoutError) передаются
+        вызывающему: итог передачи неизвестен.
+        """
+        reply = await self.request(client_id, end_command, timeout=timeout)
+        if reply.get('file_upload_result') == 'success':
+            return None
+        return self.upload_errors.get((client_id, transfer_id)) or reply.get('error') or "Клиент не подтвердил загрузку"
+
+    async def _upload_file_legacy(self, client_id, local_path, remote_path, chunk_size, progress_callback):
+        """Загрузка прежним протоколом (base64 в JSON) для клиентов без бинарных кадров."""
         try:
             file_size = os.path.getsize(local_path)
             await self.send_command(client_id, f"upload_file_start:{remote_path}:{file_size}")
 
             hasher = hashlib.sha256()
+            sent_bytes = 0
             with open(local_path, 'rb') as f:
                 while True:
-                    chunk = f.read(4 * 1024 * 1024) # 4MB chunks
+                    chunk = await self.loop.run_in_executor(None, f.read, chunk_size)
                     if not chunk:
                         break
                     hasher.update(chunk)
                     chunk_b64 = base64.b64encode(chunk).decode('ascii')
-                    await self.send_command(client_id, f"upload_file_chunk:{chunk_b64}")
-            
+                    if not await self.send_command(client_id, f"upload_file_chunk:{chunk_b64}"):
+                        return False
+                    sent_bytes += len(chunk)
+                    progress_callback = self._report_progress(progress_callback, sent_bytes, file_size)
+
             await self.send_command(client_id, f"upload_file_end:{hasher.hexdigest()}")
             return True
+        except asyncio.CancelledError:
+            await self.send_command(client_id, f"cancel_upload:{remote_path}")
+            raise
         except Exception as e:
             print(f"Error uploading file: {e}")
             return False
-            
+
+    @staticmethod
+    def _report_progress(progress_callback, sent_bytes, total_bytes):
+        """Вызывает progress_callback; возвращает None, если получатель прогресса уже уничтожен."""
+        if progress_callback is None:
+            return None
+        try:
+            progress_callback(sent_bytes, total_bytes)
+            return progress_callback
+        except RuntimeError:
+            # Виджет мог быть закрыт (например, вкладка клиента при отключении), передача продолжается
+            return None
+
+    @staticmethod
+    def _hash_prefix(f, offset):
+        """Пересчитывает SHA-256 первых offset байт файла и оставляет позицию на offset."""
+        hasher = hashlib.sha256()
+        f.seek(0)
+        remaining = offset
+        while remaining > 0:
+            block = f.read(min(remaining, 4 * 1024 * 1024))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+        f.seek(offset)
+        return hasher
+
+    async def wait_for_reconnect(self, client_id, old_websocket, timeout):
+        """Ждет нового соединения клиента (отличного от old_websocket). Возвращает True при успехе."""
+        deadline = self.loop.time() + timeout
+        while self.loop.time() < deadline:
+            websocket = self.clients.get(client_id)
+            if websocket is not None and websocket is not old_websocket:
+                return True
+            await asyncio.sleep(1)
+        return False
+
+    async def query_transfer_offset(self, client_id, transfer_id, timeout=15):
+        """
+        Запрашивает у клиента смещение, до которого он принял загрузку.
+        Возвращает смещение, None если передачу нужно начать заново (клиент не знает о ней
+        или принимал ее разностью), UPLOAD_COMPLETED если файл уже принят, или -1 при ошибке.
+        """
+        command = f"transfer:upload_resume:{json.dumps({'transfer_id': transfer_id})}"
+        reply = await self._request_transfer_reply(client_id, transfer_id, command, timeout)
+        if reply is None:
+            return -1
+        if reply.get('completed'):
+            return UPLOAD_COMPLETED
+        return reply.get('offset')
+
+    async def request_signature(self, client_id, transfer_id, remote_path, block_size, timeout=120):
+        """Запрашивает контрольные суммы блоков файла на клиенте. None, если файла нет."""
+        params = {"transfer_id": transfer_id, "path": remote_path, "block_size": block_size}
+        reply = await self._request_transfer_reply(client_id, transfer_id, f"transfer:upload_signature:{json.dumps(params)}", timeout)
+        if reply is None or reply.get('block_size') != block_size:
+            return None
+        return reply.get('blocks')
+
+    async def send_delta_plan(self, client_id, transfer_id, local_path, remote_path, plan, block_size, progress_callback=None):
+        """
+        Передает файл разностью по плану compute_delta: блоки, которые уже есть у клиента,
+        копируются командами upload_copy, новые данные идут бинарными кадрами по своим смещениям.
+        Итог проверяется клиентом по SHA-256 в upload_end.
+        Возвращает None при успехе или текст ошибки.
+        """
+        start_params = {"transfer_id": transfer_id, "path": remote_path, "size": plan['size'], "block_size": block_size}
+        error = await self.start_upload(client_id, transfer_id, f"transfer:upload_delta_start:{json.dumps(start_params)}")
+        if error is not None:
+            return error
+
+        try:
+            done_bytes = 0
+            copy_batch = []
+            with open(local_path, 'rb') as f:
+                for op in plan['ops']:
+                    if self.upload_errors.get((client_id, transfer_id)):
+                        return self.upload_errors[(client_id, transfer_id)]
+                    if op[0] == 'copy':
+                        _, target_offset, block_index, count = op
+                        copy_batch.append([target_offset, block_index, count])
+                        done_bytes += min(count * block_size, plan['size'] - target_offset)
+                        if len(copy_batch) < 1000:
+                            continue
+                    else:
+                        _, target_offset, length = op
+                        end_offset = target_offset + length
+                        while target_offset < end_offset:
+                            f.seek(target_offset)
+                            chunk = await self.loop.run_in_executor(None, f.read, min(end_offset - target_offset, 4 * 1024 * 1024))
+                            if not chunk or not await self.send_binary_frame(client_id, transfer_id, target_offset, chunk):
+                                return "Клиент отключился"
+                            target_offset += len(chunk)
+                            done_bytes += len(chunk)
+                    if copy_batch:
+                        copy_params = {"transfer_id": transfer_id, "ops": copy_batch}
+                        if not await self.send_command(client_id, f"transfer:upload_copy:{json.dumps(copy_params)}"):
+                            return "Клиент отключился"
+                        copy_batch = []
+                    progress_callback = self._report_progress(progress_callback, done_bytes, plan['size'])
+            if copy_batch:
+                copy_params = {"transfer_id": transfer_id, "ops": copy_batch}
+                if not await self.send_command(client_id, f"transfer:upload_copy:{json.dumps(copy_params)}"):
+                    return "Клиент отключился"
+            self._report_progress(progress_callback, plan['size'], plan['size'])
+
+            end_params = {"transfer_id": transfer_id, "sha256": plan['sha256']}
+            try:
+                return await self.finish_upload(client_id, transfer_id, f"transfer:upload_end:{json.dumps(end_params)}")
+            except ConnectionError:
+                return "Клиент отключился до подтверждения загрузки"
+            except asyncio.TimeoutError:
+                return "Клиент не подтвердил загрузку"
+        finally:
+            self.upload_errors.pop((client_id, transfer_id), None)
+
+    async def _upload_file_delta(self, client_id, local_path, remote_path, transfer_id, progress_callback):
+        """
+        Пытается загрузить файл разностью с уже существующей на клиенте версией.
+        Возвращает True/False как результат передачи или None, если выгоднее отправить файл целиком.
+        """
+        file_size = os.path.getsize(local_path)
+        if not delta_worthwhile(file_size) or not self.client_supports(client_id, DELTA_SYNC_CAPABILITY):
+            return None
+        block_size = choose_block_size(file_size)
+        blocks = await self.request_signature(client_id, transfer_id, remote_path, block_size)
+        if not blocks:
+            return None
+        plan = await self.loop.run_in_executor(delta_executor(), compute_delta, local_path, blocks, block_size)
+        if plan is None:
+            return None
+        print(f"Загрузка {remote_path} на {client_id} разностью: {plan['literal_bytes']} из {file_size} байт.")
+        error = await self.send_delta_plan(client_id, transfer_id, local_path, remote_path, plan, block_size, progress_callback)
+        if error is not None:
+            print(f"Загрузка {remote_path} на {client_id} разностью не удалась: {error}")
+            return False
+        return True
+
+    async def _resume_upload(self, client_id, old_websocket, transfer_id, start_command):
+        """
+        Дожидается переподключения клиента и возвращает смещение, с которого продолжить загрузку,
+        UPLOAD_COMPLETED, если клиент уже принял файл, или None, если продолжить нельзя.
+        """
+        print(f"Передача {transfer_id} на {client_id} прервана, ожидание переподключения...")
+        if not await self.wait_for_reconnect(client_id, old_websocket, self.resume_timeout):
+            print(f"Клиент {client_id} не переподключился, передача {transfer_id} прервана.")
+            return None
+        offset = await self.query_transfer_offset(client_id, transfer_id)
+        if offset == -1:
+            return None
+        if offset == UPLOAD_COMPLETED:
+            print(f"Передача {transfer_id} на {client_id} уже завершена клиентом.")
+            return offset
+        if offset is None:
+            # Клиент потерял частичный файл (например, был перезапущен) - начинаем заново
+            error = await self.start_upload(client_id, transfer_id, start_command)
+            if error is not None:
+                print(f"Передача {transfer_id} на {client_id} не может быть начата заново: {error}")
+                return None
+            offset = 0
+        print(f"Передача {transfer_id} на {client_id} продолжается со смещения {offset}.")
+        return offset
+
     async def client_disconnect(self, client_id):
         if client_id in self.clients:
             try: